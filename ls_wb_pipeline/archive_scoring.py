@@ -0,0 +1,251 @@
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from ls_wb_pipeline.inference import BatchClassifier, preprocess
+from ls_wb_pipeline.model_registry import get_model
+from ls_wb_pipeline import functions, webdav_api
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import settings
+from collections import Counter
+from itertools import islice
+import argparse
+import json
+import time
+import cv2
+import os
+
+CHECKPOINT_FILE = "checkpoint.json"
+COUNT_PREFIX = "count_"  # Колонки с числом кадров каждого класса: count_<класс>
+FFMPEG_OPTIONS_ENV = "OPENCV_FFMPEG_CAPTURE_OPTIONS"  # "ключ;значение|...", OpenCV читает при каждом открытии
+
+_classifier = None  # Модель процесса пула, загружается один раз в initializer
+
+
+def init_worker(model_path, backend, threads):
+    global _classifier
+    loaded = get_model(model_path, backend)
+    _classifier = BatchClassifier(loaded.model, loaded.class_names, threads=threads)
+
+
+def video_source(remote_path, root):
+    """(регистратор, день) по имени видео; для нестандартных имён — по первой папке под root."""
+    try:
+        reg_id, day, _ = functions.parse_video_name(os.path.basename(remote_path))
+        return reg_id, day
+    except ValueError:
+        parts = os.path.relpath(remote_path, root).split("/")
+        return parts[0], None
+
+
+def open_stream(remote_path):
+    """
+    cv2.VideoCapture по URL WebDAV без учётных данных в URL: заголовок авторизации уходит
+    в FFmpeg через переменную окружения процесса, остальные опции из неё сохраняются.
+    """
+    options = [option for option in os.environ.get(FFMPEG_OPTIONS_ENV, "").split("|")
+               if option and not option.startswith("headers;")]
+    options.append(f"headers;{webdav_api.auth_header()}\r\n")
+    os.environ[FFMPEG_OPTIONS_ENV] = "|".join(options)
+    return cv2.VideoCapture(webdav_api.remote_url(remote_path), cv2.CAP_FFMPEG)
+
+
+def timeline_segments(samples, step_sec):
+    """[(сек, класс)] -> [[начало, конец, класс]] — подряд идущие одинаковые метки склеиваются."""
+    segments = []
+    for second, label in samples:
+        if segments and segments[-1][2] == label:
+            segments[-1][1] = round(second + step_sec, 1)
+        else:
+            segments.append([round(second, 1), round(second + step_sec, 1), label])
+    return segments
+
+
+def score_video(remote_path, root=settings.BASE_REMOTE_DIR, sample_seconds=settings.SCORING_SAMPLE_SECONDS):
+    """
+    Читает видео потоком по URL WebDAV (без сохранения на диск), классифицирует кадр
+    раз в sample_seconds и возвращает сводку: число кадров по классам и таймлайн.
+    Выполняется в процессе пула.
+    """
+    started = time.time()
+    registrator, day = video_source(remote_path, root)
+    row = {"video": remote_path, "registrator": registrator, "day": day, "fps": None, "duration_sec": None,
+           "sampled": 0, "dominant": None, "timeline": "[]", "error": None, "counts": {}}
+    cap = open_stream(remote_path)
+    try:
+        if not cap.isOpened():
+            row["error"] = "Не удалось открыть видео"
+            return row
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25
+        step = max(1, int(round(fps * sample_seconds)))
+
+        samples, batch = [], []
+
+        def classify(batch):
+            predictions = _classifier.predict([tensor for _, tensor in batch])
+            return [(second, label) for (second, _), (_, label, _) in zip(batch, predictions)]
+
+        index = 0
+        while True:
+            if index % step == 0:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                batch.append((index / fps, preprocess(frame)))
+                if len(batch) >= _classifier.batch_size:
+                    samples += classify(batch)
+                    batch = []
+            elif not cap.grab():  # Пропускаемые кадры не конвертируем
+                break
+            index += 1
+        if batch:
+            samples += classify(batch)
+
+        counts = Counter(label for _, label in samples)
+        row.update({"fps": fps, "duration_sec": round(index / fps, 1), "sampled": len(samples),
+                    "dominant": counts.most_common(1)[0][0] if counts else None,
+                    "timeline": json.dumps(timeline_segments(samples, step / fps), ensure_ascii=False),
+                    "counts": dict(counts)})
+    except Exception as e:
+        row["error"] = str(e)
+    finally:
+        cap.release()
+        row["seconds"] = round(time.time() - started, 1)
+    return row
+
+
+def load_state(output_dir):
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return {"done": [], "failed": [], "next_part": 0}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(output_dir, state):
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    temp_path = path + ".part"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def write_part(output_dir, number, rows):
+    """Сводки пачки видео -> part-NNNNN.parquet; счётчики классов разворачиваются в колонки count_<класс>."""
+    import pandas as pd
+
+    records = []
+    for row in rows:
+        record = {key: value for key, value in row.items() if key != "counts"}
+        for label, count in row["counts"].items():
+            record[f"{COUNT_PREFIX}{label}"] = count
+        records.append(record)
+    path = os.path.join(output_dir, f"part-{number:05d}.parquet")
+    frame = pd.DataFrame.from_records(records)
+    count_columns = [c for c in frame.columns if c.startswith(COUNT_PREFIX)]
+    frame[count_columns] = frame[count_columns].fillna(0).astype("int32")
+    frame.to_parquet(path + ".part", index=False, engine="pyarrow")
+    os.replace(path + ".part", path)
+    return path
+
+
+def score_archive(root=settings.BASE_REMOTE_DIR, output_dir=settings.SCORING_OUTPUT_DIR,
+                  workers=settings.SCORING_WORKERS, model_path=None, backend=None, limit=None,
+                  sample_seconds=settings.SCORING_SAMPLE_SECONDS, part_size=settings.SCORING_PART_SIZE,
+                  retry_failed=False):
+    """
+    Оценивает архив видео в пуле процессов. Результаты пишутся частями parquet,
+    после каждой части обновляется чекпойнт — перезапуск продолжает с необработанных видео.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state = load_state(output_dir)
+    skip = set(state["done"]) | (set() if retry_failed else set(state["failed"]))
+    videos = (video for video in functions.iter_video_files(root, skip_downloaded=False) if video not in skip)
+    if limit:
+        videos = islice(videos, limit)
+
+    report = {"processed": 0, "failed": 0, "parts": []}
+    rows = []
+
+    def flush():
+        if not rows:
+            return
+        report["parts"].append(write_part(output_dir, state["next_part"], rows))
+        state["next_part"] += 1
+        failed = {row["video"] for row in rows if row["error"]}
+        state["done"].extend(row["video"] for row in rows if not row["error"])
+        state["failed"] = sorted((set(state["failed"]) - {row["video"] for row in rows}) | failed)
+        save_state(output_dir, state)
+        logger.info(f"[SCORING] Часть {report['parts'][-1]}: {len(rows)} видео, всего обработано {report['processed']}")
+        rows.clear()
+
+    def collect(futures):
+        for future in futures:
+            row = future.result()
+            rows.append(row)
+            report["processed"] += 1
+            if row["error"]:
+                report["failed"] += 1
+                logger.warning(f"[SCORING] {row['video']}: {row['error']}")
+            if len(rows) >= part_size:
+                flush()
+
+    threads = max(1, settings.INFERENCE_THREADS // workers)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(model_path, backend, threads)) as pool:
+            in_flight = set()
+            for video in videos:
+                in_flight.add(pool.submit(score_video, video, root, sample_seconds))
+                if len(in_flight) >= workers * 2:  # Не держим в очереди весь архив
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(finished)
+            collect(in_flight)
+    finally:
+        flush()  # Уже посчитанное сохраняется и при падении пула
+    return report
+
+
+def summarize(output_dir=settings.SCORING_OUTPUT_DIR):
+    """Статистика по регистраторам: видео, часы записи и доли состояний контейнера."""
+    import pandas as pd
+
+    parts = sorted(f for f in os.listdir(output_dir) if f.endswith(".parquet")) if os.path.isdir(output_dir) else []
+    if not parts:
+        return []
+    frame = pd.concat([pd.read_parquet(os.path.join(output_dir, f)) for f in parts], ignore_index=True)
+    frame = frame[frame["error"].isna()].drop_duplicates("video", keep="last")
+    count_columns = [c for c in frame.columns if c.startswith(COUNT_PREFIX)]
+    frame[count_columns] = frame[count_columns].fillna(0)
+
+    result = []
+    for registrator, group in frame.groupby("registrator"):
+        counts = group[count_columns].sum()
+        total = counts.sum()
+        result.append({
+            "registrator": registrator,
+            "videos": len(group),
+            "hours": round(group["duration_sec"].sum() / 3600, 2),
+            "sampled": int(group["sampled"].sum()),
+            "classes": {c[len(COUNT_PREFIX):]: {"count": int(counts[c]),
+                                                "share": round(counts[c] / total, 3) if total else 0}
+                        for c in count_columns},
+        })
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Оценка архива видео классификатором")
+    parser.add_argument("--root", default=settings.BASE_REMOTE_DIR)
+    parser.add_argument("--output", default=settings.SCORING_OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=settings.SCORING_WORKERS)
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--sample-seconds", type=float, default=settings.SCORING_SAMPLE_SECONDS)
+    parser.add_argument("--retry-failed", action="store_true")
+    parser.add_argument("--summary", action="store_true", help="Только вывести статистику по регистраторам")
+    args = parser.parse_args()
+
+    if not args.summary:
+        print(score_archive(args.root, args.output, args.workers, args.model, args.backend, args.limit,
+                            args.sample_seconds, retry_failed=args.retry_failed))
+    for item in summarize(args.output):
+        print(json.dumps(item, ensure_ascii=False))
@@ -0,0 +1,285 @@
+from urllib.parse import urlparse, unquote
+from ls_wb_pipeline.labelstudio_api import chunked
+from ls_wb_pipeline.webdav_api import WEBDAV_OPTIONS, remote_url, resolve_remote_paths, server_error, retry_wait
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import jobs, resilience
+from ls_wb_pipeline.settings import *
+from xml.etree import ElementTree
+import asyncio
+import weakref
+import httpx
+import os
+
+PROPFIND_BODY = ('<?xml version="1.0" encoding="utf-8"?>'
+                 '<d:propfind xmlns:d="DAV:"><d:prop><d:resourcetype/></d:prop></d:propfind>')
+# Те же эндпоинты resilience, что и у синхронного webdav_api: общий лимитер и размыкатель
+ENDPOINTS = {"PROPFIND": "webdav:propfind", "GET": "webdav:get", "PUT": "webdav:upload", "DELETE": "webdav:delete"}
+
+
+def http_client(concurrency, **kwargs):
+    """httpx.AsyncClient с пулом keep-alive соединений по числу одновременных запросов."""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        **kwargs)
+
+
+class AsyncLabelStudio:
+    """
+    Асинхронный клиент Label Studio для API-процесса: один пул соединений,
+    таймауты на подключение и запрос, не больше concurrency запросов одновременно.
+    """
+
+    def __init__(self, concurrency=LABELSTUDIO_ASYNC_CONCURRENCY):
+        self.client = http_client(concurrency, base_url=LABELSTUDIO_API_URL, headers=HEADERS,
+                                  timeout=httpx.Timeout(LABELSTUDIO_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT))
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(self, method, url, **kwargs):
+        async with self.semaphore:
+            return await self.client.request(method, url, **kwargs)
+
+    async def get_tasks_page(self, page, page_size):
+        r = await self.request("GET", "/tasks", params={"project": PROJECT_ID, "page": page,
+                                                         "page_size": page_size, "fields": "all"})
+        r.raise_for_status()
+        return r.json()
+
+    async def get_all_tasks(self, page_size=100):
+        """Все задачи проекта: первая страница даёт total, остальные запрашиваются параллельно."""
+        first = await self.get_tasks_page(1, page_size)
+        tasks = list(first.get("tasks", []))
+        total = first.get("total") or 0
+        pages = range(2, (total + page_size - 1) // page_size + 1)
+        for data in await asyncio.gather(*(self.get_tasks_page(page, page_size) for page in pages)):
+            tasks.extend(data.get("tasks", []))
+
+        unique = list({task["id"]: task for task in tasks}.values())
+        logger.info(f"[LS] Получено задач: {len(unique)} из {total}")
+        return unique
+
+    async def delete_task(self, task_id):
+        """Удаляет одну задачу. Возвращает (task_id, удалена ли); 404 — уже удалена."""
+        try:
+            r = await self.request("DELETE", f"/tasks/{task_id}")
+        except httpx.HTTPError as e:
+            logger.error(f"[ERR] Не удалось удалить задачу {task_id}: {e}")
+            return task_id, False
+        if r.status_code in (204, 404):
+            return task_id, True
+        logger.error(f"[ERR] Не удалось удалить задачу {task_id} — {r.status_code}: {r.text}")
+        return task_id, False
+
+    async def bulk_delete_chunk(self, task_ids):
+        """:return: Количество удалённых задач или None, если bulk-эндпоинт недоступен."""
+        r = await self.request("POST", "/dm/actions", params={"id": "delete_tasks", "project": PROJECT_ID},
+                               json={"selectedItems": {"all": False, "included": list(task_ids)}})
+        if r.status_code in (404, 405, 501):
+            logger.warning(f"[LS] Bulk-удаление недоступно ({r.status_code}), переходим на поштучное")
+            return None
+        r.raise_for_status()
+        try:
+            return int(r.json().get("processed_items", len(task_ids)))
+        except ValueError:
+            return len(task_ids)
+
+    async def bulk_delete_tasks(self, task_ids, chunk_size=LABELSTUDIO_DELETE_CHUNK):
+        """То же, что labelstudio_api.bulk_delete_tasks: отчёт {"deleted", "failed", "chunks"}."""
+        report = {"deleted": [], "failed": [], "chunks": []}
+        bulk_available = True
+        for number, chunk in enumerate(chunked(task_ids, chunk_size), start=1):
+            processed = None
+            if bulk_available:
+                try:
+                    processed = await self.bulk_delete_chunk(chunk)
+                    if processed is None:
+                        bulk_available = False
+                except httpx.HTTPError as e:
+                    logger.error(f"[LS] Ошибка bulk-удаления пачки {number}: {e}")
+
+            if processed is not None and processed >= len(chunk):
+                deleted, failed, method = list(chunk), [], "bulk"
+            else:
+                results = await asyncio.gather(*(self.delete_task(task_id) for task_id in chunk))
+                deleted = [task_id for task_id, ok in results if ok]
+                failed = [task_id for task_id, ok in results if not ok]
+                method = "single" if processed is None else "bulk+single"
+
+            report["deleted"].extend(deleted)
+            report["failed"].extend(failed)
+            jobs.progress(tasks=len(deleted))
+            report["chunks"].append({"chunk": number, "size": len(chunk), "deleted": len(deleted),
+                                     "failed": len(failed), "method": method})
+            logger.info(f"[LS] Пачка {number}: удалено {len(deleted)}/{len(chunk)} ({method})")
+        return report
+
+    async def sync_storage(self):
+        r = await self.request("POST", f"/storages/localfiles/{LABELSTUDIO_STORAGE_ID}/sync")
+        if r.status_code == 200:
+            logger.info("Хранилище успешно синхронизовано")
+            return True
+        logger.info(f"Результат синхронизации: {r.text}")
+        return False
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class AsyncWebDAV:
+    """Асинхронные операции с WebDAV: листинг, скачивание, загрузка и удаление с повторами."""
+
+    def __init__(self, concurrency=WEBDAV_ASYNC_CONCURRENCY):
+        self.client = http_client(concurrency,
+                                  auth=(WEBDAV_OPTIONS["webdav_login"] or "", WEBDAV_OPTIONS["webdav_password"] or ""),
+                                  timeout=httpx.Timeout(WEBDAV_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT))
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(self, method, remote_path, attempts=WEBDAV_RETRIES, delay=1.0, jitter=0.5, **kwargs):
+        """
+        Запрос через лимитер и размыкатель эндпоинта с повторами на сетевых ошибках, 5xx и 429.
+        Ответы 4xx возвращаются как есть. Пауза между попытками не держит слот семафора.
+        """
+        endpoint = ENDPOINTS.get(method, f"webdav:{method.lower()}")
+        for attempt in range(1, attempts + 1):
+            try:
+                async with self.semaphore:
+                    r = await resilience.call_async(
+                        endpoint, lambda: self.client.request(method, remote_url(remote_path), **kwargs),
+                        is_failure=server_error)
+                if not server_error(r):
+                    return r
+                error = f"{r.status_code}"
+                if attempt == attempts:
+                    return r
+            except (httpx.HTTPError, resilience.CircuitOpen) as e:
+                if attempt == attempts:
+                    raise
+                error = e
+            wait = retry_wait(error, attempt, delay, jitter)
+            logger.warning(f"[WebDAV:{method.lower()} {remote_path}] Ошибка (попытка {attempt}/{attempts}): {error}. "
+                           f"Повтор через {wait:.1f} сек.")
+            await asyncio.sleep(wait)
+
+    async def list(self, remote_path):
+        """Имена элементов папки, как webdav3 Client.list: папки — с «/» на конце."""
+        r = await self.request("PROPFIND", remote_path, headers={"Depth": "1", "Content-Type": "application/xml"},
+                               content=PROPFIND_BODY)
+        r.raise_for_status()
+        own_path = unquote(urlparse(remote_url(remote_path)).path).rstrip("/")
+        names = []
+        for response in ElementTree.fromstring(r.content).findall("{DAV:}response"):
+            href = unquote(urlparse(response.findtext("{DAV:}href", "")).path).rstrip("/")
+            if href == own_path:
+                continue
+            is_dir = response.find(".//{DAV:}collection") is not None
+            names.append(href.rsplit("/", 1)[-1] + ("/" if is_dir else ""))
+        return names
+
+    async def download(self, remote_path, local_path, attempts=WEBDAV_RETRIES, delay=1.0, jitter=0.5):
+        """
+        То же, что webdav_api.download_remote_file: GET во временный .part с повторами
+        и атомарным переименованием, через тот же эндпоинт "webdav:get".
+
+        :return: "downloaded", "missing" (404) или "failed".
+        """
+        temp_path = local_path + ".part"
+        for attempt in range(1, attempts + 1):
+            try:
+                async with self.semaphore:
+                    request = self.client.build_request("GET", remote_url(remote_path))
+                    r = await resilience.call_async("webdav:get", lambda: self.client.send(request, stream=True),
+                                                    is_failure=server_error)
+                    try:
+                        if r.status_code == 404:
+                            return "missing"
+                        if r.status_code == 200:
+                            with open(temp_path, "wb") as f:
+                                async for chunk in r.aiter_bytes(64 * 1024):
+                                    f.write(chunk)
+                            os.replace(temp_path, local_path)
+                            return "downloaded"
+                    finally:
+                        await r.aclose()
+                if not server_error(r):
+                    logger.error(f"[WebDAV:get {remote_path}] {r.status_code}")
+                    return "failed"
+                error = f"{r.status_code}"
+            except (httpx.HTTPError, resilience.CircuitOpen, OSError) as e:
+                error = e
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if attempt < attempts:
+                wait = retry_wait(error, attempt, delay, jitter)
+                logger.warning(f"[WebDAV:get {remote_path}] Ошибка (попытка {attempt}/{attempts}): {error}. "
+                               f"Повтор через {wait:.1f} сек.")
+                await asyncio.sleep(wait)
+        logger.error(f"[WebDAV:get {remote_path}] Не удалось скачать после {attempts} попыток")
+        return "failed"
+
+    async def upload(self, local_path, remote_path):
+        with open(local_path, "rb") as f:
+            data = f.read()
+        try:
+            r = await self.request("PUT", remote_path, content=data)
+        except (httpx.HTTPError, resilience.CircuitOpen) as e:
+            logger.error(f"[WebDAV:put {remote_path}] {e}")
+            return False
+        if r.status_code not in (200, 201, 204):
+            logger.error(f"[WebDAV:put {remote_path}] {r.status_code}: {r.text[:200]}")
+            return False
+        return True
+
+    async def delete(self, remote_path):
+        """:return: "deleted", "missing" (404) или "failed"."""
+        try:
+            r = await self.request("DELETE", remote_path)
+        except (httpx.HTTPError, resilience.CircuitOpen) as e:
+            logger.error(f"[WebDAV:delete {remote_path}] {e}")
+            return "failed"
+        if r.status_code in (200, 204):
+            return "deleted"
+        if r.status_code == 404:
+            return "missing"
+        logger.error(f"[WebDAV:delete {remote_path}] {r.status_code}: {r.text[:200]}")
+        return "failed"
+
+    async def delete_files(self, files, dry_run=False):
+        """То же, что webdav_api.delete_remote_files: отчёт {"deleted", "deleted_amount", "missing", "failed"}."""
+        report = {"deleted": [], "deleted_amount": 0, "missing": [], "failed": []}
+        resolved = resolve_remote_paths(files, report)
+        if dry_run:
+            for file, remote_path in resolved:
+                logger.info(f"[DRY RUN] Будет удалено: {remote_path}")
+            return report
+
+        async def delete_one(file, remote_path):
+            status = await self.delete(remote_path)
+            report[status].append(file)
+            jobs.progress(files=1)
+
+        await asyncio.gather(*(delete_one(file, remote_path) for file, remote_path in resolved))
+        report["deleted_amount"] = len(report["deleted"])
+        logger.info(f"[WebDAV] Удалено: {report['deleted_amount']}, не найдено: {len(report['missing'])}, "
+                    f"ошибок: {len(report['failed'])}")
+        return report
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+# Клиенты httpx привязаны к циклу событий: у API — свой, у фоновой задачи с asyncio.run — свой
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_clients():
+    """(AsyncLabelStudio, AsyncWebDAV) для текущего цикла событий; создаются при первом обращении."""
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        _clients[loop] = (AsyncLabelStudio(), AsyncWebDAV())
+    return _clients[loop]
+
+
+async def close_clients():
+    clients = _clients.pop(asyncio.get_running_loop(), None)
+    if clients:
+        for client in clients:
+            await client.aclose()
@@ -1,77 +1,26 @@
-from sklearn.model_selection import train_test_split
+from ls_wb_pipeline.dataset_manifest import DatasetManifest
+from ls_wb_pipeline.dataset_engine import build_dataset
 from ls_wb_pipeline import settings
-from urllib.parse import unquote
-from collections import Counter
 import argparse
 import json
-import shutil
 import os
 
 # ==== НАСТРОЙКИ (можно менять внутри скрипта) ====
 
-def main_from_tasks(all_tasks, train_ratio=0.8, test_ratio=0.1, val_ratio=0.1):
-    # Загрузка уже размеченных изображений по .txt
-    existing_labels = set()
-    for split in ("train", "val", "test"):
-        label_dir = os.path.join(settings.DATASET_PATH, "labels", split)
-        if os.path.exists(label_dir):
-            for fname in os.listdir(label_dir):
-                if fname.lower().endswith(".txt"):
-                    image_name = fname.replace(".txt", ".jpg")
-                    existing_labels.add(image_name)
-
-    existing_images = set()
-    for split in ("train", "val", "test"):
-        img_dir = os.path.join(settings.DATASET_PATH, "images", split)
-        if os.path.exists(img_dir):
-            for fname in os.listdir(img_dir):
-                if fname.lower().endswith(".jpg"):
-                    existing_images.add(fname)
-
-    entries = []
-    class_names = set()
-    full_summary = Counter()
-
-    # Первый проход — для полной статистики
-    for task in all_tasks:
-        anns = task.get("annotations")
-        if not anns or not isinstance(anns, list):
-            continue
-        first_ann = anns[0]
-        results = first_ann.get("result", [])
-        if not results:
-            continue
-        try:
-            class_name = results[0]["value"]["choices"][0]
-            full_summary[class_name] += 1
-        except Exception:
-            continue
-
-    # Второй проход — для новых изображений
-    for task in all_tasks:
-        anns = task.get("annotations")
-        if not anns or not isinstance(anns, list):
-            continue
-        first_ann = anns[0]
-        results = first_ann.get("result", [])
-        if not results:
-            continue
-        try:
-            class_name = results[0]["value"]["choices"][0]
-            image_url = task["data"]["image"]
-            image_name = os.path.basename(unquote(image_url))
-            if image_name in existing_images or image_name in existing_labels:
-                continue  # ❗️ Пропускаем уже размеченные
-
-            class_names.add(class_name)
-            entries.append({
-                "image": image_name,
-                "class": class_name
-            })
-        except Exception:
-            continue
+def main_from_tasks(all_tasks, train_ratio=0.8, test_ratio=0.1, val_ratio=0.1,
+                    copy_workers=settings.DATASET_COPY_WORKERS, copy_source=settings.DATASET_COPY_SOURCE,
+                    with_cls=False):
+    """
+    YOLO-датасет через общий движок сборки: задачи разбираются один раз, класс берётся
+    из последней валидной аннотации. С with_cls за тот же проход собирается и
+    классификационная раскладка.
+    """
+    layouts = ("yolo", "cls") if with_cls else ("yolo",)
+    report = build_dataset(all_tasks, layouts=layouts, train_ratio=train_ratio, test_ratio=test_ratio,
+                           val_ratio=val_ratio, copy_workers=copy_workers, copy_source=copy_source)
 
     # Распределение классов в JSON
+    full_summary = report["summary"]
     print(f"\nРаспределение классов в заданном JSON:")
     total_full = sum(full_summary.values())
     for cls in sorted(full_summary.keys()):
@@ -79,69 +28,12 @@ def main_from_tasks(all_tasks, train_ratio=0.8, test_ratio=0.1, val_ratio=0.1):
         percent = (count / total_full) * 100 if total_full else 0
         print(f"{cls:25} — {count:3} изображений ({percent:.1f}%)")
 
-    if not entries:
+    if not report["writers"]["yolo"]["stats"]:
         print("Не найдено новых изображений для добавления.")
         return
 
-
-    if not entries:
-        print("Не найдено валидных размеченных задач.")
-        return
-
-    # Загрузка уже существующих классов (если есть)
-    existing_classes = []
-    classes_path = os.path.join(settings.DATASET_PATH, "classes.txt")
-
-    if os.path.exists(classes_path):
-        with open(classes_path, "r", encoding="utf-8") as f:
-            existing_classes = [line.strip() for line in f if line.strip()]
-
-    # Объединяем старые и новые классы, убираем дубли
-    all_classes = list(dict.fromkeys(existing_classes + sorted(class_names)))  # сохраняем порядок
-
-    # Гарантируем, что OUTPUT_DIR существует
-    os.makedirs(settings.DATASET_PATH, exist_ok=True)
-
-    # Сохраняем объединённый список
-    with open(classes_path, "w", encoding="utf-8") as f:
-        for name in all_classes:
-            f.write(f"{name}\n")
-
-    # ✅ Создаём class_to_index на основе all_classes
-    class_to_index = {name: i for i, name in enumerate(all_classes)}
-
-    # Создание папок
-    splits = ["train", "val", "test"]
-    for split in splits:
-        os.makedirs(os.path.join(settings.DATASET_PATH, "images", split), exist_ok=True)
-        os.makedirs(os.path.join(settings.DATASET_PATH, "labels", split), exist_ok=True)
-
-    # Разделение на train/val/test
-    if len(entries) < 3:
-        split_data = {"train": entries, "val": [], "test": []}
-    else:
-        train_val, test = train_test_split(entries, test_size=test_ratio, random_state=42)
-        train, val = train_test_split(train_val, test_size=val_ratio/(train_ratio+val_ratio), random_state=42)
-        split_data = {"train": train, "val": val, "test": test}
-
-    # Копирование и генерация .txt аннотаций
-    for split, items in split_data.items():
-        for item in items:
-            image_name = item["image"]
-            class_id = class_to_index[item["class"]]
-            label_file = os.path.join(settings.DATASET_PATH, "labels", split, image_name.replace(".jpg", ".txt"))
-            image_src = os.path.join(settings.MOUNTED_PATH, image_name)
-            image_dst = os.path.join(settings.DATASET_PATH, "images", split, image_name)
-
-            # пишем класс в YOLO-формате
-            with open(label_file, "w") as f:
-                f.write(f"{class_id}\n")
-
-            # копируем изображение
-            if os.path.exists(image_src):
-                shutil.copy(image_src, image_dst)
-
     print(f"\nДатасет собран. {settings.DATASET_PATH}")
+    return report
 
 
 def main_from_path(json_path):
@@ -160,20 +52,8 @@ def analyze_dataset(dataset_path=settings.DATASET_PATH):
     with open(classes_file, "r", encoding="utf-8") as f:
         classes = [line.strip() for line in f if line.strip()]
 
-    split_counters = {"train": Counter(), "val": Counter(), "test": Counter()}
-
-    for split in split_counters:
-        label_dir = os.path.join(labels_root, split)
-        if not os.path.exists(label_dir):
-            continue
-        for fname in os.listdir(label_dir):
-            if fname.endswith(".txt"):
-                fpath = os.path.join(label_dir, fname)
-                with open(fpath, "r", encoding="utf-8") as f:
-                    line = f.readline().strip()
-                    if line.isdigit():
-                        class_id = int(line)
-                        split_counters[split][class_id] += 1
+    with DatasetManifest(dataset_path) as manifest:
+        split_counters = manifest.split_counts("yolo")
 
     total = sum(sum(c.values()) for c in split_counters.values())
     result = {
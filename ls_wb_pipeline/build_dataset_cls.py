@@ -1,122 +1,48 @@
 import os
-import shutil
 import json
-from urllib.parse import unquote
-from collections import Counter
-from ls_wb_pipeline.dataset_checker import check_dataset_duplicates
-from sklearn.model_selection import train_test_split
+from ls_wb_pipeline.dataset_checker import check_dataset_duplicates, check_content_duplicates
+from ls_wb_pipeline.dataset_manifest import DatasetManifest
+from ls_wb_pipeline.dataset_engine import build_dataset, get_latest_valid_annotation  # noqa: F401 — прежняя точка импорта
 from ls_wb_pipeline import settings
 
-def get_latest_valid_annotation(annotations):
-    valid = [a for a in annotations if not a.get("was_cancelled", False)]
-    if not valid:
-        return None
-    return max(valid, key=lambda x: x.get("created_at", ""))
-
-def build_classification_dataset(all_tasks, train_ratio=0.8, test_ratio=0.1, val_ratio=0.1):
-    entries = []
-    stats = Counter()
-    used_image_names = set()
-
-    existing_files = set()
-    for split in ("train", "val", "test"):
-        split_path = os.path.join(settings.DATASET_PATH, split)
-        if not os.path.exists(split_path):
-            continue
-        for class_dir in os.listdir(split_path):
-            class_path = os.path.join(split_path, class_dir)
-            if not os.path.isdir(class_path):
-                continue
-            for fname in os.listdir(class_path):
-                if fname.lower().endswith((".jpg", ".jpeg", ".png")):
-                    existing_files.add(fname)
-
-    for task in all_tasks:
-
-        anns = task.get("annotations", [])
-        if not anns or not isinstance(anns, list):
-            continue
-
-        latest = get_latest_valid_annotation(anns)
-        if not latest:
-            continue
-
-        results = latest.get("result", [])
-        if not results:
-            continue
-
-        try:
-            class_name = results[0]["value"]["choices"][0]
-            image_url = task["data"]["image"]
-            image_name = os.path.basename(unquote(image_url))
-            if image_name in used_image_names:
-                continue  # ⚠️ Уже обработан
-            if image_name in existing_files:
-                continue  # ⚠️ Файл уже есть в датасете
-            used_image_names.add(image_name)
-            entries.append({
-                "image": image_name,
-                "class": class_name
-            })
-            stats[class_name] += 1
-        except Exception:
-            continue
-
-    if not entries:
+def build_classification_dataset(all_tasks, train_ratio=0.8, test_ratio=0.1, val_ratio=0.1,
+                                 copy_workers=settings.DATASET_COPY_WORKERS,
+                                 copy_source=settings.DATASET_COPY_SOURCE, with_yolo=False):
+    """
+    Классификационный датасет split/class_N/... через общий движок сборки.
+    С with_yolo за тот же проход по задачам и с теми же скачанными кадрами
+    собирается и YOLO-раскладка (images/, labels/, classes.txt).
+    """
+    layouts = ("cls", "yolo") if with_yolo else ("cls",)
+    report = build_dataset(all_tasks, layouts=layouts, train_ratio=train_ratio, test_ratio=test_ratio,
+                           val_ratio=val_ratio, copy_workers=copy_workers, copy_source=copy_source)
+    cls_report = report["writers"]["cls"]
+    if not cls_report["stats"]:
         print("❗ Нет валидных размеченных задач.")
         return
 
-    # Загрузка существующих классов (если есть)
-    classes_path = os.path.join(settings.DATASET_PATH, "labels.txt")
-    existing_classes = []
-    if os.path.exists(classes_path):
-        with open(classes_path, "r", encoding="utf-8") as f:
-            existing_classes = [line.strip() for line in f if line.strip()]
-
-    # Объединение классов: старые + новые
-    new_classes = sorted(stats.keys())
-    all_classes = list(dict.fromkeys(existing_classes + new_classes))  # сохраняем порядок, избегаем дубликатов
-    class_to_id = {cls: idx for idx, cls in enumerate(all_classes)}
-
-    # Перезапись labels.txt
-    os.makedirs(settings.DATASET_PATH, exist_ok=True)
-    with open(classes_path, "w", encoding="utf-8") as f:
-        for cls in all_classes:
-            f.write(f"{cls}\n")
-
     print("\n📊 Распределение классов:")
-    for cls, count in stats.items():
+    for cls, count in cls_report["stats"].items():
         print(f"{cls:25} — {count} изображений")
 
-    # Разделение
-    if len(entries) < 3:
-        split_data = {"train": entries, "val": [], "test": []}
-    else:
-        train_val, test = train_test_split(entries, test_size=test_ratio, random_state=42, stratify=[e["class"] for e in entries])
-        train, val = train_test_split(train_val, test_size=val_ratio / (train_ratio + val_ratio), random_state=42, stratify=[e["class"] for e in train_val])
-        split_data = {"train": train, "val": val, "test": test}
+    version = cls_report.get("version")
+    print(f"\n✅ Классификационный датасет собран: {settings.DATASET_PATH} (версия {version})")
+    result = {"stats": True, "path": settings.DATASET_PATH, "copy": report["copy"], "version": version,
+              "splits": cls_report.get("splits", {})}
+    if with_yolo:
+        result["yolo"] = report["writers"]["yolo"]
+    return result
 
-    # Копирование
-    for split, items in split_data.items():
-        for item in items:
-            class_id = class_to_id[item["class"]]
-            class_dir = os.path.join(settings.DATASET_PATH, split, f"class_{class_id}")
-            os.makedirs(class_dir, exist_ok=True)
 
-            src = os.path.join(settings.MOUNTED_PATH, item["image"])
-            dst = os.path.join(class_dir, item["image"])
-            if os.path.exists(src):
-                shutil.copy(src, dst)
-    print(f"\n✅ Классификационный датасет собран: {settings.DATASET_PATH}")
-    return {"stats": True, "path": settings.DATASET_PATH}
 
 
-
-
-def analyze_classification_dataset(dataset_path):
+def analyze_classification_dataset(dataset_path, content_duplicates=False):
     """
     Анализирует датасет классификации (по структуре class_0, class_1...).
     Возвращает словарь с количеством изображений по классам и сплитам.
+
+    :param content_duplicates: Искать и дубли по содержимому (sha1/dHash каждого изображения, новые
+                               хеши считаются в пуле процессов). Без него анализ идёт только по манифесту.
     """
     try:
         classes_file = os.path.join(dataset_path, "labels.txt")
@@ -126,21 +52,8 @@ def analyze_classification_dataset(dataset_path):
         with open(classes_file, "r", encoding="utf-8") as f:
             classes = [line.strip() for line in f if line.strip()]
 
-        split_counters = {"train": Counter(), "val": Counter(), "test": Counter()}
-
-        for split in split_counters:
-            split_dir = os.path.join(dataset_path, split)
-            if not os.path.exists(split_dir):
-                continue
-            for class_id in range(len(classes)):
-                class_dir = os.path.join(split_dir, f"class_{class_id}")
-                if not os.path.isdir(class_dir):
-                    continue
-                image_files = [
-                    f for f in os.listdir(class_dir)
-                    if f.lower().endswith((".jpg", ".jpeg", ".png"))
-                ]
-                split_counters[split][class_id] = len(image_files)
+        with DatasetManifest(dataset_path) as manifest:
+            split_counters = manifest.split_counts("cls")
 
         total = sum(sum(c.values()) for c in split_counters.values())
         result = {
@@ -163,7 +76,9 @@ def analyze_classification_dataset(dataset_path):
                 "total": total_cls,
                 "percent": round(percent, 1)
             })
-        result["duplicates"] = check_dataset_duplicates(settings.DATASET_PATH)
+        result["duplicates"] = check_dataset_duplicates(dataset_path)
+        if content_duplicates:
+            result["content_duplicates"] = check_content_duplicates(dataset_path)
         return result
     except Exception as e:
         return {"error": f"Ошибка при анализе датасета: {str(e)}"}
@@ -0,0 +1,146 @@
+from ls_wb_pipeline.dataset_manifest import DatasetManifest, MANIFEST_FILE
+from ls_wb_pipeline.dataset_store import BLOBS_DIR, SNAPSHOTS_DIR, ARCHIVES_DIR, EXPORTS_DIR, snapshot_path
+from ls_wb_pipeline.logger import logger
+import threading
+import zipfile
+import uuid
+import os
+
+STORED_EXTENSIONS = (".jpg", ".jpeg", ".png")  # Уже сжаты — повторное сжатие только тратит CPU
+CHUNK_SIZE = 256 * 1024
+SERVICE_ENTRIES = {BLOBS_DIR, SNAPSHOTS_DIR, ARCHIVES_DIR, EXPORTS_DIR, MANIFEST_FILE}
+
+
+class ZipStream:
+    """
+    Несикабельный файловый объект для zipfile: отдаёт записанные байты порциями
+    и по желанию дублирует их в файл кеша.
+    """
+
+    def __init__(self, tee=None):
+        self.buffer = bytearray()
+        self.position = 0
+        self.tee = tee
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        if self.tee:
+            self.tee.write(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def archive_name(version, since=None):
+    if version is None:
+        return "dataset.zip"
+    if since is None:
+        return f"dataset_v{version:04d}.zip"
+    return f"dataset_v{since:04d}-v{version:04d}.zip"
+
+
+def snapshot_members(dataset_path, version, since=None):
+    """
+    Файлы снапшота для архива: (имя в архиве, путь на диске).
+    С since — только изображения, впервые попавшие в датасет после версии since, и labels.txt.
+    """
+    root = snapshot_path(dataset_path, version)
+    if since is None:
+        members = []
+        for current, _, files in os.walk(root):
+            for fname in files:
+                path = os.path.join(current, fname)
+                members.append((os.path.relpath(path, root), path))
+        return sorted(members)
+
+    with DatasetManifest(dataset_path) as manifest:
+        rows = manifest.rows("cls")
+    members = [("labels.txt", os.path.join(root, "labels.txt"))]
+    for row in rows:
+        if row["added_version"] is not None and since < row["added_version"] <= version:
+            path = os.path.join(root, row["path"])
+            if os.path.exists(path):
+                members.append((row["path"], path))
+    return members
+
+
+def working_tree_members(dataset_path):
+    """Файлы рабочего дерева без служебных каталогов — для датасетов без снапшотов."""
+    members = []
+    for current, dirs, files in os.walk(dataset_path):
+        if current == dataset_path:
+            dirs[:] = [d for d in dirs if d not in SERVICE_ENTRIES]
+            files = [f for f in files if not f.startswith(MANIFEST_FILE)]
+        for fname in files:
+            path = os.path.join(current, fname)
+            members.append((os.path.relpath(path, dataset_path), path))
+    return sorted(members)
+
+
+def iter_zip(members, cache_path=None):
+    """
+    Генерирует ZIP на лету. JPEG/PNG кладутся без сжатия, остальное — deflate.
+    Если задан cache_path, архив параллельно пишется во временный файл и
+    публикуется в кеш только после полной отдачи.
+    """
+    temp_path = None
+    tee = None
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.{uuid.uuid4().hex[:8]}.part"
+        tee = open(temp_path, "wb")
+
+    completed = False
+    try:
+        stream = ZipStream(tee)
+        with zipfile.ZipFile(stream, mode="w", allowZip64=True) as zf:
+            for arcname, path in members:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                info.compress_type = zipfile.ZIP_STORED if arcname.lower().endswith(STORED_EXTENSIONS) \
+                    else zipfile.ZIP_DEFLATED
+                with open(path, "rb") as src, zf.open(info, mode="w") as dst:
+                    for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                        dst.write(chunk)
+                        if len(stream.buffer) >= CHUNK_SIZE:
+                            yield stream.drain()
+                if stream.buffer:
+                    yield stream.drain()
+        # Центральный каталог дописывается при закрытии ZipFile
+        tail = stream.drain()
+        if tail:
+            yield tail
+        completed = True
+    finally:
+        if tee:
+            tee.close()
+            if completed:
+                os.replace(temp_path, cache_path)
+                logger.info(f"[ZIP] Архив сохранён в кеш: {cache_path}")
+            elif os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+def get_archive(dataset_path, version=None, since=None):
+    """
+    :return: {"filename": ..., "path": путь к готовому архиву из кеша или None,
+              "stream": генератор байтов, если архив собирается на лету}
+    """
+    filename = archive_name(version, since)
+    if version is None:
+        return {"filename": filename, "path": None, "stream": iter_zip(working_tree_members(dataset_path))}
+
+    cache_path = os.path.join(dataset_path, ARCHIVES_DIR, filename)
+    if os.path.exists(cache_path):
+        return {"filename": filename, "path": cache_path, "stream": None}
+    members = snapshot_members(dataset_path, version, since)
+    return {"filename": filename, "path": None, "stream": iter_zip(members, cache_path=cache_path)}
@@ -1,65 +1,134 @@
 import os
-from collections import defaultdict, Counter
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from ls_wb_pipeline.dataset_manifest import DatasetManifest, file_digest, read_manifest
+from ls_wb_pipeline import settings
+
+# Отчёт для ещё не созданного датасета
+NO_DUPLICATES = {"ok": True, "conflict_in_classes": [], "conflict_in_splits": [], "repeated_names": []}
+
 
 def check_dataset_duplicates(dataset_path):
-    splits = ['train', 'val', 'test']
-    file_to_classes = defaultdict(set)  # (split, filename) -> set of classes
-    file_to_splits = defaultdict(set)   # filename -> set of splits
-    filename_counts = Counter()
-    errors = []
-
-    for split in splits:
-        split_path = os.path.join(dataset_path, split)
-        if not os.path.isdir(split_path):
+    """Проверка дублей по манифесту датасета (индексируется при первом обращении)."""
+    return read_manifest(dataset_path, lambda manifest: manifest.duplicates("cls"), NO_DUPLICATES)
+
+
+def image_hashes(path):
+    """Точный (sha1) и перцептивный (dHash 8x8) хеши изображения. Выполняется в пуле процессов."""
+    from PIL import Image
+
+    size, sha1 = file_digest(path)
+    try:
+        with Image.open(path) as img:
+            pixels = list(img.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    except Exception:
+        return path, size, sha1, None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return path, size, sha1, f"{bits:016x}"
+
+
+def collect_hashes(dataset_path, rows, workers=settings.DUPLICATE_HASH_WORKERS):
+    """
+    Хеши для записей манифеста. Кеш в манифесте сверяется по пути, размеру и mtime,
+    так что повторные проверки считают хеши только для новых или изменённых файлов.
+
+    :return: path -> (sha1, dhash)
+    """
+    hashes = {}
+    to_compute = {}
+    cache = read_manifest(dataset_path, lambda manifest: manifest.cached_hashes(), {})
+    for row in rows:
+        full_path = os.path.join(dataset_path, row["path"])
+        try:
+            st = os.stat(full_path)
+        except FileNotFoundError:
             continue
+        cached = cache.get(row["path"])
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime:
+            hashes[row["path"]] = (cached[2], cached[3])
+        else:
+            to_compute[full_path] = (row["path"], st.st_mtime)
 
-        for class_dir in os.listdir(split_path):
-            class_path = os.path.join(split_path, class_dir)
-            if not os.path.isdir(class_path):
-                continue
+    if to_compute:
+        new_rows = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for full_path, size, sha1, dhash in pool.map(image_hashes, to_compute, chunksize=64):
+                path, mtime = to_compute[full_path]
+                hashes[path] = (sha1, dhash)
+                new_rows.append((path, size, mtime, sha1, dhash))
+        with DatasetManifest(dataset_path) as manifest:
+            manifest.store_hashes(new_rows)
+    return hashes
 
-            for file in os.listdir(class_path):
-                if not file.lower().endswith((".jpg", ".jpeg", ".png")):
+
+def check_content_duplicates(dataset_path, max_distance=settings.NEAR_DUPLICATE_DISTANCE,
+                             workers=settings.DUPLICATE_HASH_WORKERS, limit=1000):
+    """
+    Ищет дубли по содержимому: одинаковые байты (sha1) и почти одинаковые кадры
+    (расстояние Хэмминга между dHash <= max_distance). В отчёт попадают только
+    совпадения между разными классами или сплитами — то, что портит разметку и утекает между сплитами.
+    """
+    rows = read_manifest(dataset_path, lambda manifest: manifest.rows("cls"), [])
+    info = {row["path"]: (row["split"], row["class_id"]) for row in rows}
+    hashes = collect_hashes(dataset_path, rows, workers=workers)
+
+    def conflict(paths):
+        splits = {info[p][0] for p in paths}
+        classes = {info[p][1] for p in paths}
+        return {"cross_split": len(splits) > 1, "cross_class": len(classes) > 1}
+
+    # Точные дубли
+    by_sha1 = defaultdict(list)
+    for path, (sha1, _) in hashes.items():
+        by_sha1[sha1].append(path)
+    exact = []
+    exact_pairs = set()
+    for sha1, paths in by_sha1.items():
+        if len(paths) < 2:
+            continue
+        flags = conflict(paths)
+        if flags["cross_split"] or flags["cross_class"]:
+            exact.append({"sha1": sha1, "files": sorted(paths), **flags})
+        exact_pairs.update((a, b) for a in paths for b in paths if a < b)
+
+    # Почти дубли: по принципу Дирихле при расстоянии <= d совпадает хотя бы одна из d+1 полос хеша
+    bands = max_distance + 1
+    band_bits = [(64 * i // bands, 64 * (i + 1) // bands) for i in range(bands)]
+    buckets = defaultdict(list)
+    for path, (_, dhash) in hashes.items():
+        if dhash is None:
+            continue
+        value = int(dhash, 16)
+        for index, (start, end) in enumerate(band_bits):
+            buckets[(index, (value >> start) & ((1 << (end - start)) - 1))].append((path, value))
+
+    near = []
+    seen_pairs = set()
+    for bucket in buckets.values():
+        for i in range(len(bucket)):
+            for j in range(i + 1, len(bucket)):
+                (a, va), (b, vb) = sorted((bucket[i], bucket[j]))
+                if (a, b) in seen_pairs or (a, b) in exact_pairs:
+                    continue
+                seen_pairs.add((a, b))
+                distance = bin(va ^ vb).count("1")
+                if distance > max_distance:
                     continue
-                key = (split, file)
-                file_to_classes[key].add(class_dir)
-                file_to_splits[file].add(split)
-                filename_counts[file] += 1
-
-    conflict_in_classes = []
-    conflict_in_splits = []
-    repeated_names = []
-
-    # Проверка 1: один и тот же файл в нескольких классах внутри одного сплита
-    for (split, filename), class_set in file_to_classes.items():
-        if len(class_set) > 1:
-            conflict_in_classes.append({
-                "split": split,
-                "filename": filename,
-                "classes": list(class_set)
-            })
-
-    # Проверка 2: один и тот же файл в нескольких сплитах
-    for filename, split_set in file_to_splits.items():
-        if len(split_set) > 1:
-            conflict_in_splits.append({
-                "filename": filename,
-                "splits": list(split_set)
-            })
-
-    # Проверка 3: дублирующиеся имена
-    for filename, count in filename_counts.items():
-        if count > 1:
-            repeated_names.append({
-                "filename": filename,
-                "count": count
-            })
+                flags = conflict((a, b))
+                if flags["cross_split"] or flags["cross_class"]:
+                    near.append({"files": [a, b], "distance": distance, **flags})
 
+    near.sort(key=lambda item: item["distance"])
     return {
-        "ok": not (conflict_in_classes or conflict_in_splits or repeated_names),
-        "conflict_in_classes": conflict_in_classes,
-        "conflict_in_splits": conflict_in_splits,
-        "repeated_names": repeated_names
+        "ok": not (exact or near),
+        "hashed": len(hashes),
+        "exact": exact[:limit],
+        "exact_total": len(exact),
+        "near": near[:limit],
+        "near_total": len(near),
     }
 
 
@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline.dataset_manifest import file_digest
+from ls_wb_pipeline.dataset_store import store_blob
+from ls_wb_pipeline import settings, webdav_api, jobs
+import shutil
+import os
+
+
+def copy_from_mount(image_name, dst):
+    src = os.path.join(settings.MOUNTED_PATH, image_name)
+    if not os.path.exists(src):
+        return "missing"
+    temp_path = dst + ".part"
+    try:
+        shutil.copyfile(src, temp_path)
+        os.replace(temp_path, dst)
+        return "copied"
+    except OSError as e:
+        logger.error(f"[COPY] Ошибка копирования {src}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return "failed"
+
+
+def copy_from_webdav(image_name, dst):
+    status = webdav_api.download_remote_file(f"{settings.REMOTE_FRAME_DIR}/{image_name}", dst)
+    return "copied" if status == "downloaded" else status
+
+
+def copy_and_digest(copy_one, image_name, dst, blob_root=None):
+    status = copy_one(image_name, dst)
+    if status != "copied":
+        return status, None, None
+    size, sha1 = file_digest(dst)
+    if blob_root:
+        store_blob(blob_root, dst, sha1)
+    return status, size, sha1
+
+
+def copy_images(items, workers=settings.DATASET_COPY_WORKERS, source=settings.DATASET_COPY_SOURCE,
+                on_progress=None, blob_root=None):
+    """
+    Параллельно копирует кадры в датасет. Файлы пишутся во временный .part и
+    атомарно переименовываются, так что в датасете не бывает недописанных изображений.
+
+    :param items: Пары (имя кадра в REMOTE_FRAME_DIR, путь назначения).
+    :param source: "webdav" — напрямую по HTTP, "mount" — через смонтированную папку.
+    :param on_progress: Необязательный callback(done, total).
+    :param blob_root: Корень датасета с хранилищем блобов — файлы превращаются в ссылки на блобы.
+    :return: Отчёт {"copied": n, "missing": [...], "failed": [...],
+             "written": {путь назначения: (размер, sha1)}}
+    """
+    items = list(items)
+    copy_one = copy_from_webdav if source == "webdav" else copy_from_mount
+    report = {"copied": 0, "missing": [], "failed": [], "written": {}}
+    total = len(items)
+    if not total:
+        return report
+    log_every = max(total // 20, 1)
+
+    for dst_dir in {os.path.dirname(dst) for _, dst in items}:
+        os.makedirs(dst_dir, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(copy_and_digest, copy_one, name, dst, blob_root): (name, dst) for name, dst in items}
+        for done, future in enumerate(as_completed(futures), start=1):
+            name, dst = futures[future]
+            try:
+                status, size, sha1 = future.result()
+            except Exception as e:
+                logger.error(f"[COPY] Ошибка копирования {name}: {e}")
+                status = "failed"
+            if status == "copied":
+                report["copied"] += 1
+                report["written"][dst] = (size, sha1)
+                jobs.progress(frames=1, bytes=size or 0)
+            else:
+                report[status].append(name)
+            if on_progress:
+                on_progress(done, total)
+            if done % log_every == 0 or done == total:
+                logger.info(f"[COPY] Скопировано {done}/{total}")
+
+    if report["missing"] or report["failed"]:
+        logger.warning(f"[COPY] Не найдено: {len(report['missing'])}, ошибок: {len(report['failed'])}")
+    return report
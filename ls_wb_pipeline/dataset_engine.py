@@ -0,0 +1,182 @@
+from ls_wb_pipeline.dataset_manifest import DatasetManifest, read_class_list
+from ls_wb_pipeline.dataset_store import create_snapshot, link_replace
+from ls_wb_pipeline.dataset_copy import copy_images
+from ls_wb_pipeline.dataset_split import SplitAssigner
+from ls_wb_pipeline import settings
+from urllib.parse import unquote
+from collections import Counter
+import os
+
+
+def get_latest_valid_annotation(annotations):
+    valid = [a for a in annotations if not a.get("was_cancelled", False)]
+    if not valid:
+        return None
+    return max(valid, key=lambda x: x.get("created_at", ""))
+
+
+def iter_annotated_tasks(all_tasks, summary=None):
+    """
+    Один проход по задачам: для каждого кадра — класс из последней валидной аннотации.
+    Попутно считает полное распределение классов в summary.
+    """
+    used_image_names = set()
+    for task in all_tasks:
+        anns = task.get("annotations", [])
+        if not anns or not isinstance(anns, list):
+            continue
+        latest = get_latest_valid_annotation(anns)
+        if not latest:
+            continue
+        results = latest.get("result", [])
+        if not results:
+            continue
+        try:
+            class_name = results[0]["value"]["choices"][0]
+            image_name = os.path.basename(unquote(task["data"]["image"]))
+        except (KeyError, IndexError, TypeError):
+            continue
+        if summary is not None:
+            summary[class_name] += 1
+        if image_name in used_image_names:
+            continue  # ⚠️ Уже обработан
+        used_image_names.add(image_name)
+        yield {"image": image_name, "class": class_name, "task_id": task.get("id")}
+
+
+class DatasetWriter:
+    """Раскладка датасета: куда класть изображение, где список классов и какие метки писать рядом."""
+    layout = None
+    classes_file = None
+    snapshot = False
+
+    def __init__(self, dataset_path):
+        self.dataset_path = dataset_path
+        self.classes = []
+        self.existing_rows = []
+        self.existing = set()
+
+    def load_state(self, manifest):
+        self.existing_rows = manifest.rows(self.layout)
+        self.existing = {row["image"] for row in self.existing_rows}
+        self.classes = read_class_list(os.path.join(self.dataset_path, self.classes_file))
+
+    def update_classes(self, class_names):
+        """Старые классы + новые, порядок сохраняется, индексы существующих не меняются."""
+        self.classes = list(dict.fromkeys(self.classes + sorted(class_names)))
+        with open(os.path.join(self.dataset_path, self.classes_file), "w", encoding="utf-8") as f:
+            for name in self.classes:
+                f.write(f"{name}\n")
+        return {name: i for i, name in enumerate(self.classes)}
+
+    def image_path(self, split, class_id, image_name):
+        raise NotImplementedError
+
+    def write_label(self, split, class_id, image_name):
+        pass
+
+
+class ClassificationWriter(DatasetWriter):
+    """split/class_N/image.jpg + labels.txt, с публикацией версии."""
+    layout = "cls"
+    classes_file = "labels.txt"
+    snapshot = True
+
+    def image_path(self, split, class_id, image_name):
+        return os.path.join(self.dataset_path, split, f"class_{class_id}", image_name)
+
+
+class YoloWriter(DatasetWriter):
+    """images/split/image.jpg + labels/split/image.txt + classes.txt."""
+    layout = "yolo"
+    classes_file = "classes.txt"
+
+    def image_path(self, split, class_id, image_name):
+        return os.path.join(self.dataset_path, "images", split, image_name)
+
+    def write_label(self, split, class_id, image_name):
+        label_dir = os.path.join(self.dataset_path, "labels", split)
+        os.makedirs(label_dir, exist_ok=True)
+        with open(os.path.join(label_dir, os.path.splitext(image_name)[0] + ".txt"), "w") as f:
+            f.write(f"{class_id}\n")
+
+
+WRITERS = {"cls": ClassificationWriter, "yolo": YoloWriter}
+
+
+def build_dataset(all_tasks, layouts=("cls",), train_ratio=0.8, test_ratio=0.1, val_ratio=0.1,
+                  dataset_path=settings.DATASET_PATH, copy_workers=settings.DATASET_COPY_WORKERS,
+                  copy_source=settings.DATASET_COPY_SOURCE):
+    """
+    Собирает датасет в одной или нескольких раскладках за один проход по задачам.
+    Каждый кадр скачивается один раз общим пулом копирования; если он нужен нескольким
+    раскладкам, остальные получают жёсткую ссылку. Манифест обновляется одной транзакцией.
+
+    :param layouts: Ключи WRITERS, например ("cls", "yolo").
+    :return: {"summary": {класс: всего размечено}, "copy": отчёт копирования, "writers": {layout: отчёт}}
+    """
+    summary = Counter()
+    entries = list(iter_annotated_tasks(all_tasks, summary))
+    report = {"summary": dict(summary), "copy": None, "writers": {}}
+
+    os.makedirs(dataset_path, exist_ok=True)
+    writers = [WRITERS[layout](dataset_path) for layout in layouts]
+    with DatasetManifest(dataset_path) as manifest:
+        for writer in writers:
+            writer.load_state(manifest)
+
+    planned = {}  # путь назначения -> (writer, split, class_id, entry)
+    primary = {}  # имя кадра -> первый путь назначения (его и скачиваем)
+    links = []    # (имя кадра, путь) — остальные раскладки получают ссылку на primary
+    assigners = {}
+    for writer in writers:
+        new_entries = [e for e in entries if e["image"] not in writer.existing]  # ⚠️ Файл уже есть в датасете
+        report["writers"][writer.layout] = {"added": 0, "stats": dict(Counter(e["class"] for e in new_entries))}
+        if not new_entries:
+            continue
+        class_to_id = writer.update_classes({e["class"] for e in new_entries})
+        assigner = assigners[writer.layout] = SplitAssigner(train_ratio, val_ratio, test_ratio,
+                                                            existing_rows=writer.existing_rows)
+        assigner.prepare((e["image"], e["class"]) for e in new_entries)
+        for entry in new_entries:
+            split = assigner.assign(entry["image"], entry["class"])
+            class_id = class_to_id[entry["class"]]
+            dst = writer.image_path(split, class_id, entry["image"])
+            planned[dst] = (writer, split, class_id, entry)
+            if entry["image"] in primary:
+                links.append((entry["image"], dst))
+            else:
+                primary[entry["image"]] = dst
+
+    if not planned:
+        return report
+
+    copy_report = copy_images(primary.items(), workers=copy_workers, source=copy_source, blob_root=dataset_path)
+    written = copy_report.pop("written")
+    for image_name, dst in links:
+        src = primary[image_name]
+        if src in written:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            link_replace(src, dst)
+            written[dst] = written[src]
+    report["copy"] = copy_report
+
+    # Метки и манифест — только для реально записанных изображений
+    records = []
+    for dst, (size, sha1) in written.items():
+        writer, split, class_id, entry = planned[dst]
+        writer.write_label(split, class_id, entry["image"])
+        records.append({"path": os.path.relpath(dst, dataset_path), "image": entry["image"],
+                        "layout": writer.layout, "split": split, "class_id": class_id,
+                        "class_name": entry["class"], "size": size, "sha1": sha1, "task_id": entry["task_id"]})
+        report["writers"][writer.layout]["added"] += 1
+    with DatasetManifest(dataset_path) as manifest:
+        manifest.add(records)
+
+    for writer in writers:
+        if writer.layout in assigners:
+            report["writers"][writer.layout]["splits"] = assigners[writer.layout].stats()
+            report["writers"][writer.layout]["split_drift"] = assigners[writer.layout].check_drift()
+            if writer.snapshot:
+                report["writers"][writer.layout]["version"] = create_snapshot(dataset_path, layout=writer.layout)
+    return report
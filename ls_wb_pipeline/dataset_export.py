@@ -0,0 +1,161 @@
+from concurrent.futures import ProcessPoolExecutor
+from ls_wb_pipeline.dataset_manifest import DatasetManifest, read_class_list
+from ls_wb_pipeline.dataset_store import EXPORTS_DIR, snapshot_path, latest_snapshot
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import settings
+import random
+import shutil
+import tarfile
+import json
+import io
+import os
+
+IMAGE_SIZE = 224  # Как в ml_utils.transform: Resize((224, 224))
+NORMALIZE_MEAN = [0.485, 0.456, 0.406]
+NORMALIZE_STD = [0.229, 0.224, 0.225]
+
+
+def export_root(dataset_path, version, export_format):
+    return os.path.join(dataset_path, EXPORTS_DIR, f"v{version:04d}", export_format)
+
+
+def snapshot_items(dataset_path, version, shuffle_seed):
+    """Изображения снапшота по сплитам, в детерминированно перемешанном порядке."""
+    root = snapshot_path(dataset_path, version)
+    with DatasetManifest(dataset_path) as manifest:
+        rows = manifest.rows("cls")
+    by_split = {}
+    for row in rows:
+        path = os.path.join(root, row["path"])
+        if os.path.exists(path):
+            by_split.setdefault(row["split"], []).append({**row, "full_path": path})
+    for split, items in by_split.items():
+        items.sort(key=lambda item: item["path"])
+        random.Random(f"{shuffle_seed}:{split}").shuffle(items)
+    return by_split
+
+
+def add_tar_member(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def export_webdataset(dataset_path, version, shard_size=settings.EXPORT_SHARD_SIZE,
+                      shuffle_seed=settings.EXPORT_SHUFFLE_SEED):
+    """
+    Пишет снапшот шардами tar в формате WebDataset: {split}-000000.tar с парами
+    {key}.jpg / {key}.cls / {key}.json. Ключи — порядковые номера, потому что
+    WebDataset режет имя по первой точке, а в именах кадров точки есть.
+    """
+    out_dir = export_root(dataset_path, version, "webdataset")
+    temp_dir = out_dir + ".part"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+
+    report = {}
+    for split, items in snapshot_items(dataset_path, version, shuffle_seed).items():
+        shards = 0
+        for start in range(0, len(items), shard_size):
+            shard_path = os.path.join(temp_dir, f"{split}-{shards:06d}.tar")
+            with tarfile.open(shard_path, "w") as tar:
+                for index, item in enumerate(items[start:start + shard_size], start=start):
+                    key = f"{index:08d}"
+                    with open(item["full_path"], "rb") as f:
+                        add_tar_member(tar, f"{key}.jpg", f.read())
+                    add_tar_member(tar, f"{key}.cls", str(item["class_id"]).encode())
+                    meta = {"image": item["image"], "class_name": item["class_name"], "task_id": item["task_id"]}
+                    add_tar_member(tar, f"{key}.json", json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+            shards += 1
+        report[split] = {"images": len(items), "shards": shards}
+
+    write_export_meta(dataset_path, version, temp_dir, report)
+    publish(temp_dir, out_dir)
+    logger.info(f"[EXPORT] WebDataset v{version}: {report}")
+    return {"path": out_dir, "splits": report}
+
+
+def resize_into_memmap(args):
+    """Декодирует и ресайзит пачку изображений прямо в общий memmap. Выполняется в пуле процессов."""
+    import numpy as np
+    from PIL import Image
+
+    array_path, start, paths = args
+    images = np.load(array_path, mmap_mode="r+")
+    for offset, path in enumerate(paths):
+        with Image.open(path) as img:
+            resized = img.convert("RGB").resize((IMAGE_SIZE, IMAGE_SIZE), Image.BILINEAR)
+        images[start + offset] = np.asarray(resized, dtype=np.uint8)
+    images.flush()
+    return len(paths)
+
+
+def export_memmap(dataset_path, version, workers=settings.EXPORT_WORKERS,
+                  shuffle_seed=settings.EXPORT_SHUFFLE_SEED, batch=256):
+    """
+    Пишет снапшот заранее отресайзенными массивами: {split}_images.npy (N, 224, 224, 3) uint8,
+    {split}_labels.npy (N,) int64 и {split}_index.json с именами. Массивы открываются через
+    np.load(..., mmap_mode="r") без копирования; нормализация остаётся загрузчику (mean/std в meta.json).
+    """
+    import numpy as np
+
+    out_dir = export_root(dataset_path, version, "memmap")
+    temp_dir = out_dir + ".part"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+
+    report = {}
+    for split, items in snapshot_items(dataset_path, version, shuffle_seed).items():
+        array_path = os.path.join(temp_dir, f"{split}_images.npy")
+        images = np.lib.format.open_memmap(array_path, mode="w+", dtype=np.uint8,
+                                           shape=(len(items), IMAGE_SIZE, IMAGE_SIZE, 3))
+        del images  # Заголовок записан, данные заполняют процессы пула
+
+        jobs = [(array_path, start, [item["full_path"] for item in items[start:start + batch]])
+                for start in range(0, len(items), batch)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            done = sum(pool.map(resize_into_memmap, jobs))
+
+        np.save(os.path.join(temp_dir, f"{split}_labels.npy"),
+                np.array([item["class_id"] for item in items], dtype=np.int64))
+        with open(os.path.join(temp_dir, f"{split}_index.json"), "w", encoding="utf-8") as f:
+            json.dump([item["image"] for item in items], f, ensure_ascii=False)
+        report[split] = {"images": done}
+
+    write_export_meta(dataset_path, version, temp_dir, report)
+    publish(temp_dir, out_dir)
+    logger.info(f"[EXPORT] Memmap v{version}: {report}")
+    return {"path": out_dir, "splits": report}
+
+
+def write_export_meta(dataset_path, version, out_dir, report):
+    classes = read_class_list(os.path.join(snapshot_path(dataset_path, version), "labels.txt"))
+    with open(os.path.join(out_dir, "labels.txt"), "w", encoding="utf-8") as f:
+        for name in classes:
+            f.write(f"{name}\n")
+    meta = {"version": version, "classes": classes, "splits": report, "image_size": IMAGE_SIZE,
+            "mean": NORMALIZE_MEAN, "std": NORMALIZE_STD}
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def publish(temp_dir, out_dir):
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.rename(temp_dir, out_dir)
+
+
+def export_dataset(export_format="webdataset", version=None, dataset_path=settings.DATASET_PATH):
+    """Экспортирует версию датасета (по умолчанию последнюю) в формат webdataset или memmap."""
+    if version is None:
+        snapshot = latest_snapshot(dataset_path)
+        if not snapshot:
+            return {"error": "Нет ни одной версии датасета — сначала соберите датасет"}
+        version = snapshot["version"]
+    elif not os.path.isdir(snapshot_path(dataset_path, version)):
+        return {"error": f"Версия датасета {version} не найдена"}
+
+    if export_format == "webdataset":
+        return export_webdataset(dataset_path, version)
+    if export_format == "memmap":
+        return export_memmap(dataset_path, version)
+    return {"error": f"Неизвестный формат экспорта: {export_format}"}
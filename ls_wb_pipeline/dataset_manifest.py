@@ -0,0 +1,269 @@
+from collections import Counter, defaultdict
+from ls_wb_pipeline.logger import logger
+import hashlib
+import sqlite3
+import time
+import os
+
+MANIFEST_FILE = "manifest.sqlite"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+SPLITS = ("train", "val", "test")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,      -- путь относительно корня датасета
+    image TEXT NOT NULL,        -- имя файла
+    layout TEXT NOT NULL,       -- "cls" (split/class_N) или "yolo" (images/split + labels/split)
+    split TEXT NOT NULL,
+    class_id INTEGER NOT NULL,
+    class_name TEXT,
+    size INTEGER,
+    sha1 TEXT,
+    task_id INTEGER,
+    added_at REAL,
+    added_version INTEGER       -- версия снапшота, в которую изображение попало впервые
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    version INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    layout TEXT NOT NULL,
+    images INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hash_cache (
+    path TEXT PRIMARY KEY,      -- путь относительно корня датасета
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    sha1 TEXT NOT NULL,
+    dhash TEXT                  -- перцептивный хеш (64 бита, hex)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_images_image ON images (image);
+CREATE INDEX IF NOT EXISTS idx_images_layout ON images (layout, split, class_id);
+CREATE INDEX IF NOT EXISTS idx_images_sha1 ON images (sha1);
+"""
+
+
+def file_digest(path):
+    """Возвращает (размер, sha1) файла."""
+    sha1 = hashlib.sha1()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(chunk)
+            size += len(chunk)
+    return size, sha1.hexdigest()
+
+
+def read_class_list(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class DatasetManifest:
+    """
+    Индекс датасета в SQLite (DATASET_PATH/manifest.sqlite): одна строка на изображение
+    с классом, сплитом, размером, хешем и исходной задачей. Сборщики дописывают его по мере
+    записи файлов, а статистика и проверки дублей становятся запросами вместо обхода папок.
+    """
+
+    def __init__(self, dataset_path):
+        """:raises FileNotFoundError: Папки датасета нет — её создаёт сборщик, а не манифест."""
+        if not os.path.isdir(dataset_path):
+            raise FileNotFoundError(f"Датасет ещё не создан: {dataset_path}")
+        self.dataset_path = dataset_path
+        self.db_path = os.path.join(dataset_path, MANIFEST_FILE)
+        is_new = not os.path.exists(self.db_path)
+        self.conn = sqlite3.connect(self.db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        if is_new:
+            self.rebuild_from_tree()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _migrate(self):
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(images)")}
+        if "added_version" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE images ADD COLUMN added_version INTEGER")
+
+    def add(self, records):
+        """
+        Добавляет или обновляет записи одной транзакцией.
+
+        :param records: dict с ключами path, image, layout, split, class_id, class_name, size, sha1, task_id.
+        """
+        now = time.time()
+        rows = [(r["path"], r["image"], r["layout"], r["split"], r["class_id"], r.get("class_name"),
+                 r.get("size"), r.get("sha1"), r.get("task_id"), now) for r in records]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO images "
+                "(path, image, layout, split, class_id, class_name, size, sha1, task_id, added_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def remove(self, paths):
+        with self.conn:
+            self.conn.executemany("DELETE FROM images WHERE path = ?", [(p,) for p in paths])
+
+    def image_paths(self, layout):
+        """Имя изображения -> абсолютные пути в датасете."""
+        images = defaultdict(list)
+        for image, path in self.conn.execute("SELECT image, path FROM images WHERE layout = ?", (layout,)):
+            images[image].append(os.path.join(self.dataset_path, path))
+        return images
+
+    def split_counts(self, layout):
+        """{split: Counter(class_id -> количество)}"""
+        counters = {split: Counter() for split in SPLITS}
+        rows = self.conn.execute(
+            "SELECT split, class_id, COUNT(*) FROM images WHERE layout = ? GROUP BY split, class_id", (layout,))
+        for split, class_id, count in rows:
+            counters.setdefault(split, Counter())[class_id] = count
+        return counters
+
+    def duplicates(self, layout="cls"):
+        """Те же проверки, что и dataset_checker.check_dataset_duplicates, но запросами."""
+        conflict_in_classes = [
+            {"split": split, "filename": image, "classes": classes.split(",")}
+            for split, image, classes in self.conn.execute(
+                "SELECT split, image, GROUP_CONCAT(DISTINCT 'class_' || class_id) FROM images "
+                "WHERE layout = ? GROUP BY split, image HAVING COUNT(DISTINCT class_id) > 1", (layout,))
+        ]
+        conflict_in_splits = [
+            {"filename": image, "splits": splits.split(",")}
+            for image, splits in self.conn.execute(
+                "SELECT image, GROUP_CONCAT(DISTINCT split) FROM images "
+                "WHERE layout = ? GROUP BY image HAVING COUNT(DISTINCT split) > 1", (layout,))
+        ]
+        repeated_names = [
+            {"filename": image, "count": count}
+            for image, count in self.conn.execute(
+                "SELECT image, COUNT(*) FROM images WHERE layout = ? GROUP BY image HAVING COUNT(*) > 1", (layout,))
+        ]
+        return {
+            "ok": not (conflict_in_classes or conflict_in_splits or repeated_names),
+            "conflict_in_classes": conflict_in_classes,
+            "conflict_in_splits": conflict_in_splits,
+            "repeated_names": repeated_names
+        }
+
+    def cached_hashes(self):
+        """path -> (size, mtime, sha1, dhash)"""
+        rows = self.conn.execute("SELECT path, size, mtime, sha1, dhash FROM hash_cache")
+        return {path: (size, mtime, sha1, dhash) for path, size, mtime, sha1, dhash in rows}
+
+    def store_hashes(self, rows):
+        """:param rows: (path, size, mtime, sha1, dhash)"""
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO hash_cache (path, size, mtime, sha1, dhash) "
+                                  "VALUES (?, ?, ?, ?, ?)", rows)
+
+    def rows(self, layout):
+        """Все записи раскладки в виде словарей."""
+        cursor = self.conn.execute(
+            "SELECT path, image, split, class_id, class_name, size, sha1, task_id, added_version "
+            "FROM images WHERE layout = ? ORDER BY path", (layout,))
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def next_version(self):
+        """Номер следующей версии. Номера не переиспользуются, даже если снапшот удалён."""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'last_version'").fetchone()
+        return int(row[0]) + 1 if row else 1
+
+    def add_snapshot(self, version, layout, images):
+        """Регистрирует снапшот и помечает им изображения, ещё не попадавшие ни в одну версию."""
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_version', ?)", (str(version),))
+            self.conn.execute("INSERT INTO snapshots (version, created_at, layout, images) VALUES (?, ?, ?, ?)",
+                              (version, time.time(), layout, images))
+            self.conn.execute("UPDATE images SET added_version = ? WHERE layout = ? AND added_version IS NULL",
+                              (version, layout))
+
+    def remove_snapshot(self, version):
+        with self.conn:
+            self.conn.execute("DELETE FROM snapshots WHERE version = ?", (version,))
+
+    def snapshots(self):
+        cursor = self.conn.execute("SELECT version, created_at, layout, images FROM snapshots ORDER BY version")
+        return [{"version": v, "created_at": c, "layout": l, "images": n} for v, c, l, n in cursor]
+
+    def rebuild_from_tree(self):
+        """Однократно индексирует датасет, собранный до появления манифеста."""
+        records = list(self._scan_classification()) + list(self._scan_yolo())
+        if records:
+            logger.info(f"[MANIFEST] Проиндексировано {len(records)} изображений в {self.dataset_path}")
+            self.add(records)
+
+    def _record(self, full_path, layout, split, class_id, class_name):
+        size, sha1 = file_digest(full_path)
+        return {"path": os.path.relpath(full_path, self.dataset_path), "image": os.path.basename(full_path),
+                "layout": layout, "split": split, "class_id": class_id, "class_name": class_name,
+                "size": size, "sha1": sha1, "task_id": None}
+
+    def _scan_classification(self):
+        classes = read_class_list(os.path.join(self.dataset_path, "labels.txt"))
+        for split in SPLITS:
+            split_path = os.path.join(self.dataset_path, split)
+            if not os.path.isdir(split_path):
+                continue
+            for class_dir in os.listdir(split_path):
+                class_path = os.path.join(split_path, class_dir)
+                if not os.path.isdir(class_path) or not class_dir.startswith("class_"):
+                    continue
+                try:
+                    class_id = int(class_dir[len("class_"):])
+                except ValueError:
+                    continue
+                class_name = classes[class_id] if class_id < len(classes) else None
+                for fname in os.listdir(class_path):
+                    if fname.lower().endswith(IMAGE_EXTENSIONS):
+                        yield self._record(os.path.join(class_path, fname), "cls", split, class_id, class_name)
+
+    def _scan_yolo(self):
+        classes = read_class_list(os.path.join(self.dataset_path, "classes.txt"))
+        for split in SPLITS:
+            image_dir = os.path.join(self.dataset_path, "images", split)
+            label_dir = os.path.join(self.dataset_path, "labels", split)
+            if not os.path.isdir(image_dir):
+                continue
+            for fname in os.listdir(image_dir):
+                if not fname.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                label_path = os.path.join(label_dir, os.path.splitext(fname)[0] + ".txt")
+                if not os.path.exists(label_path):
+                    continue
+                with open(label_path, "r", encoding="utf-8") as f:
+                    line = f.readline().strip()
+                if not line.isdigit():
+                    continue
+                class_id = int(line)
+                class_name = classes[class_id] if class_id < len(classes) else None
+                yield self._record(os.path.join(image_dir, fname), "yolo", split, class_id, class_name)
+
+
+def read_manifest(dataset_path, query, empty):
+    """
+    Чтение манифеста без побочных эффектов: для ещё не созданного датасета возвращает empty,
+    не создавая ни папку, ни пустой индекс.
+
+    :param query: Функция manifest -> результат.
+    """
+    if not os.path.isdir(dataset_path):
+        return empty
+    with DatasetManifest(dataset_path) as manifest:
+        return query(manifest)
@@ -0,0 +1,119 @@
+from collections import Counter, defaultdict
+from ls_wb_pipeline.video_names import parse_video_name
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import settings
+import hashlib
+import re
+import os
+
+SPLIT_ORDER = ("train", "val", "test")
+FRAME_NAME = re.compile(r"^(?P<video>.+)_\d{6}$")  # {stem видео}_{номер кадра:06d}, как в extract_frames
+
+
+def source_key(image_name):
+    """Ключ группы для кадра — имя исходного видео, чтобы все его кадры попадали в один сплит."""
+    stem = os.path.splitext(image_name)[0]
+    match = FRAME_NAME.match(stem)
+    video_stem = match.group("video") if match else stem
+    try:
+        return parse_video_name(f"{video_stem}.mp4")[2]
+    except ValueError:
+        return video_stem
+
+
+def hash_unit(key, salt=settings.DATASET_SPLIT_SALT):
+    """Стабильное отображение ключа в [0, 1)."""
+    digest = hashlib.sha1(f"{salt}{key}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+class SplitAssigner:
+    """
+    Детерминированное потоковое распределение по train/val/test со стратификацией по классам.
+    Все кадры одной группы (видео) попадают в один сплит. Новая группа уходит в сплит
+    с наибольшим недобором её основного класса относительно заданных долей, при равенстве —
+    в сплит по стабильному хешу ключа группы. Решение O(1) на кадр, кандидатов в памяти
+    держать не нужно. Группы, уже лежащие в датасете, сохраняют свой сплит.
+    """
+
+    def __init__(self, train_ratio=0.8, val_ratio=0.1, test_ratio=0.1, existing_rows=(),
+                 salt=settings.DATASET_SPLIT_SALT):
+        total = train_ratio + val_ratio + test_ratio
+        ratios = {"train": train_ratio / total, "val": val_ratio / total, "test": test_ratio / total}
+        self.thresholds = []
+        cumulative = 0.0
+        for split in SPLIT_ORDER:
+            cumulative += ratios[split]
+            self.thresholds.append((cumulative, split))
+        self.ratios = ratios
+        self.salt = salt
+        self.counters = defaultdict(Counter)  # класс -> сплит -> количество
+        self.group_classes = {}  # Ключ новой группы -> (основной класс, кадров этого класса), см. prepare
+
+        # Сплит уже известных групп — по большинству их кадров в датасете
+        votes = defaultdict(Counter)
+        for row in existing_rows:
+            votes[source_key(row["image"])][row["split"]] += 1
+            self.counters[row.get("class_name") or row["class_id"]][row["split"]] += 1
+        self.group_splits = {key: counter.most_common(1)[0][0] for key, counter in votes.items()}
+
+    def prepare(self, items):
+        """
+        Необязательный проход по (имя кадра, класс) новых кадров: определяет основной класс
+        и размер каждой новой группы. Без него группа стратифицируется по классу первого кадра.
+        """
+        groups = defaultdict(Counter)
+        for image_name, class_name in items:
+            key = source_key(image_name)
+            if key not in self.group_splits:
+                groups[key][class_name] += 1
+        for key, counter in groups.items():
+            self.group_classes[key] = counter.most_common(1)[0]
+
+    def hash_split(self, key):
+        value = hash_unit(key, self.salt)
+        return next((name for threshold, name in self.thresholds if value < threshold), SPLIT_ORDER[-1])
+
+    def split_for(self, key, class_name=None):
+        split = self.group_splits.get(key)
+        if split is None:
+            class_name, size = self.group_classes.get(key, (class_name, 1))
+            counter = self.counters[class_name]
+            total = sum(counter.values()) + size
+            deficits = {name: round(self.ratios[name] * total - counter[name], 9) for name in SPLIT_ORDER}
+            best = max(deficits.values())
+            candidates = [name for name in SPLIT_ORDER if deficits[name] == best]
+            preferred = self.hash_split(key)
+            split = preferred if preferred in candidates else candidates[0]
+            self.group_splits[key] = split
+        return split
+
+    def assign(self, image_name, class_name):
+        split = self.split_for(source_key(image_name), class_name)
+        self.counters[class_name][split] += 1
+        return split
+
+    def stats(self):
+        result = {}
+        for class_name, counter in self.counters.items():
+            total = sum(counter.values())
+            result[class_name] = {split: {"count": counter[split],
+                                          "share": round(counter[split] / total, 3) if total else 0}
+                                  for split in SPLIT_ORDER}
+        return result
+
+    def check_drift(self, tolerance=settings.DATASET_SPLIT_TOLERANCE, min_images=settings.DATASET_SPLIT_MIN_IMAGES):
+        """:return: Классы и сплиты, чья доля отличается от заданной больше чем на tolerance."""
+        drift = []
+        for class_name, counter in self.counters.items():
+            total = sum(counter.values())
+            if total < min_images:
+                continue
+            for split in SPLIT_ORDER:
+                share = counter[split] / total
+                if abs(share - self.ratios[split]) > tolerance:
+                    drift.append({"class": class_name, "split": split, "share": round(share, 3),
+                                  "expected": round(self.ratios[split], 3)})
+                    logger.warning(f"[SPLIT] Класс {class_name}: доля {split} {share:.2f} "
+                                   f"вместо {self.ratios[split]:.2f} ({total} изображений)")
+        return drift
@@ -0,0 +1,139 @@
+from ls_wb_pipeline.dataset_manifest import DatasetManifest, read_manifest
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import settings
+import shutil
+import os
+
+BLOBS_DIR = "blobs"
+SNAPSHOTS_DIR = "snapshots"
+ARCHIVES_DIR = "archives"  # Кеш ZIP-архивов по версиям
+EXPORTS_DIR = "exports"  # Упакованные для обучения версии (WebDataset, memmap)
+
+
+def blob_path(dataset_path, sha1, ext):
+    return os.path.join(dataset_path, BLOBS_DIR, sha1[:2], f"{sha1}{ext.lower()}")
+
+
+def snapshot_path(dataset_path, version):
+    return os.path.join(dataset_path, SNAPSHOTS_DIR, f"v{version:04d}")
+
+
+def link_replace(src, dst):
+    """Атомарно заменяет dst жёсткой ссылкой на src."""
+    temp_path = dst + ".link"
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    os.link(src, temp_path)
+    os.replace(temp_path, dst)
+
+
+def store_blob(dataset_path, file_path, sha1):
+    """
+    Кладёт файл в хранилище по содержимому (blobs/ab/abcdef....jpg) и превращает
+    file_path в жёсткую ссылку на блоб. Одинаковое содержимое хранится один раз.
+
+    Блоб, рабочий файл и файлы снапшотов — один inode, поэтому права на запись не снимаются
+    (иначе read-only стал бы и рабочий датасет). Неизменяемость — соглашение: изображение
+    датасета нельзя править на месте, только записать новый файл и заменить через os.replace
+    (как copy_images), что разрывает ссылку и не трогает опубликованные версии.
+    """
+    blob = blob_path(dataset_path, sha1, os.path.splitext(file_path)[1])
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    try:
+        os.link(file_path, blob)
+    except FileExistsError:
+        link_replace(blob, file_path)
+    return blob
+
+
+def create_snapshot(dataset_path=settings.DATASET_PATH, layout="cls"):
+    """
+    Публикует неизменяемую версию датасета: дерево жёстких ссылок split/class_N/...
+    по текущему манифесту и копию labels.txt. Стоит только метаданных — данные не копируются.
+
+    :return: Номер версии.
+    """
+    with DatasetManifest(dataset_path) as manifest:
+        version = manifest.next_version()
+        rows = manifest.rows(layout)
+        target = snapshot_path(dataset_path, version)
+        temp_target = target + ".part"
+        if os.path.exists(temp_target):
+            shutil.rmtree(temp_target)
+
+        linked = 0
+        for row in rows:
+            src = os.path.join(dataset_path, row["path"])
+            dst = os.path.join(temp_target, row["path"])
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            try:
+                os.link(src, dst)
+                linked += 1
+            except FileNotFoundError:
+                logger.warning(f"[SNAPSHOT] Нет файла {src}, пропущен")
+
+        labels_file = "labels.txt" if layout == "cls" else "classes.txt"
+        labels_src = os.path.join(dataset_path, labels_file)
+        if os.path.exists(labels_src):
+            os.makedirs(temp_target, exist_ok=True)
+            shutil.copyfile(labels_src, os.path.join(temp_target, labels_file))
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.rename(temp_target, target)
+        manifest.add_snapshot(version, layout, linked)
+
+    logger.info(f"[SNAPSHOT] Опубликована версия {version}: {linked} изображений")
+    prune_snapshots(dataset_path)
+    return version
+
+
+def list_snapshots(dataset_path=settings.DATASET_PATH):
+    snapshots = read_manifest(dataset_path, lambda manifest: manifest.snapshots(), [])
+    for snapshot in snapshots:
+        snapshot["path"] = snapshot_path(dataset_path, snapshot["version"])
+    return snapshots
+
+
+def latest_snapshot(dataset_path=settings.DATASET_PATH):
+    snapshots = list_snapshots(dataset_path)
+    return snapshots[-1] if snapshots else None
+
+
+def delete_snapshot(version, dataset_path=settings.DATASET_PATH):
+    target = snapshot_path(dataset_path, version)
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    with DatasetManifest(dataset_path) as manifest:
+        manifest.remove_snapshot(version)
+    shutil.rmtree(os.path.join(dataset_path, EXPORTS_DIR, f"v{version:04d}"), ignore_errors=True)
+    archives_root = os.path.join(dataset_path, ARCHIVES_DIR)
+    if os.path.isdir(archives_root):
+        for fname in os.listdir(archives_root):
+            if fname.endswith(f"v{version:04d}.zip"):
+                os.remove(os.path.join(archives_root, fname))
+    return gc_blobs(dataset_path)
+
+
+def prune_snapshots(dataset_path=settings.DATASET_PATH, keep=settings.DATASET_KEEP_SNAPSHOTS):
+    """Удаляет старые версии сверх keep последних."""
+    if not keep:
+        return
+    for snapshot in list_snapshots(dataset_path)[:-keep]:
+        delete_snapshot(snapshot["version"], dataset_path)
+
+
+def gc_blobs(dataset_path=settings.DATASET_PATH):
+    """Удаляет блобы, на которые больше не ссылается ни рабочее дерево, ни одна версия."""
+    blobs_root = os.path.join(dataset_path, BLOBS_DIR)
+    removed = 0
+    if not os.path.isdir(blobs_root):
+        return {"removed_blobs": 0}
+    for root, _, files in os.walk(blobs_root):
+        for fname in files:
+            path = os.path.join(root, fname)
+            if os.stat(path).st_nlink == 1:
+                os.remove(path)
+                removed += 1
+    if removed:
+        logger.info(f"[SNAPSHOT] Удалено неиспользуемых блобов: {removed}")
+    return {"removed_blobs": removed}
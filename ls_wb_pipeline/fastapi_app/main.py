@@ -1,8 +1,21 @@
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
 from ls_wb_pipeline.fastapi_app.routes import router
+from ls_wb_pipeline import settings
 import uvicorn
 
-app = FastAPI(title="LS WebDAV Pipeline API")
+
+@asynccontextmanager
+async def lifespan(app):
+    if settings.SERVE_PRELOAD_MODEL:
+        from ls_wb_pipeline import micro_batcher
+        micro_batcher.get_batcher()  # Первый /classify не ждёт загрузки модели
+    yield
+    from ls_wb_pipeline import async_api
+    await async_api.close_clients()
+
+
+app = FastAPI(title="LS WebDAV Pipeline API", lifespan=lifespan)
 
 app.include_router(router)
 
@@ -1,5 +1,5 @@
-from fastapi import APIRouter, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, File, Query, Request, Response, UploadFile
+from fastapi.responses import FileResponse, StreamingResponse
 from ls_wb_pipeline import settings
 from ls_wb_pipeline.fastapi_app import services
 
@@ -12,25 +12,48 @@ def build_dataset(
     val_ratio: float = Query(0.1, description="Валидационная часть"),
     test_ratio: float = Query(0.1, description="Тестовая часть"),
     del_unannotated: bool = Query(True, description="Удалить неразмеченные кадры"),
-    dry_run: bool = Query(default=False, description="Имитация удаления")):
-    return services.enrich_dataset_and_cleanup(dry_run=dry_run,
-        del_unannotated=del_unannotated, train_ratio=train_ratio, test_ratio=test_ratio, val_ratio=val_ratio)
+    dry_run: bool = Query(default=False, description="Имитация удаления"),
+    copy_workers: int = Query(settings.DATASET_COPY_WORKERS, description="Параллельность копирования изображений"),
+    with_yolo: bool = Query(False, description="За тот же проход собрать и YOLO-раскладку"),
+    background: bool = Query(False, description="Запустить фоновой задачей и сразу вернуть её id")):
+    params = dict(dry_run=dry_run, del_unannotated=del_unannotated, train_ratio=train_ratio, test_ratio=test_ratio,
+                  val_ratio=val_ratio, copy_workers=copy_workers, with_yolo=with_yolo)
+    if background:
+        return services.submit_job("build_dataset", services.enrich_dataset_and_cleanup, **params)
+    return services.enrich_dataset_and_cleanup(**params)
 
 @router.get("/analyze-dataset", tags=["dataset"])
-def analyze_dataset():
-    return services.analyze_dataset_service()
+def analyze_dataset(content_duplicates: bool = Query(False, description="Искать дубли по содержимому (sha1/dHash, долго)"),
+                    background: bool = Query(False, description="Запустить фоновой задачей и сразу вернуть её id")):
+    if background:
+        return services.submit_job("analyze_dataset", services.analyze_dataset_service,
+                                   content_duplicates=content_duplicates)
+    return services.analyze_dataset_service(content_duplicates=content_duplicates)
 
 @router.get("/download-dataset", tags=["dataset"])
-def download_dataset():
+def download_dataset(version: int = Query(default=None, description="Версия датасета. По умолчанию — последняя"),
+                     since: int = Query(default=None, description="Только файлы, добавленные после этой версии")):
     try:
-        archive_path = services.get_zip_dataset()
-        return FileResponse(
-            archive_path,
-            media_type="application/zip",
-            filename="dataset.zip"
-        )
+        archive = services.get_zip_dataset(version=version, since=since)
     except FileNotFoundError as e:
         return {"error": str(e)}
+    if archive["path"]:
+        return FileResponse(archive["path"], media_type="application/zip", filename=archive["filename"])
+    return StreamingResponse(archive["stream"], media_type="application/zip",
+                             headers={"Content-Disposition": f'attachment; filename="{archive["filename"]}"'})
+
+@router.get("/snapshots", tags=["dataset"])
+def list_snapshots():
+    return services.list_snapshots_service()
+
+@router.delete("/snapshots/{version}", tags=["dataset"])
+def delete_snapshot(version: int):
+    return services.delete_snapshot_service(version)
+
+@router.post("/export-dataset", tags=["dataset"])
+def export_dataset(export_format: str = Query("webdataset", description="Формат: webdataset (tar-шарды) или memmap (224x224 uint8)"),
+                   version: int = Query(default=None, description="Версия датасета. По умолчанию — последняя")):
+    return services.export_dataset_service(export_format=export_format, version=version)
 
 @router.delete("/del-dataset", tags=["dataset"])
 def delete_dataset():
@@ -43,17 +66,83 @@ def load_frames(max_frames: int = Query(300, description="Максимум ка
                                  description=f"Количество кадров в секунду. "
                                              f"По умолчанию: {settings.FRAMES_PER_SECOND_EURO}fps euro, "
                                              f"{settings.FRAMES_PER_SECOND_BUNKER}fps bunker"),
-                video_name: str = Query(default=None, description="Скачать конкретное видео (можно скачать уже скачанное ранее)")):
-    return services.load_new_frames(max_frames=max_frames, only_cargo_type=only_cargo_type, fps=fps, video_name=video_name)
+                video_name: str = Query(default=None, description="Скачать конкретное видео (можно скачать уже скачанное ранее)"),
+                select_uncertain: bool = Query(default=settings.FRAME_SELECTION_ENABLED,
+                                               description=f"Загружать только кадры, в которых модель не уверена "
+                                                           f"({settings.FRAME_SELECTION_METRIC} в {settings.FRAME_SELECTION_BAND})"),
+                per_video_quota: int = Query(default=settings.FRAME_SELECTION_QUOTA,
+                                             description="Максимум отобранных кадров с одного видео"),
+                background: bool = Query(False, description="Запустить фоновой задачей и сразу вернуть её id")):
+    params = dict(max_frames=max_frames, only_cargo_type=only_cargo_type, fps=fps, video_name=video_name,
+                  select_uncertain=select_uncertain, per_video_quota=per_video_quota)
+    if background:
+        return services.submit_job("load-frames", services.load_new_frames, **params)
+    return services.load_new_frames(**params)
 
 @router.delete("/del-frames", tags=["frames"])
-def delete_frames(
+async def delete_frames(
         dry_run: bool = Query(False, description="Имитация удаления"),
         save_annotated: bool = Query(default=True,
-                                     description="Сохранить уже анотированые кадры?"),):
-    tasks = services.functions.get_all_tasks()
-    return services.cleanup_frames_tasks(tasks=tasks, dry_run=dry_run, save_annotated=save_annotated)
+                                     description="Сохранить уже анотированые кадры?"),
+        background: bool = Query(False, description="Запустить фоновой задачей и сразу вернуть её id")):
+    if background:
+        return services.submit_job("del-frames", services.delete_frames_service,
+                                   dry_run=dry_run, save_annotated=save_annotated)
+    return await services.delete_frames_async(dry_run=dry_run, save_annotated=save_annotated)
 
 @router.delete("/clean-download-history", tags=["service"])
 def clean_download_history():
     return services.clean_downloaded_list()
+
+@router.get("/resilience", tags=["service"])
+def resilience_status():
+    return services.resilience_status_service()
+
+@router.post("/reconcile", tags=["service"])
+def reconcile(dry_run: bool = Query(True, description="Только отчёт о расхождениях"),
+              orphan_frames: str = Query("import", description="Кадры без задач: import/delete/skip"),
+              prune_dataset: bool = Query(False, description="Удалить из датасета изображения без задач")):
+    return services.reconcile_service(dry_run=dry_run, orphan_frames=orphan_frames, prune_dataset=prune_dataset)
+
+@router.post("/preannotate", tags=["frames"])
+def preannotate(dry_run: bool = Query(False, description="Только классифицировать, не загружать предсказания"),
+                limit: int = Query(None, description="Максимум задач за запуск"),
+                backend: str = Query(None, description="Бэкенд инференса (по умолчанию из настроек)")):
+    return services.preannotate_service(dry_run=dry_run, limit=limit, backend=backend)
+
+@router.post("/classify", tags=["inference"])
+async def classify(response: Response, file: UploadFile = File(..., description="Кадр (jpg/png)")):
+    result = await services.classify_service([(file.filename, await file.read())])
+    if result.get("overloaded"):
+        response.status_code = 503
+    if "results" in result:
+        return {**result.pop("results")[0], **result}
+    return result
+
+@router.post("/classify-batch", tags=["inference"])
+async def classify_batch(response: Response, files: list[UploadFile] = File(..., description="Кадры (jpg/png)")):
+    result = await services.classify_service([(file.filename, await file.read()) for file in files])
+    if result.get("overloaded"):
+        response.status_code = 503
+    return result
+
+@router.get("/classify/stats", tags=["inference"])
+def classify_stats():
+    return services.classify_stats_service()
+
+@router.get("/jobs", tags=["jobs"])
+def list_jobs():
+    return services.list_jobs_service()
+
+@router.get("/jobs/{job_id}", tags=["jobs"])
+def get_job(job_id: str):
+    return services.get_job_service(job_id)
+
+@router.post("/jobs/{job_id}/cancel", tags=["jobs"])
+def cancel_job(job_id: str):
+    return services.cancel_job_service(job_id)
+
+@router.get("/jobs/{job_id}/events", tags=["jobs"])
+async def job_events(job_id: str, request: Request):
+    return StreamingResponse(services.job_events(job_id, request), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,35 +1,31 @@
-from ls_wb_pipeline import functions, build_dataset_cls
+from ls_wb_pipeline import functions, labelstudio_api, build_dataset_cls, reconcile, dataset_store, dataset_archive, dataset_export, jobs, resilience
 from ls_wb_pipeline.logger import logger
 from ls_wb_pipeline import settings
-import tempfile
+import asyncio
 import shutil
 import json
 import io
 import os
 
 
-def analyze_dataset_service():
-    result = build_dataset_cls.analyze_classification_dataset(settings.DATASET_PATH)
+def analyze_dataset_service(content_duplicates: bool = False):
+    result = build_dataset_cls.analyze_classification_dataset(settings.DATASET_PATH,
+                                                              content_duplicates=content_duplicates)
     return {"status": "analyzed", "result": result}
 
 
 def cleanup_frames_tasks(tasks, dry_run:bool = False, save_annotated: bool = True):
+    jobs.check_cancelled()  # Дальше удаление задач и файлов — его не прерываем на полпути
+    plan = functions.plan_cleanup(tasks, save_annotated=save_annotated)
     logger.info("Удаление задач labelstudio")
-    deleted_tasks, saved_amount = functions.delete_ls_tasks(tasks=tasks, dry_run=dry_run, save_annotated=save_annotated)
+    tasks_report = None if dry_run else labelstudio_api.bulk_delete_tasks(plan["tasks"])
     logger.info("Удаление файлов с облака")
-    deleted_files_report = functions.clean_cloud_files_from_tasks(
-        tasks=tasks, dry_run=dry_run, save_annotated=save_annotated)
-    logger.info("Удаление завершено")
-    return {"status": "cleaned", "result":
-        {"files": {"deleted_amount": deleted_files_report["deleted_amount"],
-                   "saved_amount": deleted_files_report["saved"],
-                   "deleted": deleted_files_report["deleted"]},
-         "tasks": {"deleted": len(deleted_tasks)},
-                    "saved": saved_amount},
-            "dry_run": dry_run}
+    files_report = functions.delete_files(plan["files"], dry_run=dry_run)
+    return functions.cleanup_report(plan, tasks_report, files_report, dry_run)
 
 def enrich_dataset_and_cleanup(dry_run: bool = True, train_ratio=0.8, test_ratio=0.1, val_ratio=0.1,
-                               del_unannotated: bool = True):
+                               del_unannotated: bool = True, copy_workers: int = settings.DATASET_COPY_WORKERS,
+                               with_yolo: bool = False):
     report =  {
         "status": "dataset built",
         "dry_run": dry_run,
@@ -39,8 +35,10 @@ def enrich_dataset_and_cleanup(dry_run: bool = True, train_ratio=0.8, test_ratio
     report["before"] = analyze_dataset_service()
 
     all_tasks = functions.get_all_tasks()
-    build_dataset_cls.build_classification_dataset(all_tasks, train_ratio=train_ratio, test_ratio=test_ratio, val_ratio=val_ratio)  # нужна будет версия main, принимающая уже загруженные данные
+    build_dataset_cls.build_classification_dataset(all_tasks, train_ratio=train_ratio, test_ratio=test_ratio, val_ratio=val_ratio,
+                                                   copy_workers=copy_workers, with_yolo=with_yolo)  # нужна будет версия main, принимающая уже загруженные данные
 
+    jobs.check_cancelled()
     if del_unannotated:
         delete_report = cleanup_frames_tasks(all_tasks, dry_run=dry_run, save_annotated=True)
         report["delete_report"] = delete_report
@@ -49,20 +47,44 @@ def enrich_dataset_and_cleanup(dry_run: bool = True, train_ratio=0.8, test_ratio
     return report
 
 
-def load_new_frames(max_frames: int = 300, only_cargo_type: str = None, fps: float = None, video_name: str = None):
-    return functions.main_process_new_frames(max_frames=max_frames, only_cargo_type=only_cargo_type, fps=fps, video_name=video_name)
+def delete_frames_service(dry_run: bool = False, save_annotated: bool = True):
+    tasks = functions.get_all_tasks()
+    return cleanup_frames_tasks(tasks=tasks, dry_run=dry_run, save_annotated=save_annotated)
 
 
-def get_zip_dataset():
+async def delete_frames_async(dry_run: bool = False, save_annotated: bool = True):
+    """То же, что delete_frames_service, но на асинхронных клиентах: не занимает поток на время запросов."""
+    from ls_wb_pipeline import async_api
+
+    ls, dav = async_api.get_clients()
+    tasks = await ls.get_all_tasks()
+    jobs.check_cancelled()
+    plan = functions.plan_cleanup(tasks, save_annotated=save_annotated)
+    tasks_report = None if dry_run else await ls.bulk_delete_tasks(plan["tasks"])
+    files_report = await dav.delete_files(plan["files"], dry_run=dry_run)
+    return functions.cleanup_report(plan, tasks_report, files_report, dry_run)
+
+
+def load_new_frames(max_frames: int = 300, only_cargo_type: str = None, fps: float = None, video_name: str = None,
+                    select_uncertain: bool = None, per_video_quota: int = None):
+    return functions.main_process_new_frames(max_frames=max_frames, only_cargo_type=only_cargo_type, fps=fps, video_name=video_name,
+                                             select=select_uncertain, quota=per_video_quota)
+
+
+def get_zip_dataset(version: int = None, since: int = None):
     dataset_dir = settings.DATASET_PATH
     if not os.path.exists(dataset_dir):
         raise FileNotFoundError("Датасет ещё не создан.")
 
-    tmp_dir = tempfile.mkdtemp()
-    archive_path = os.path.join(tmp_dir, "dataset.zip")
-    shutil.make_archive(archive_path[:-4], "zip", dataset_dir)
-
-    return archive_path
+    # Архивируем неизменяемую версию, а не рабочее дерево с блобами
+    snapshots = {s["version"]: s for s in dataset_store.list_snapshots()}
+    if version is None and snapshots:
+        version = max(snapshots)
+    if version is not None and version not in snapshots:
+        raise FileNotFoundError(f"Версия датасета {version} не найдена.")
+    if since is not None and version is None:
+        raise FileNotFoundError("Дельта-архив доступен только для датасета с версиями.")
+    return dataset_archive.get_archive(dataset_dir, version=version, since=since)
 
 def delete_dataset_service():
     if os.path.exists(settings.DATASET_PATH):
@@ -71,7 +93,116 @@ def delete_dataset_service():
     else:
         return {"status": "Датасет не найден", "path": settings.DATASET_PATH}
 
+def list_snapshots_service():
+    return {"snapshots": dataset_store.list_snapshots()}
+
+def delete_snapshot_service(version: int):
+    report = dataset_store.delete_snapshot(version)
+    return {"status": "Версия удалена", "version": version, **report}
+
+def export_dataset_service(export_format: str = "webdataset", version: int = None):
+    return dataset_export.export_dataset(export_format=export_format, version=version)
+
 def clean_downloaded_list():
-    with open(settings.DOWNLOAD_HISTORY_FILE, "w") as f:
-        json.dump([], f)
+    functions.clear_download_history()
     return {"status": "cleaned", "path": settings.DOWNLOAD_HISTORY_FILE}
+
+def reconcile_service(dry_run: bool = True, orphan_frames: str = "import", prune_dataset: bool = False):
+    return reconcile.reconcile(dry_run=dry_run, orphan_frames=orphan_frames, prune_dataset=prune_dataset)
+
+
+def preannotate_service(dry_run: bool = False, limit: int = None, backend: str = None):
+    from ls_wb_pipeline import preannotate  # torch грузится только при вызове предразметки
+    try:
+        return preannotate.preannotate_tasks(limit=limit, backend=backend, dry_run=dry_run)
+    except FileNotFoundError as e:
+        return {"error": str(e)}
+
+
+async def classify_service(images):
+    """
+    images: [(имя файла, байты)]. Декодирование — в пуле потоков, инференс — в общем
+    микробатчере: одновременные запросы считаются одним батчем.
+    """
+    from starlette.concurrency import run_in_threadpool
+    from ls_wb_pipeline import inference, micro_batcher  # torch грузится только при первой классификации
+
+    try:
+        batcher = await run_in_threadpool(micro_batcher.get_batcher)
+    except FileNotFoundError as e:
+        return {"error": str(e)}
+
+    results, indices, tensors = [], [], []
+    for filename, data in images:
+        tensor = await run_in_threadpool(inference.decode_bytes, data)
+        if tensor is None:
+            results.append({"file": filename, "error": "Не удалось декодировать изображение"})
+            continue
+        indices.append(len(results))
+        tensors.append(tensor)
+        results.append({"file": filename})
+
+    # Весь запрос ставится в очередь целиком: при 503 в модель не уходит ни одно изображение
+    try:
+        futures = batcher.submit_many(tensors) if tensors else []
+    except micro_batcher.QueueFull as e:
+        return {"error": str(e), "overloaded": True}
+
+    for index, future in zip(indices, futures):
+        try:
+            class_id, label, confidence = await asyncio.wrap_future(future)
+        except Exception as e:
+            results[index]["error"] = str(e)
+            continue
+        results[index].update({"class_id": class_id, "label": label, "confidence": round(confidence, 4)})
+    return {"results": results, "model": batcher.model_path, "backend": batcher.backend}
+
+
+def classify_stats_service():
+    from ls_wb_pipeline import micro_batcher
+
+    return micro_batcher.batcher_info()
+
+
+def resilience_status_service():
+    return resilience.status()
+
+
+def submit_job(kind, func, **params):
+    """Запускает операцию фоновой задачей; ответ сразу, прогресс — в /jobs/{id}."""
+    return jobs.get_runner().submit(kind, func, **params)
+
+
+def list_jobs_service():
+    return jobs.get_runner().list()
+
+
+def get_job_service(job_id: str):
+    return jobs.get_runner().get(job_id) or {"error": f"Задача {job_id} не найдена"}
+
+
+def cancel_job_service(job_id: str):
+    return jobs.get_runner().cancel(job_id) or {"error": f"Задача {job_id} не найдена"}
+
+
+async def job_events(job_id: str, request=None, interval: float = settings.JOBS_EVENTS_INTERVAL):
+    """
+    Server-sent events: состояние задачи при каждом изменении, поток закрывается по её завершении
+    или когда клиент отключился. Генератор асинхронный и не занимает поток пула на время ожидания.
+    """
+    runner = jobs.get_runner()
+    last = None
+    while True:
+        if request is not None and await request.is_disconnected():
+            return
+        job = runner.get(job_id)
+        if job is None:
+            yield f"event: error\ndata: {json.dumps({'error': f'Задача {job_id} не найдена'}, ensure_ascii=False)}\n\n"
+            return
+        state = (job["status"], job["progress"])
+        if state != last:
+            last = state
+            yield f"data: {json.dumps(job, ensure_ascii=False, default=str)}\n\n"
+        if job["status"] in jobs.FINISHED:
+            return
+        await asyncio.sleep(interval)
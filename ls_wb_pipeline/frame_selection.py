@@ -0,0 +1,62 @@
+from ls_wb_pipeline.inference import BatchClassifier, preprocess, uncertainty
+from ls_wb_pipeline.model_registry import get_model
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import settings
+import heapq
+import os
+
+
+class FrameSelector:
+    """
+    Отбор кадров для разметки по неуверенности текущей модели. Кадры видео оцениваются
+    батчами; из попавших в диапазон метрики остаются quota самых неуверенных.
+    Кандидаты лежат файлами в папке кадров запуска, в памяти — только текущий батч тензоров.
+    """
+
+    def __init__(self, quota=settings.FRAME_SELECTION_QUOTA, metric=settings.FRAME_SELECTION_METRIC,
+                 band=settings.FRAME_SELECTION_BAND, batch_size=settings.INFERENCE_BATCH_SIZE,
+                 model_path=None, backend=None):
+        if metric not in ("margin", "entropy"):
+            raise ValueError(f"Неизвестная метрика отбора кадров: {metric}")
+        loaded = get_model(model_path, backend)
+        self.classifier = BatchClassifier(loaded.model, loaded.class_names, batch_size=batch_size)
+        self.quota = quota
+        self.metric = metric
+        self.low, self.high = band
+        self.pending = []  # (имя, путь, тензор) — ещё не оценены
+        self.kept = []  # min-heap (неуверенность, имя, путь, метрики): на вершине наименее неуверенный — его и вытесняем
+        self.stats = {"scored": 0, "in_band": 0, "kept": 0}
+
+    def add(self, frame_name, frame_path, frame):
+        self.pending.append((frame_name, frame_path, preprocess(frame)))
+        if len(self.pending) >= self.classifier.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        probabilities = self.classifier.probabilities([tensor for _, _, tensor in self.pending])
+        for (frame_name, frame_path, _), probs in zip(self.pending, probabilities):
+            entropy, margin = uncertainty(probs)
+            value = entropy if self.metric == "entropy" else margin
+            self.stats["scored"] += 1
+            if not self.low <= value <= self.high:
+                os.remove(frame_path)
+                continue
+            self.stats["in_band"] += 1
+            score = entropy if self.metric == "entropy" else 1 - margin  # Больше — неувереннее
+            item = (score, frame_name, frame_path, {"entropy": round(entropy, 4), "margin": round(margin, 4)})
+            if not self.quota or len(self.kept) < self.quota:
+                heapq.heappush(self.kept, item)
+            else:
+                dropped = heapq.heappushpop(self.kept, item)
+                os.remove(dropped[2])
+        self.pending = []
+
+    def finish(self):
+        """:return: [(имя, путь, метрики)] отобранных кадров в порядке следования в видео."""
+        self.flush()
+        selected = sorted((name, path, scores) for _, name, path, scores in self.kept)
+        self.stats["kept"] = len(selected)
+        logger.info(f"[SELECT] Отобрано кадров: {self.stats}")
+        return selected
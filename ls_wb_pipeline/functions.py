@@ -1,44 +1,168 @@
 from urllib.parse import urlparse, parse_qs
 from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import labelstudio_api, webdav_api, jobs, resilience
+from ls_wb_pipeline.video_names import parse_video_name  # noqa: F401 — прежняя точка импорта
 from ls_wb_pipeline.settings import *
-from webdav3.client import Client
+from contextlib import contextmanager
 from itertools import islice
 from pathlib import Path
 import subprocess
+import threading
 import requests
 import tempfile
+import hashlib
 import random
+import shutil
+import fcntl
+import uuid
 import json
 import time
 import os
 import cv2
-import re
 
 
 
 
-# Конфигурация WebDAV
-WEBDAV_OPTIONS = {
-    'webdav_hostname': os.environ.get("webdav_host"),
-    'webdav_login': os.environ.get("webdav_login"),
-    'webdav_password': os.environ.get("webdav_password"),
-    'disable_check': True  # Отключает кеширование
-}
-client = Client(WEBDAV_OPTIONS)
+client = webdav_api.get_client()
 
 
 
-# Загруженные файлы
-if os.path.exists(DOWNLOAD_HISTORY_FILE):
+_thread_locks = {"state": threading.Lock(), "manifest": threading.Lock()}
+
+
+@contextmanager
+def shared_state_lock(name="state"):
+    """
+    Эксклюзивный доступ к общему состоянию — между потоками и между процессами (flock).
+    "state" — история загрузок и аренды видео, "manifest" — манифест загруженных кадров.
+    """
+    os.makedirs(LOCKS_DIR, exist_ok=True)
+    with _thread_locks[name], open(os.path.join(LOCKS_DIR, f"{name}.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_download_history():
+    if not os.path.exists(DOWNLOAD_HISTORY_FILE):
+        return set()
     with open(DOWNLOAD_HISTORY_FILE, "r") as f:
-        downloaded_videos = set(json.load(f))
-else:
-    downloaded_videos = set()
+        return set(json.load(f))
+
+
+# Загруженные файлы (снимок истории; актуальная версия — в файле, её перечитывают под блокировкой)
+downloaded_videos = read_download_history()
+
+
+def save_download_history(videos=()):
+    """Read-merge-write: дописывает videos к истории в файле, не затирая записи параллельных запусков."""
+    with shared_state_lock():
+        merged = read_download_history() | set(videos)
+        temp_path = DOWNLOAD_HISTORY_FILE + ".part"
+        with open(temp_path, "w") as f:
+            json.dump(sorted(merged), f)
+        os.replace(temp_path, DOWNLOAD_HISTORY_FILE)
+    downloaded_videos.clear()
+    downloaded_videos.update(merged)
+
+
+def clear_download_history():
+    with shared_state_lock():
+        with open(DOWNLOAD_HISTORY_FILE, "w") as f:
+            json.dump([], f)
+    downloaded_videos.clear()
+
+
+def lease_path(video):
+    return os.path.join(VIDEO_LEASE_DIR, hashlib.sha1(video.encode("utf-8")).hexdigest() + ".json")
+
+
+def claim_video(video, run_id, skip_downloaded=True, ttl=VIDEO_LEASE_TTL):
+    """
+    Берёт видео в аренду для запуска run_id. False, если видео уже обрабатывает другой
+    запуск (аренда не истекла) или, при skip_downloaded, оно уже есть в истории загрузок.
+    """
+    path = lease_path(video)
+    with shared_state_lock():
+        if skip_downloaded and video in read_download_history():
+            return False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lease = json.load(f)
+        except (OSError, ValueError):
+            lease = None
+        if lease and lease["run"] != run_id and lease["expires"] > time.time():
+            logger.debug(f"Видео {video} обрабатывает запуск {lease['run']}, пропуск")
+            return False
+        write_lease(path, video, run_id, ttl)
+    return True
+
+
+def write_lease(path, video, run_id, ttl):
+    os.makedirs(VIDEO_LEASE_DIR, exist_ok=True)
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump({"video": video, "run": run_id, "expires": time.time() + ttl}, f, ensure_ascii=False)
+    os.replace(path + ".part", path)
+
+
+def refresh_video(video, run_id, ttl=VIDEO_LEASE_TTL):
+    """Продлевает аренду, если она всё ещё принадлежит run_id."""
+    path = lease_path(video)
+    with shared_state_lock():
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                if json.load(f)["run"] != run_id:
+                    return False
+        except (OSError, ValueError, KeyError):
+            return False
+        write_lease(path, video, run_id, ttl)
+    return True
+
+
+@contextmanager
+def keep_video_lease(video, run_id, ttl=VIDEO_LEASE_TTL):
+    """
+    Держит аренду взятого claim_video видео, пока идёт обработка: фоновый поток продлевает её
+    каждые ttl/3 секунд, так что долгая нарезка не отдаёт видео другому запуску. На выходе аренда снимается.
+    """
+    stop = threading.Event()
+
+    def refresh_loop():
+        while not stop.wait(ttl / 3):
+            if not refresh_video(video, run_id, ttl):
+                logger.warning(f"Аренда {video} потеряна запуском {run_id}")
+                return
+
+    refresher = threading.Thread(target=refresh_loop, name=f"lease-{run_id}", daemon=True)
+    refresher.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        refresher.join()
+        release_video(video, run_id)
+
+
+def release_video(video, run_id):
+    path = lease_path(video)
+    with shared_state_lock():
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                if json.load(f)["run"] != run_id:
+                    return
+            os.remove(path)
+        except (OSError, ValueError, KeyError):
+            pass
 
 
-def save_download_history():
-    with open(DOWNLOAD_HISTORY_FILE, "w") as f:
-        json.dump(list(downloaded_videos), f)
+def create_workspace(run_id):
+    """Собственные папки запуска для видео и кадров — параллельные запуски не пересекаются по файлам."""
+    workspace = os.path.join(RUNS_DIR, run_id)
+    os.makedirs(os.path.join(workspace, "videos"), exist_ok=True)
+    os.makedirs(os.path.join(workspace, "frames"), exist_ok=True)
+    return workspace
 
 def is_mounted():
     """Проверяет, смонтирована ли папка WebDAV и работает ли соединение."""
@@ -116,10 +240,10 @@ def remount_webdav(from_systemd=False):
         logger.error(f"Ошибка при монтировании WebDAV: {e}")
 
 
-def iter_video_files(path):
+def iter_video_files(path, skip_downloaded=True):
     try:
         items = with_retries(lambda: client.list(path),
-                             log_prefix=f"[WebDAV:list {path}] ")
+                             log_prefix=f"[WebDAV:list {path}] ", endpoint="webdav:propfind")
     except Exception as e:
         logger.error(f"[WebDAV] Ошибка при list({path}): {e}")
         return
@@ -130,7 +254,7 @@ def iter_video_files(path):
             item_path = sanitize_path(f"{path}/{item}")
             if any(reg in item for reg in BLACKLISTED_REGISTRATORS):
                 continue
-            if item_path in downloaded_videos:
+            if skip_downloaded and item_path in downloaded_videos:
                 continue
             yield item_path
 
@@ -144,13 +268,13 @@ def iter_video_files(path):
     for dir_path in dirs:
         try:
             is_directory = with_retries(lambda: client.is_dir(dir_path),
-                                        log_prefix=f"[WebDAV:is_dir {dir_path}] ")
+                                        log_prefix=f"[WebDAV:is_dir {dir_path}] ", endpoint="webdav:propfind")
         except Exception as e:
             logger.warning(f"[WebDAV] Пропущен элемент {dir_path}: {e}")
             continue
         if is_directory:
             # ⚠️ Ключевой момент — `yield from` заменяем на `yield` генератора
-            for video in iter_video_files(dir_path):
+            for video in iter_video_files(dir_path, skip_downloaded):
                 yield video
 
 
@@ -173,7 +297,8 @@ def clean_cloud_files_from_path(json_path, dry_run=False):
         tasks = json.load(f)
     return clean_cloud_files_from_tasks(tasks, dry_run=dry_run)
 
-def clean_cloud_files_from_tasks(tasks, dry_run=False, save_annotated=True):
+def split_task_files(tasks):
+    """Пути кадров задач (d= из URL): (размеченные, неразмеченные)."""
     marked_files = []
     unmarked_files = []
 
@@ -183,7 +308,9 @@ def clean_cloud_files_from_tasks(tasks, dry_run=False, save_annotated=True):
             parsed = urlparse(image_url)
             query = parse_qs(parsed.query)
             image_path = query.get("d", [""])[0]
-            image_name = os.path.basename(image_path)
+            if not os.path.basename(image_path):
+                logger.warning(f"[LS] У задачи {task.get('id')} нет пути к кадру (d=): {image_url}")
+                continue
             if check_if_ann(task):
                 marked_files.append(image_path)
             else:
@@ -191,20 +318,76 @@ def clean_cloud_files_from_tasks(tasks, dry_run=False, save_annotated=True):
         except Exception as e:
             logger.warning(f"[EXC] Ошибка при парсинге имени файла: {e}")
             continue
-    files_to_delete = unmarked_files if save_annotated else marked_files + unmarked_files
-    delete_files(files_to_delete, dry_run=dry_run)
-    logger.info(f"{'[DRY RUN] ' if dry_run else ''}Удаление завершено. Удалено: {len(files_to_delete)}, "
-                f"оставлено: {len(marked_files)}")
-    return {"deleted_amount": len(files_to_delete), "saved": len(marked_files), "deleted": files_to_delete}
+    return marked_files, unmarked_files
+
+
+def clean_cloud_files_from_tasks(tasks, dry_run=False, save_annotated=True):
+    plan = plan_cleanup(tasks, save_annotated=save_annotated)
+    report = delete_files(plan["files"], dry_run=dry_run)
+    deleted = deleted_files(plan, report, dry_run)
+    logger.info(f"{'[DRY RUN] ' if dry_run else ''}Удаление завершено. Удалено: {len(deleted)}, "
+                f"оставлено: {plan['saved_files']}")
+    return {"deleted_amount": len(deleted), "saved": plan["saved_files"], "deleted": deleted,
+            "missing": report["missing"], "failed": report["failed"]}
+
+def plan_cleanup(tasks, save_annotated=True):
+    """
+    Что удалить по списку задач — общий отбор для синхронного и асинхронного удаления.
+
+    :return: {"tasks": id задач, "files": ссылки на кадры, "saved_tasks": n, "saved_files": n}
+    """
+    to_delete = select_tasks_to_delete(tasks, save_annotated=save_annotated)
+    marked_files, unmarked_files = split_task_files(tasks)
+    files = unmarked_files if save_annotated else marked_files + unmarked_files
+    logger.info(f"К удалению отобрано: задач {len(to_delete)}, файлов {len(files)}")
+    return {"tasks": to_delete, "files": files, "saved_tasks": len(tasks) - len(to_delete),
+            "saved_files": len(marked_files) if save_annotated else 0}
+
+
+def deleted_files(plan, files_report, dry_run):
+    """Удалённые (при dry_run — подлежащие удалению) кадры. Неразрешимые ссылки не удаляются и в dry_run."""
+    if not dry_run:
+        return files_report["deleted"]
+    unresolvable = set(files_report["failed"])
+    return [file for file in plan["files"] if file not in unresolvable]
+
+
+def cleanup_report(plan, tasks_report, files_report, dry_run):
+    """
+    Отчёт удаления по плану plan_cleanup.
+
+    :param tasks_report: Отчёт bulk_delete_tasks или None при dry_run.
+    :param files_report: Отчёт delete_remote_files.
+    """
+    deleted_tasks = plan["tasks"] if dry_run else tasks_report["deleted"]
+    files = deleted_files(plan, files_report, dry_run)
+    if tasks_report and tasks_report["failed"]:
+        logger.error(f"[LS] Не удалось удалить {len(tasks_report['failed'])} задач: {tasks_report['failed'][:10]}")
+    logger.info(f"{'[DRY RUN] ' if dry_run else ''}Удаление завершено. Задач: {len(deleted_tasks)} "
+                f"(сохранено {plan['saved_tasks']}), файлов: {len(files)} (сохранено {plan['saved_files']})")
+    return {"status": "cleaned", "result":
+        {"files": {"deleted_amount": len(files),
+                   "saved_amount": plan["saved_files"],
+                   "deleted": files,
+                   "missing": files_report["missing"],
+                   "failed": files_report["failed"]},
+         "tasks": {"deleted": len(deleted_tasks),
+                   "failed": len(tasks_report["failed"]) if tasks_report else 0,
+                   "chunks": tasks_report["chunks"] if tasks_report else []},
+         "saved": plan["saved_tasks"]},
+            "dry_run": dry_run}
+
 
 def check_if_ann(task: dict) -> bool:
     return bool(task.get("annotations"))
 
 def delete_all_cloud_files(dry_run=False):
     try:
-        actual_files = [f for f in os.listdir(MOUNTED_PATH) if f.lower().endswith(".jpg")]
+        items = with_retries(lambda: client.list(REMOTE_FRAME_DIR), log_prefix="[WebDAV:list REMOTE_FRAME_DIR] ",
+                             endpoint="webdav:propfind")
+        actual_files = [f for f in items if f.lower().endswith(".jpg")]
     except Exception as e:
-        logger.error(f"Не удалось прочитать директорию {MOUNTED_PATH}: {e}")
+        logger.error(f"Не удалось прочитать директорию {REMOTE_FRAME_DIR}: {e}")
         return {"error": e}
     report =  delete_files(files=actual_files, dry_run=dry_run)
     report["saved_amount"] = 0
@@ -213,22 +396,15 @@ def delete_all_cloud_files(dry_run=False):
 
 
 def delete_files(files, dry_run=False):
-    deleted_amount = 0
-    deleted = []
-    for file in files:
-        if dry_run:
-            logger.info(f"[DRY RUN] Будет удалено: {file}")
-        else:
-            try:
-                os.remove(os.path.join("/mnt", file))
-                deleted_amount += 1
-                deleted.append(file)
-            except Exception as e:
-                logger.error(f"Ошибка при удалении {file}: {e}")
-    return {"deleted": deleted, "deleted_amount": deleted_amount}
+    """Удаляет кадры напрямую через WebDAV, минуя rclone. Пути берутся из d= задач или имён файлов."""
+    return webdav_api.delete_remote_files(files, dry_run=dry_run)
 
 
-def get_all_tasks():
+def get_all_tasks(strict=False):
+    """
+    :param strict: Вернуть None, если листинг оборвался раньше total (пустая страница или повтор задач),
+                   а не то, что успели получить. Нужен тем, кто по списку задач что-то удаляет.
+    """
     page = 1
     page_size = 100
     all_tasks = []
@@ -259,12 +435,17 @@ def get_all_tasks():
 
         if not page_tasks:
             logger.info("[LS] Получена пустая страница, завершаем.")
+            if strict and total and len(all_tasks) < total:
+                logger.error(f"[LS] Листинг неполный: {len(all_tasks)} из {total}")
+                return
             break
 
         task_ids = [t['id'] for t in page_tasks]
         repeats = [tid for tid in task_ids if tid in seen_ids]
         if repeats:
             logger.warning(f"[LS] Повтор задач: {repeats[:5]} ... ({len(repeats)} всего), остановка.")
+            if strict:
+                return
             break
 
         for task in page_tasks:
@@ -279,11 +460,7 @@ def get_all_tasks():
     return all_tasks
 
 
-def delete_ls_tasks(tasks, dry_run=False, save_annotated=True):
-    saved = 0
-
-    logger.info("[LS] Загружаем все задачи с пагинацией (по страницам)...")
-
+def select_tasks_to_delete(tasks, save_annotated=True):
     to_delete = []
     for task in tasks:
         task_id = task.get("id")
@@ -292,24 +469,19 @@ def delete_ls_tasks(tasks, dry_run=False, save_annotated=True):
             logger.debug(f"[LS DEBUG] Задача {task_id} отмечена под удаление - {'нет аннотаций' if not anns else 'отключено сохранение аннотаций'}")
             to_delete.append(task_id)
             continue
+    return to_delete
 
-    logger.info(f"[LS] К удалению отобрано: {len(to_delete)} задач")
 
-    for task_id in to_delete:
-        if dry_run:
-            logger.debug(f"[DRY RUN] Будет удалена задача {task_id}")
-        else:
-            r = requests.delete(f"{LABELSTUDIO_API_URL}/tasks/{task_id}", headers=HEADERS)
-            if r.status_code == 204:
-                logger.debug(f"[LS DEL] Удалена задача {task_id}")
-            else:
-                logger.error(f"[ERR] Не удалось удалить задачу {task_id} — {r.status_code}: {r.text}")
-    try:
-        saved = len(tasks) - len(to_delete)
-    except:
-        pass
-    logger.info(f"{'[DRY RUN] ' if dry_run else ''}Удаление завершено. Всего удалено: {len(to_delete)}. Сохранено: {saved}")
-    return to_delete, saved
+def delete_ls_tasks(tasks, dry_run=False, save_annotated=True):
+    """:return: (удалённые id, сколько сохранено, отчёт по пачкам bulk_delete_tasks)"""
+    plan = plan_cleanup(tasks, save_annotated=save_annotated)
+    tasks_report = None if dry_run else labelstudio_api.bulk_delete_tasks(plan["tasks"])
+    deleted = plan["tasks"] if dry_run else tasks_report["deleted"]
+    if tasks_report and tasks_report["failed"]:
+        logger.error(f"[LS] Не удалось удалить {len(tasks_report['failed'])} задач: {tasks_report['failed'][:10]}")
+    logger.info(f"{'[DRY RUN] ' if dry_run else ''}Удаление завершено. Всего удалено: {len(deleted)}. "
+                f"Сохранено: {plan['saved_tasks']}")
+    return deleted, plan["saved_tasks"], tasks_report["chunks"] if tasks_report else []
 
 
 def frames_to_video(input_dir, output_video_path, fps=25):
@@ -326,9 +498,41 @@ def frames_to_video(input_dir, output_video_path, fps=25):
     print(f"🎞 Видео сохранено: {output_video_path}")
 
 
-def extract_frames(video_path, frames_per_second: float = None, max_frames: int = None):
-    """Разбивает видео на кадры и загружает в WebDAV с повторной попыткой при ошибках."""
-    local_client = Client(WEBDAV_OPTIONS)
+def upload_frame(local_client, frame_filename, local_frame_path, video_path, scores=None, max_retries=3):
+    """Загружает кадр в WebDAV с повторными попытками и записывает его в манифест загрузок."""
+    remote_frame_path = f"{REMOTE_FRAME_DIR}/{frame_filename}"
+    try:
+        with_retries(lambda: local_client.upload_sync(remote_path=remote_frame_path, local_path=local_frame_path),
+                     max_attempts=max_retries, log_prefix=f"[WebDAV:upload {frame_filename}] ", endpoint="webdav:upload")
+    except Exception as e:
+        logger.error(f"Не удалось загрузить кадр {frame_filename} после {max_retries} попыток: {e}")
+        return False
+    size = os.path.getsize(local_frame_path)
+    os.remove(local_frame_path)
+    record_uploaded_frame(frame_filename, video_path, scores)
+    jobs.progress(frames=1, bytes_uploaded=size)
+    return True
+
+
+def create_frame_selector(select: bool = None, quota: int = None):
+    """Отбор кадров по неуверенности модели; None, если отбор выключен или модель недоступна."""
+    if not (FRAME_SELECTION_ENABLED if select is None else select):
+        return None
+    try:
+        from ls_wb_pipeline.frame_selection import FrameSelector  # torch нужен только при отборе
+        return FrameSelector(quota=FRAME_SELECTION_QUOTA if quota is None else quota)
+    except (FileNotFoundError, ImportError) as e:
+        logger.warning(f"Отбор кадров недоступен ({e}), загружаем все кадры")
+        return None
+
+
+def extract_frames(video_path, frames_per_second: float = None, max_frames: int = None,
+                   select: bool = None, quota: int = None, frame_dir: str = FRAME_DIR_TEMP):
+    """
+    Разбивает видео на кадры и загружает в WebDAV с повторной попыткой при ошибках.
+    С отбором (select) загружаются только кадры, в которых модель не уверена, не больше quota с видео.
+    """
+    local_client = webdav_api.get_client()
     cap = cv2.VideoCapture(video_path)
     existing_frames = count_remote_frames(webdav_client=local_client)
     logger.info(f"Извлекаем кадры из {video_path}. FPS - {frames_per_second}")
@@ -351,62 +555,211 @@ def extract_frames(video_path, frames_per_second: float = None, max_frames: int
     frame_interval = max(int(fps / frames_per_second), 1)
     frame_count = 0
     saved_frame_count = 0
-    max_retries = 3  # Количество повторных попыток при ошибке
+    selector = create_frame_selector(select, quota)
 
     logger.info(
         f"Извлекаем кадры из {video_path} (FPS: {fps}, Интервал: {frame_interval})")
 
     while cap.isOpened():
+        if jobs.cancel_requested():
+            logger.info(f"Задача отменена, нарезка {video_path} остановлена на кадре {frame_count}")
+            break
         ret, frame = cap.read()
         if not ret:
             break
 
         if frame_count % frame_interval == 0:
             frame_filename = f"{Path(video_path).stem}_{saved_frame_count:06d}.jpg"
-            local_frame_path = os.path.join(FRAME_DIR_TEMP, frame_filename)
-            remote_frame_path = f"{REMOTE_FRAME_DIR}/{frame_filename}"
+            local_frame_path = os.path.join(frame_dir, frame_filename)
 
             cv2.imwrite(local_frame_path, frame)
-            if os.path.exists(local_frame_path):
-                success = False
-                for attempt in range(1, max_retries + 1):
-                    try:
-                        local_client.upload_sync(remote_path=remote_frame_path,
-                                                 local_path=local_frame_path)
-                        os.remove(local_frame_path)
-                        success = True
-                        break  # Успешная загрузка, выходим из цикла
-                    except Exception as e:
-                        logger.error(
-                            f"Ошибка при загрузке кадра {frame_filename} (Попытка {attempt}/{max_retries}): {e}")
-                        time.sleep(5)  # Ждем 5 секунд перед повторной попыткой
-
-                if not success:
-                    logger.error(
-                        f"Не удалось загрузить кадр {frame_filename} после {max_retries} попыток.")
-                    cap.release()
-                    return False, video_path, existing_frames
-            else:
+            if not os.path.exists(local_frame_path):
                 logger.warning(
                     f"Предупреждение: Кадр {local_frame_path} не был создан.")
+            elif selector:
+                selector.add(frame_filename, local_frame_path, frame)  # Загрузим после оценки всего видео
+            elif not upload_frame(local_client, frame_filename, local_frame_path, video_path):
+                cap.release()
+                return False, video_path, existing_frames
             saved_frame_count += 1
         frame_count += 1
 
     cap.release()
+    if selector:
+        selected = selector.finish()
+        for index, (frame_filename, local_frame_path, scores) in enumerate(selected):
+            if not upload_frame(local_client, frame_filename, local_frame_path, video_path, scores):
+                for _, rest_path, _ in selected[index + 1:]:
+                    os.remove(rest_path)
+                return False, video_path, existing_frames
+        logger.info(
+            f"Отобрано и загружено {len(selected)} из {saved_frame_count} кадров из {video_path}")
+        return True, video_path, len(selected)
+
     logger.info(
         f"Извлечено и загружено {saved_frame_count} кадров из {video_path}")
     return True, video_path, saved_frame_count
 
 
-def cleanup_videos():
-    """Удаляет локальные видео после обработки."""
-    logger.info("Удаление локальных видео")
-    videos = [os.path.join(LOCAL_VIDEO_DIR, f) for f in
-              os.listdir(LOCAL_VIDEO_DIR) if
-              f.endswith(".mp4")]
-    for video in videos:
-        os.remove(video)
-        logger.debug(f"Deleted {video}")
+def cleanup_videos(workspace):
+    """Удаляет рабочую папку запуска вместе с видео и оставшимися кадрами. Чужие запуски не трогает."""
+    logger.info(f"Удаление рабочей папки запуска {workspace}")
+    shutil.rmtree(workspace, ignore_errors=True)
+
+
+def record_uploaded_frame(frame_name, video_path, scores=None):
+    """Дописывает загруженный кадр в манифест для последующего импорта в Label Studio."""
+    entry = {"frame": frame_name, "video": video_path, "uploaded_at": time.time()}
+    if scores:
+        entry["scores"] = scores  # Неуверенность модели, если кадр прошёл отбор
+    with shared_state_lock("manifest"), open(UPLOAD_MANIFEST_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def read_upload_manifest(path=None):
+    path = path or UPLOAD_MANIFEST_FILE
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"[MANIFEST] Пропущена повреждённая строка: {line[:100]}")
+    return entries
+
+
+def importing_manifests():
+    """Файлы записей, которые сейчас импортируются (или чей импорт упал): <манифест>.<id>.importing"""
+    directory = os.path.dirname(os.path.abspath(UPLOAD_MANIFEST_FILE))
+    prefix = os.path.basename(UPLOAD_MANIFEST_FILE) + "."
+    return [os.path.join(directory, name) for name in os.listdir(directory)
+            if name.startswith(prefix) and name.endswith(".importing")]
+
+
+def pending_upload_frames():
+    """
+    Снимок кадров, загруженных, но ещё не импортированных в LS, — под блокировкой манифеста.
+    Включает и кадры, импорт которых идёт прямо сейчас.
+    """
+    with shared_state_lock("manifest"):
+        entries = read_upload_manifest()
+        for path in importing_manifests():
+            entries.extend(read_upload_manifest(path))
+    return [entry["frame"] for entry in entries]
+
+
+def write_upload_manifest(entries, path=None):
+    path = path or UPLOAD_MANIFEST_FILE
+    temp_path = path + ".part"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(temp_path, path)
+
+
+def take_upload_manifest():
+    """
+    Под блокировкой манифеста переносит его записи в собственный файл <манифест>.<id>.importing
+    и очищает манифест, так что сам импорт идёт без блокировки. Файл держится под flock до конца
+    импорта; файлы упавших импортов (flock свободен) подбираются сюда же.
+
+    :return: (записи, открытый файл с flock или None)
+    """
+    with shared_state_lock("manifest"):
+        entries = read_upload_manifest()
+        for path in importing_manifests():
+            with open(path, "r", encoding="utf-8") as orphan:
+                try:
+                    fcntl.flock(orphan, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # Импорт ещё идёт
+                # Импорт упал: часть записей могла дойти до LS — проверим перед повтором
+                entries.extend({**entry, "retry": True} for entry in read_upload_manifest(path))
+                os.remove(path)
+        if not entries:
+            return [], None
+        path = f"{UPLOAD_MANIFEST_FILE}.{uuid.uuid4().hex[:8]}.importing"
+        write_upload_manifest(entries, path)
+        importing = open(path, "r", encoding="utf-8")
+        fcntl.flock(importing, fcntl.LOCK_EX)
+        write_upload_manifest([])
+    return entries, importing
+
+
+def return_upload_manifest(pending, importing):
+    """Возвращает неимпортированные записи в манифест (к записанным за время импорта) и снимает файл импорта."""
+    with shared_state_lock("manifest"):
+        if pending:
+            write_upload_manifest(read_upload_manifest() + [{**entry, "retry": True} for entry in pending])
+        os.remove(importing.name)
+        importing.close()
+
+
+def import_uploaded_frames():
+    """
+    Регистрирует в Label Studio ровно те кадры, что перечислены в манифесте загрузки,
+    пачками через import API — без пересканирования всей папки с кадрами.
+    Записи забираются из манифеста под блокировкой, импорт идёт без неё: загрузка кадров
+    в параллельных запусках не ждёт Label Studio. Неимпортированные кадры возвращаются
+    в манифест до следующего запуска.
+
+    :return: Отчёт {"imported": n, "already_imported": n, "pending": n}
+    """
+    entries, importing = take_upload_manifest()
+    if not entries:
+        logger.info("[LS] Нет новых кадров для импорта")
+        return {"imported": 0, "already_imported": 0, "pending": 0}
+    pending = entries
+    try:
+        report, pending = import_manifest_entries(entries)
+    finally:
+        return_upload_manifest(pending, importing)
+    return report
+
+
+def import_manifest_entries(entries):
+    """
+    Импортирует записи манифеста. Записи с пометкой retry (пачка уже падала — например, по таймауту,
+    когда LS мог её всё-таки сохранить) сначала сверяются с задачами LS, чтобы не создать дубли.
+
+    :return: (отчёт, неимпортированные записи)
+    """
+    # Один кадр — одна задача, даже если он попал в манифест дважды
+    by_image = {}
+    for entry in entries:
+        task = labelstudio_api.frame_task(entry["frame"])
+        by_image.setdefault(task["data"]["image"], (entry, task))
+
+    already, pending = 0, []
+    retry_frames = {entry["frame"] for entry, _ in by_image.values() if entry.get("retry")}
+    if retry_frames:
+        tasks = get_all_tasks(strict=True)
+        if tasks is None:
+            logger.warning(f"[LS] Не удалось проверить {len(retry_frames)} кадров повторного импорта, отложены")
+            pending = [entry for entry, _ in by_image.values() if entry["frame"] in retry_frames]
+            existing = retry_frames
+        else:
+            existing = set()
+            for task in tasks:
+                try:
+                    existing.add(os.path.basename(webdav_api.resolve_frame_path(task["data"]["image"])[1]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+            already = len(retry_frames & existing)
+        by_image = {image: item for image, item in by_image.items()
+                    if not (item[0].get("retry") and item[0]["frame"] in existing)}
+
+    report = labelstudio_api.import_tasks([task for _, task in by_image.values()])
+    failed_images = {task["data"]["image"] for task in report["failed"]}
+    pending += [entry for image, (entry, _) in by_image.items() if image in failed_images]
+    logger.info(f"[LS] Импортировано задач: {report['imported']}, уже были в LS: {already}, "
+                f"осталось в манифесте: {len(pending)}")
+    return {"imported": report["imported"], "already_imported": already, "pending": len(pending)}, pending
 
 
 def sync_label_studio_storage():
@@ -449,46 +802,50 @@ def delete_blacklisted_files():
 '''
 
 
-def main_process_new_frames(max_frames=7000, only_cargo_type: str = None, fps: float = None, video_name: str = None):
+def main_process_new_frames(max_frames=7000, only_cargo_type: str = None, fps: float = None, video_name: str = None,
+                            select: bool = None, quota: int = None):
     logger.info("\n\U0001f504 Запущен основной цикл создания фреймов")
-    result = process_video_loop(max_frames=max_frames, only_cargo_type=only_cargo_type, fps=fps, concrete_video_name=video_name)
-    remount_webdav()
-    time.sleep(3)
-    sync_label_studio_storage()
-    cleanup_videos()
+    run_id = uuid.uuid4().hex[:8]
+    workspace = create_workspace(run_id)
+    try:
+        result = process_video_loop(max_frames=max_frames, only_cargo_type=only_cargo_type, fps=fps,
+                                    concrete_video_name=video_name, select=select, quota=quota,
+                                    run_id=run_id, workspace=workspace)
+    finally:
+        cleanup_videos(workspace)
+    if LABELSTUDIO_DIRECT_IMPORT:
+        result["import"] = import_uploaded_frames()
+    else:
+        remount_webdav()
+        time.sleep(3)
+        sync_label_studio_storage()
+    result["run_id"] = run_id
     result["status"] = "frames processed"
-    for item in client.list(REMOTE_FRAME_DIR):
-        client.check(item)
     return result
 
 
 
-def with_retries(func, max_attempts=3, delay=1.0, jitter=0.5, exceptions=(Exception,), log_prefix=""):
+def with_retries(func, max_attempts=3, delay=1.0, jitter=0.5, exceptions=(Exception,), log_prefix="", endpoint=None):
+    """
+    Повторяет func() с экспоненциальной паузой. С endpoint вызовы идут через лимитер и
+    размыкатель resilience: при разомкнутой цепи ждём её пробного окна, а не долбим сервер.
+    """
     for attempt in range(1, max_attempts + 1):
         try:
-            return func()
+            return resilience.call(endpoint, func) if endpoint else func()
+        except resilience.CircuitOpen as e:
+            if attempt == max_attempts:
+                raise
+            wait = min(e.retry_after, RESILIENCE_MAX_BACKOFF) + random.uniform(0, jitter)
+            logger.warning(f"{log_prefix}{e}")
+            time.sleep(wait)
         except exceptions as e:
             if attempt == max_attempts:
                 raise
-            logger.warning(f"{log_prefix}Ошибка (попытка {attempt}/{max_attempts}): {e}. Повтор через {delay} сек.")
-            time.sleep(delay + random.uniform(0, jitter))
-
-
-def parse_video_name(video_name: str):
-    """Парсит имя файла и возвращает (reg_id, day, base_name)."""
-    pattern = re.compile(
-        r"(?P<reg_id>[A-Z0-9]+)_(?P<year>\d{4})\.(?P<month>\d{1,2})\.(?P<day>\d{1,2}) "
-        r"(?P<start_time>\d{1,2}\.\d{1,2}\.\d{1,2})-(?P<end_time>\d{1,2}\.\d{1,2}\.\d{1,2})"
-        r"\.(?P<video_format>\w+)"
-    )
-    match = pattern.match(video_name)
-    if not match:
-        raise ValueError(f"Неверный формат имени: {video_name}")
-
-    reg_id = match.group("reg_id")
-    day = f"{match.group('year')}.{match.group('month')}.{match.group('day')}"
-    base_name = video_name.rsplit('.', 1)[0]
-    return reg_id, day, base_name
+            wait = resilience.backoff(attempt, delay, jitter)
+            logger.warning(f"{log_prefix}Ошибка (попытка {attempt}/{max_attempts}): {e}. Повтор через {wait:.1f} сек.")
+            time.sleep(wait)
+
 
 def resolve_video_path(concrete_video_name: str, base_remote_dir: str, client) -> str:
     """
@@ -509,13 +866,15 @@ def resolve_video_path(concrete_video_name: str, base_remote_dir: str, client) -
     return f"{remote_dir}/{mp4_files[0]}"
 
 def top_level_generator():
-    registrators = with_retries(lambda: client.list(BASE_REMOTE_DIR))
+    registrators = with_retries(lambda: client.list(BASE_REMOTE_DIR), endpoint="webdav:propfind")
     for reg in registrators:
         yield sanitize_path(f"{BASE_REMOTE_DIR}/{reg}")
 
-def process_video_loop(max_frames=7000, only_cargo_type: str = None, fps: float = None, concrete_video_name: str = None):
+def process_video_loop(max_frames=7000, only_cargo_type: str = None, fps: float = None, concrete_video_name: str = None,
+                       select: bool = None, quota: int = None, run_id: str = None, workspace: str = None):
     remount_webdav()
-    os.makedirs(LOCAL_VIDEO_DIR, exist_ok=True)
+    run_id = run_id or uuid.uuid4().hex[:8]
+    workspace = workspace or create_workspace(run_id)
     downloaded_video_counter = 0
 
     # Ускоряем поиск видео, распарсив название и выполняя поиск в конкретной папке
@@ -538,11 +897,16 @@ def process_video_loop(max_frames=7000, only_cargo_type: str = None, fps: float
 
     result_dict = {"total_frames_downloaded": 0, "vid_process_results": [], "total_frames_in_storage": 0}
     while True:
+        if jobs.cancel_requested():
+            logger.info("Задача отменена, загрузка видео остановлена")
+            result_dict["cancelled"] = True
+            return result_dict
         # Проверяем количество кадров перед началом обработки видео
         logger.debug("Итерируем генератор...")
         try:
             logger.debug("Считаем количество кадров, которые уже в хранилище...")
-            items = with_retries(lambda: client.list(REMOTE_FRAME_DIR), log_prefix="[WebDAV:list REMOTE_FRAME_DIR] ")
+            items = with_retries(lambda: client.list(REMOTE_FRAME_DIR), log_prefix="[WebDAV:list REMOTE_FRAME_DIR] ",
+                                 endpoint="webdav:propfind")
             frame_count = sum(1 for item in items if item.endswith(".jpg"))
             logger.debug(f"В хранилище {frame_count} кадров")
         except Exception as e:
@@ -600,26 +964,36 @@ def process_video_loop(max_frames=7000, only_cargo_type: str = None, fps: float
             logger.debug(f"Тип груза - {cargo_type}. Но качаем только - {only_cargo_type}, пропуск...")
             continue
 
-        local_path = os.path.join(LOCAL_VIDEO_DIR, current_video_name)
-        logger.info(f"Скачивание {video}")
-        try:
-            temp_path = local_path + ".part"
-            with_retries(lambda: client.download_sync(remote_path=video, local_path=temp_path),
-                         log_prefix=f"[WebDAV:download {video}] ")
-            os.rename(temp_path, local_path)
-            downloaded_videos.add(video)
-            logger.info(f"Скачано {video} в {local_path}")
-            downloaded_video_counter += 1
-        except Exception as e:
-            logger.error(f"Ошибка при скачивании {video}: {e}")
+        # Аренда: параллельный запуск (например, по другому типу груза) это видео не возьмёт
+        if not claim_video(video, run_id, skip_downloaded=not concrete_video_name):
             continue
+        with keep_video_lease(video, run_id):
+            local_path = os.path.join(workspace, "videos", current_video_name)
+            logger.info(f"Скачивание {video}")
+            try:
+                temp_path = local_path + ".part"
+                with_retries(lambda: client.download_sync(remote_path=video, local_path=temp_path),
+                             log_prefix=f"[WebDAV:download {video}] ", endpoint="webdav:download")
+                os.rename(temp_path, local_path)
+                logger.info(f"Скачано {video} в {local_path}")
+                downloaded_video_counter += 1
+                jobs.progress(videos=1, bytes_downloaded=os.path.getsize(local_path))
+            except Exception as e:
+                logger.error(f"Ошибка при скачивании {video}: {e}")
+                continue
 
-        # Нарезаем кадры сразу после скачивания
-        effective_fps = fps if fps is not None else (
-            FRAMES_PER_SECOND_EURO if cargo_type == "euro" else FRAMES_PER_SECOND_BUNKER
-        )
-        logger.info(f"Нарезка кадров из {local_path}. Используется FPS: {effective_fps}")
-        success, video_path, frames = extract_frames(local_path, frames_per_second=effective_fps, max_frames=max_frames)
+            # Нарезаем кадры сразу после скачивания
+            effective_fps = fps if fps is not None else (
+                FRAMES_PER_SECOND_EURO if cargo_type == "euro" else FRAMES_PER_SECOND_BUNKER
+            )
+            logger.info(f"Нарезка кадров из {local_path}. Используется FPS: {effective_fps}")
+            success, video_path, frames = extract_frames(local_path, frames_per_second=effective_fps, max_frames=max_frames,
+                                                         select=select, quota=quota,
+                                                         frame_dir=os.path.join(workspace, "frames"))
+            # В историю — только обработанное целиком: после сбоя или отмены видео возьмёт следующий запуск,
+            # а пока идёт обработка, его защищает аренда
+            if success and not jobs.cancel_requested():
+                save_download_history([video])
         total_frames_in_storage = frame_count + int(frames)
         logger.info(f"Статус: {success}. Кадров {total_frames_in_storage}/{max_frames}")
         if not success:
@@ -630,7 +1004,6 @@ def process_video_loop(max_frames=7000, only_cargo_type: str = None, fps: float
             {"video_path": video_path, "frames": frames, "success": success, "cargo_type": cargo_type})
         result_dict["total_frames_downloaded"] += int(frames)
         result_dict["total_frames_in_storage"] = total_frames_in_storage
-        save_download_history()
         if concrete_video_name:
             break
     return result_dict
@@ -0,0 +1,168 @@
+from concurrent.futures import ThreadPoolExecutor
+from ls_wb_pipeline.model_registry import get_model
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import settings
+import torchvision.transforms as T
+from PIL import Image
+import argparse
+import numpy as np
+import torch
+import math
+import time
+import cv2
+import os
+
+# Как при обучении: Resize((224, 224)) + нормализация ImageNet
+TRANSFORM = T.Compose([
+    T.Resize((224, 224)),
+    T.ToTensor(),
+    T.Normalize([0.485, 0.456, 0.406],
+                [0.229, 0.224, 0.225])
+])
+
+
+def load_checkpoint(model_path, device="cpu"):
+    """Загружает модель из .pt: и целиком сохранённый nn.Module, и чекпойнт yolov5 вида {"model": ...}."""
+    ckpt = torch.load(model_path, map_location=device, weights_only=False)
+    model = ckpt["model"] if isinstance(ckpt, dict) else ckpt
+    return model.float().eval()
+
+
+def preprocess(frame):
+    """BGR-кадр OpenCV -> тензор модели. Исходный массив не меняется и остаётся для рисования."""
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return TRANSFORM(Image.fromarray(rgb))
+
+
+def decode_image(path):
+    """Декодирует файл один раз: (BGR-кадр, тензор) или (None, None), если файл не читается."""
+    frame = cv2.imread(path)
+    if frame is None:
+        return None, None
+    return frame, preprocess(frame)
+
+
+def decode_bytes(data):
+    """То же для содержимого загруженного файла: тензор или None, если это не изображение."""
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) if data else None
+    return None if frame is None else preprocess(frame)
+
+
+def uncertainty(probs):
+    """
+    Неуверенность предсказания по вектору вероятностей:
+    (энтропия, нормированная на log K, в [0, 1]; разница top-1 и top-2 в [0, 1]).
+    """
+    entropy = -(probs * probs.clamp_min(1e-12).log()).sum().item()
+    if len(probs) > 1:
+        top = probs.topk(2).values
+        entropy /= math.log(len(probs))
+        margin = (top[0] - top[1]).item()
+    else:
+        margin = 1.0
+    return entropy, margin
+
+
+def list_images(input_dir, extensions=(".jpg",)):
+    return [os.path.join(input_dir, f) for f in sorted(os.listdir(input_dir)) if f.lower().endswith(extensions)]
+
+
+class BatchClassifier:
+    """
+    Батчевый классификатор на CPU: декодирование и препроцессинг — в пуле потоков,
+    следующий батч готовится, пока модель считает текущий.
+    """
+
+    def __init__(self, model, class_names, batch_size=settings.INFERENCE_BATCH_SIZE,
+                 threads=settings.INFERENCE_THREADS):
+        self.model = model
+        self.class_names = list(class_names)
+        self.batch_size = max(1, batch_size)
+        if threads:
+            torch.set_num_threads(threads)
+
+    def label(self, class_id):
+        return self.class_names[class_id] if class_id < len(self.class_names) else str(class_id)
+
+    def probabilities(self, tensors):
+        """Вероятности классов (N, K) для списка тензоров."""
+        with torch.inference_mode():
+            logits = self.model(torch.stack(tensors))
+            if isinstance(logits, (list, tuple)):
+                logits = logits[0]
+            return logits.softmax(1)
+
+    def predict(self, tensors):
+        """:return: [(class_id, label, уверенность)] для списка тензоров."""
+        confidences, class_ids = self.probabilities(tensors).max(1)
+        return [(int(class_id), self.label(int(class_id)), float(conf))
+                for class_id, conf in zip(class_ids, confidences)]
+
+    def classify_files(self, paths, workers=settings.INFERENCE_DECODE_WORKERS):
+        """
+        Генерирует (path, BGR-кадр, class_id, label, уверенность) в порядке paths.
+        В памяти одновременно не больше двух батчей. Нечитаемые файлы пропускаются.
+        """
+        paths = list(paths)
+        batches = [paths[i:i + self.batch_size] for i in range(0, len(paths), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            def submit(batch):
+                return [(path, pool.submit(decode_image, path)) for path in batch]
+
+            pending = submit(batches[0]) if batches else []
+            for index in range(len(batches)):
+                current = pending
+                pending = submit(batches[index + 1]) if index + 1 < len(batches) else []
+
+                decoded = []
+                for path, future in current:
+                    frame, tensor = future.result()
+                    if frame is None:
+                        logger.warning(f"[INFERENCE] Не удалось прочитать {path}, пропущен")
+                        continue
+                    decoded.append((path, frame, tensor))
+                if not decoded:
+                    continue
+                predictions = self.predict([tensor for _, _, tensor in decoded])
+                for (path, frame, _), prediction in zip(decoded, predictions):
+                    yield (path, frame) + prediction
+
+
+def benchmark(model, class_names, paths, batch_sizes=(1, 8, 32), workers=(1, settings.INFERENCE_DECODE_WORKERS),
+              threads=(settings.INFERENCE_THREADS,)):
+    """Прогоняет paths при разных настройках и возвращает изображений/сек для каждой."""
+    paths = list(paths)
+    results = []
+    for thread_count in threads:
+        for batch_size in batch_sizes:
+            for worker_count in workers:
+                classifier = BatchClassifier(model, class_names, batch_size=batch_size, threads=thread_count)
+                # Прогрев: первый батч не учитываем
+                for _ in classifier.classify_files(paths[:batch_size], workers=worker_count):
+                    pass
+                start = time.perf_counter()
+                processed = sum(1 for _ in classifier.classify_files(paths, workers=worker_count))
+                elapsed = time.perf_counter() - start
+                result = {"batch_size": batch_size, "workers": worker_count, "threads": thread_count,
+                          "images": processed, "seconds": round(elapsed, 2),
+                          "images_per_sec": round(processed / elapsed, 1) if elapsed else None}
+                logger.info(f"[INFERENCE] {result}")
+                results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк батчевой классификации кадров на CPU")
+    parser.add_argument("--model", required=True, help="Путь до .pt")
+    parser.add_argument("--images", required=True, help="Папка с .jpg")
+    parser.add_argument("--backend", default=settings.INFERENCE_BACKEND)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, settings.INFERENCE_DECODE_WORKERS])
+    parser.add_argument("--threads", type=int, nargs="+", default=[settings.INFERENCE_THREADS])
+    args = parser.parse_args()
+
+    images = list_images(args.images)
+    loaded = get_model(args.model, args.backend)
+    for row in benchmark(loaded.model, loaded.class_names, images, args.batch_sizes, args.workers, args.threads):
+        print(f"batch={row['batch_size']:3} workers={row['workers']:2} threads={row['threads']:2} — "
+              f"{row['images_per_sec']} изобр/сек")
@@ -0,0 +1,187 @@
+from concurrent.futures import ThreadPoolExecutor
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import settings
+import contextvars
+import threading
+import uuid
+import json
+import time
+import os
+
+FINISHED = ("done", "failed", "cancelled", "interrupted")
+
+# Задача, в контексте которой выполняется текущий код. Вне фоновой задачи — None,
+# и progress/cancel_requested ничего не делают: функции пайплайна работают как раньше.
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+
+class JobCancelled(Exception):
+    """Задача отменена пользователем."""
+
+
+class Job:
+    def __init__(self, kind, params, job_id=None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.status = "queued"
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.saved_at = 0
+
+    def to_dict(self):
+        with self.lock:
+            return {"id": self.id, "kind": self.kind, "params": self.params, "status": self.status,
+                    "progress": dict(self.progress), "result": self.result, "error": self.error,
+                    "created_at": self.created_at, "started_at": self.started_at, "finished_at": self.finished_at}
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data["kind"], data.get("params", {}), job_id=data["id"])
+        for key in ("status", "progress", "result", "error", "created_at", "started_at", "finished_at"):
+            setattr(job, key, data.get(key, getattr(job, key)))
+        return job
+
+
+class JobRunner:
+    """
+    Очередь фоновых задач API: выполняются в пуле из JOBS_WORKERS потоков,
+    состояние каждой задачи сохраняется в JOBS_DIR/<id>.json и переживает перезапуск
+    (незавершённые на момент остановки получают статус interrupted).
+    """
+
+    def __init__(self, jobs_dir=settings.JOBS_DIR, workers=settings.JOBS_WORKERS):
+        self.jobs_dir = jobs_dir
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self.jobs = {}
+        self.lock = threading.Lock()
+        os.makedirs(jobs_dir, exist_ok=True)
+        self.load()
+
+    def load(self):
+        files = sorted((f for f in os.listdir(self.jobs_dir) if f.endswith(".json")),
+                       key=lambda f: os.path.getmtime(os.path.join(self.jobs_dir, f)))
+        for name in files[-settings.JOBS_KEEP:]:
+            try:
+                with open(os.path.join(self.jobs_dir, name), "r", encoding="utf-8") as f:
+                    job = Job.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"[JOBS] Пропущен повреждённый файл задачи {name}: {e}")
+                continue
+            if job.status not in FINISHED:
+                job.status = "interrupted"
+                job.finished_at = time.time()
+                self.save(job)
+            self.jobs[job.id] = job
+
+    def save(self, job):
+        path = os.path.join(self.jobs_dir, f"{job.id}.json")
+        temp_path = path + ".part"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(job.to_dict(), f, ensure_ascii=False, default=str)
+        os.replace(temp_path, path)
+        job.saved_at = time.time()
+
+    def submit(self, kind, func, **params):
+        """Ставит func(**params) в очередь. :return: описание задачи."""
+        job = Job(kind, params)
+        with self.lock:
+            self.jobs[job.id] = job
+            self.trim()
+        self.save(job)
+        self.pool.submit(self.run, job, func)
+        logger.info(f"[JOBS] Задача {job.id} ({kind}) поставлена в очередь")
+        return job.to_dict()
+
+    def trim(self):
+        finished = [job for job in self.jobs.values() if job.status in FINISHED]
+        for job in sorted(finished, key=lambda job: job.created_at)[:max(0, len(self.jobs) - settings.JOBS_KEEP)]:
+            del self.jobs[job.id]  # Файл остаётся на диске
+
+    def run(self, job, func):
+        if job.cancel_event.is_set():
+            self.finish(job, "cancelled")
+            return
+        with job.lock:
+            job.status = "running"
+            job.started_at = time.time()
+        self.save(job)
+        token = _current_job.set((self, job))
+        try:
+            result = func(**job.params)
+            status = "cancelled" if job.cancel_event.is_set() else "done"
+            self.finish(job, status, result=result)
+        except JobCancelled:
+            self.finish(job, "cancelled")
+        except Exception as e:
+            logger.exception(f"[JOBS] Задача {job.id} ({job.kind}) завершилась ошибкой")
+            self.finish(job, "failed", error=str(e))
+        finally:
+            _current_job.reset(token)
+
+    def finish(self, job, status, result=None, error=None):
+        with job.lock:
+            job.status = status
+            job.result = result
+            job.error = error
+            job.finished_at = time.time()
+        self.save(job)
+        logger.info(f"[JOBS] Задача {job.id} ({job.kind}): {status}")
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        return job.to_dict() if job else None
+
+    def list(self):
+        return [job.to_dict() for job in sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)]
+
+    def cancel(self, job_id):
+        """Отмена кооперативная: задача останавливается в ближайшей точке проверки."""
+        job = self.jobs.get(job_id)
+        if not job:
+            return None
+        if job.status not in FINISHED:
+            job.cancel_event.set()
+            logger.info(f"[JOBS] Запрошена отмена задачи {job_id}")
+        return job.to_dict()
+
+
+def progress(**increments):
+    """Увеличивает счётчики прогресса текущей фоновой задачи (videos=1, frames=1, bytes=n, ...)."""
+    current = _current_job.get()
+    if current is None:
+        return
+    runner, job = current
+    with job.lock:
+        for key, value in increments.items():
+            job.progress[key] = job.progress.get(key, 0) + value
+    if time.time() - job.saved_at >= settings.JOBS_SAVE_INTERVAL:
+        runner.save(job)
+
+
+def cancel_requested():
+    current = _current_job.get()
+    return current is not None and current[1].cancel_event.is_set()
+
+
+def check_cancelled():
+    if cancel_requested():
+        raise JobCancelled()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+    return _runner
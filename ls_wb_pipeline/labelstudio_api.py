@@ -0,0 +1,231 @@
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import jobs
+from ls_wb_pipeline.settings import *
+from urllib.parse import quote
+from xml.etree import ElementTree
+import threading
+import requests
+import os
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Общая сессия Label Studio с пулом keep-alive соединений."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LABELSTUDIO_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(HEADERS)
+            _session = session
+    return _session
+
+
+def chunked(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def delete_task(task_id):
+    """Удаляет одну задачу. Возвращает (task_id, удалена ли)."""
+    try:
+        r = get_session().delete(f"{LABELSTUDIO_API_URL}/tasks/{task_id}", timeout=LABELSTUDIO_TIMEOUT)
+    except requests.RequestException as e:
+        logger.error(f"[ERR] Не удалось удалить задачу {task_id}: {e}")
+        return task_id, False
+    if r.status_code == 204:
+        logger.debug(f"[LS DEL] Удалена задача {task_id}")
+        return task_id, True
+    if r.status_code == 404:
+        # Задачи уже нет — результат тот же, что и при удалении
+        logger.debug(f"[LS DEL] Задача {task_id} уже удалена")
+        return task_id, True
+    logger.error(f"[ERR] Не удалось удалить задачу {task_id} — {r.status_code}: {r.text}")
+    return task_id, False
+
+
+def delete_tasks_one_by_one(task_ids, workers=LABELSTUDIO_DELETE_WORKERS):
+    """Параллельное поштучное удаление через общий пул соединений."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(delete_task, task_ids))
+    deleted = [task_id for task_id, ok in results if ok]
+    failed = [task_id for task_id, ok in results if not ok]
+    return deleted, failed
+
+
+def bulk_delete_chunk(task_ids):
+    """
+    Удаляет пачку задач через data manager action delete_tasks.
+
+    :return: Количество удалённых задач или None, если bulk-эндпоинт недоступен.
+    """
+    r = get_session().post(
+        f"{LABELSTUDIO_API_URL}/dm/actions",
+        params={"id": "delete_tasks", "project": PROJECT_ID},
+        json={"selectedItems": {"all": False, "included": list(task_ids)}},
+        timeout=LABELSTUDIO_TIMEOUT,
+    )
+    if r.status_code in (404, 405, 501):
+        logger.warning(f"[LS] Bulk-удаление недоступно ({r.status_code}), переходим на поштучное")
+        return None
+    r.raise_for_status()
+    try:
+        return int(r.json().get("processed_items", len(task_ids)))
+    except ValueError:
+        return len(task_ids)
+
+
+def bulk_delete_tasks(task_ids, chunk_size=LABELSTUDIO_DELETE_CHUNK):
+    """
+    Удаляет задачи пачками по chunk_size. Если bulk-эндпоинт недоступен или
+    отработал не полностью, пачка дочищается параллельными поштучными запросами.
+
+    :return: Отчёт {"deleted": [...], "failed": [...], "chunks": [...]}
+    """
+    report = {"deleted": [], "failed": [], "chunks": []}
+    bulk_available = True
+
+    for number, chunk in enumerate(chunked(task_ids, chunk_size), start=1):
+        processed = None
+        if bulk_available:
+            try:
+                processed = bulk_delete_chunk(chunk)
+                if processed is None:
+                    bulk_available = False
+            except requests.RequestException as e:
+                logger.error(f"[LS] Ошибка bulk-удаления пачки {number}: {e}")
+
+        if processed is not None and processed >= len(chunk):
+            deleted, failed, method = list(chunk), [], "bulk"
+        else:
+            # Bulk недоступен или удалил не всё — добиваем поштучно (404 считается удалённой)
+            deleted, failed = delete_tasks_one_by_one(chunk)
+            method = "single" if processed is None else "bulk+single"
+
+        report["deleted"].extend(deleted)
+        report["failed"].extend(failed)
+        jobs.progress(tasks=len(deleted))
+        report["chunks"].append({"chunk": number, "size": len(chunk), "deleted": len(deleted),
+                                 "failed": len(failed), "method": method})
+        logger.info(f"[LS] Пачка {number}: удалено {len(deleted)}/{len(chunk)} ({method})")
+    return report
+
+
+def frame_task(frame_name):
+    """Задача Label Studio для кадра из смонтированной папки (local files)."""
+    relative_path = os.path.relpath(os.path.join(MOUNTED_PATH, frame_name), LABELSTUDIO_LOCAL_FILES_ROOT)
+    return {"data": {"image": f"/data/local-files/?d={quote(relative_path, safe='/')}"}}
+
+
+def import_tasks(tasks, batch_size=LABELSTUDIO_IMPORT_BATCH):
+    """
+    Импортирует задачи в проект пачками через /api/projects/{id}/import.
+
+    :return: Отчёт {"imported": n, "failed": [неимпортированные задачи], "batches": [...]}
+    """
+    report = {"imported": 0, "failed": [], "batches": []}
+    for number, batch in enumerate(chunked(tasks, batch_size)):
+        try:
+            r = get_session().post(f"{LABELSTUDIO_API_URL}/projects/{PROJECT_ID}/import",
+                                   json=batch, timeout=LABELSTUDIO_TIMEOUT)
+            ok = r.status_code in (200, 201)
+            if not ok:
+                logger.error(f"[LS] Ошибка импорта пачки {number + 1}: {r.status_code}: {r.text}")
+        except requests.RequestException as e:
+            logger.error(f"[LS] Ошибка импорта пачки {number + 1}: {e}")
+            ok = False
+
+        if ok:
+            report["imported"] += len(batch)
+        else:
+            report["failed"].extend(batch)
+        report["batches"].append({"batch": number + 1, "size": len(batch), "ok": ok})
+        logger.info(f"[LS] Пачка {number + 1}: {'импортировано' if ok else 'ошибка'} {len(batch)} задач")
+    return report
+
+
+def choices_control():
+    """(from_name, to_name) тега Choices из конфигурации разметки проекта."""
+    try:
+        r = get_session().get(f"{LABELSTUDIO_API_URL}/projects/{PROJECT_ID}", timeout=LABELSTUDIO_TIMEOUT)
+        r.raise_for_status()
+        choices = ElementTree.fromstring(r.json().get("label_config", "")).find(".//Choices")
+        if choices is not None and choices.get("name") and choices.get("toName"):
+            return choices.get("name"), choices.get("toName")
+    except (requests.RequestException, ValueError, ElementTree.ParseError) as e:
+        logger.warning(f"[LS] Не удалось прочитать конфигурацию разметки: {e}")
+    return LABELSTUDIO_CHOICES_FROM, LABELSTUDIO_CHOICES_TO
+
+
+def choice_prediction(task_id, label, score, from_name, to_name, model_version):
+    """Предсказание в формате choices — том же, что build_classification_dataset читает из аннотаций."""
+    return {
+        "task": task_id,
+        "model_version": model_version,
+        "score": score,
+        "result": [{"from_name": from_name, "to_name": to_name, "type": "choices",
+                    "value": {"choices": [label]}}],
+    }
+
+
+def create_prediction(prediction):
+    """Загружает одно предсказание через /api/predictions. Возвращает (task_id, успешно ли)."""
+    try:
+        r = get_session().post(f"{LABELSTUDIO_API_URL}/predictions", json=prediction, timeout=LABELSTUDIO_TIMEOUT)
+    except requests.RequestException as e:
+        logger.error(f"[LS] Не удалось загрузить предсказание для задачи {prediction['task']}: {e}")
+        return prediction["task"], False
+    if r.status_code in (200, 201):
+        return prediction["task"], True
+    logger.error(f"[LS] Не удалось загрузить предсказание для задачи {prediction['task']} — {r.status_code}: {r.text}")
+    return prediction["task"], False
+
+
+def import_predictions(predictions, batch_size=LABELSTUDIO_IMPORT_BATCH):
+    """
+    Загружает предсказания пачками через /api/projects/{id}/import/predictions.
+    Если bulk-эндпоинт недоступен, пачки уходят параллельными поштучными запросами.
+
+    :return: Отчёт {"uploaded": [task_id], "failed": [task_id], "batches": [...]}
+    """
+    report = {"uploaded": [], "failed": [], "batches": []}
+    bulk_available = True
+    for number, batch in enumerate(chunked(predictions, batch_size), start=1):
+        ok = False
+        if bulk_available:
+            try:
+                r = get_session().post(f"{LABELSTUDIO_API_URL}/projects/{PROJECT_ID}/import/predictions",
+                                       json=batch, timeout=LABELSTUDIO_TIMEOUT)
+                if r.status_code in (404, 405, 501):
+                    logger.warning(f"[LS] Bulk-загрузка предсказаний недоступна ({r.status_code}), переходим на поштучную")
+                    bulk_available = False
+                elif r.status_code in (200, 201):
+                    ok = True
+                else:
+                    logger.error(f"[LS] Ошибка загрузки пачки предсказаний {number}: {r.status_code}: {r.text}")
+            except requests.RequestException as e:
+                logger.error(f"[LS] Ошибка загрузки пачки предсказаний {number}: {e}")
+
+        if ok:
+            uploaded, failed, method = [p["task"] for p in batch], [], "bulk"
+        else:
+            with ThreadPoolExecutor(max_workers=LABELSTUDIO_PREDICTION_WORKERS) as pool:
+                results = list(pool.map(create_prediction, batch))
+            uploaded = [task_id for task_id, done in results if done]
+            failed = [task_id for task_id, done in results if not done]
+            method = "single"
+
+        report["uploaded"].extend(uploaded)
+        report["failed"].extend(failed)
+        report["batches"].append({"batch": number, "size": len(batch), "uploaded": len(uploaded),
+                                  "failed": len(failed), "method": method})
+        logger.info(f"[LS] Пачка предсказаний {number}: загружено {len(uploaded)}/{len(batch)} ({method})")
+    return report
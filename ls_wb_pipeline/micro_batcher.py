@@ -0,0 +1,157 @@
+from concurrent.futures import Future
+from ls_wb_pipeline.inference import BatchClassifier
+from ls_wb_pipeline.model_registry import get_model
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import settings
+from collections import deque
+import threading
+import queue
+import time
+
+
+class QueueFull(Exception):
+    """Очередь инференса переполнена — запрос стоит повторить позже."""
+
+
+class BatcherStopped(QueueFull):
+    """Батчер остановлен (сервер завершается) — запрос стоит повторить позже."""
+
+
+class MicroBatcher:
+    """
+    Очередь запросов классификации с динамическими микробатчами: выделенный поток
+    собирает запросы, пока батч не заполнится или пока не истечёт max_latency_ms
+    с момента поступления самого старого, и прогоняет их одним вызовом модели.
+    """
+
+    def __init__(self, model_path=None, backend=None, max_batch=settings.INFERENCE_BATCH_SIZE,
+                 max_latency_ms=settings.SERVE_MAX_LATENCY_MS, queue_size=settings.SERVE_QUEUE_SIZE):
+        loaded = get_model(model_path, backend)  # Модель «тёплая» до первого запроса
+        self.classifier = BatchClassifier(loaded.model, loaded.class_names, batch_size=max_batch)
+        self.model_path = loaded.path
+        self.backend = loaded.backend
+        self.max_latency = max_latency_ms / 1000
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.latencies = deque(maxlen=1000)  # Время от постановки в очередь до ответа, сек
+        self.stats = {"requests": 0, "batches": 0, "rejected": 0, "errors": 0}
+        self.stopped = threading.Event()
+        self.submit_lock = threading.Lock()  # Место под весь набор проверяется и занимается атомарно
+        self.thread = threading.Thread(target=self.run, name="inference", daemon=True)
+        self.thread.start()
+
+    def submit(self, tensor):
+        """Ставит препроцессированный тензор в очередь. :return: Future с (class_id, label, уверенность)."""
+        return self.submit_many([tensor])[0]
+
+    def submit_many(self, tensors):
+        """
+        Ставит в очередь все тензоры или ни одного: если места не хватает на весь набор,
+        ничего не отправляется, и модель не считает результаты, которые никто не заберёт.
+
+        :return: Future на каждый тензор.
+        """
+        with self.submit_lock:
+            if self.stopped.is_set():
+                raise BatcherStopped("Очередь инференса остановлена")
+            # Забирает из очереди только поток инференса, так что свободного места под замком не убудет
+            if self.queue.maxsize - self.queue.qsize() < len(tensors):
+                self.stats["rejected"] += len(tensors)
+                raise QueueFull(f"Очередь инференса заполнена ({self.queue.qsize()}/{self.queue.maxsize}, "
+                                f"в запросе {len(tensors)})")
+            enqueued = time.perf_counter()
+            futures = [Future() for _ in tensors]
+            for tensor, future in zip(tensors, futures):
+                self.queue.put_nowait((tensor, future, enqueued))
+        return futures
+
+    def next_batch(self):
+        first = self.queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = first[2] + self.max_latency
+        while len(batch) < self.classifier.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Уже ожидающие запросы забираем и после дедлайна — под нагрузкой батчи остаются полными
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.stopped.set()
+                break
+            batch.append(item)
+        return batch
+
+    def run(self):
+        while not self.stopped.is_set():
+            batch = self.next_batch()
+            if not batch:
+                break
+            try:
+                predictions = self.classifier.predict([tensor for tensor, _, _ in batch])
+            except Exception as e:
+                logger.error(f"[SERVE] Ошибка инференса батча из {len(batch)}: {e}")
+                self.stats["errors"] += len(batch)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            for (_, future, enqueued), prediction in zip(batch, predictions):
+                future.set_result(prediction)
+                self.latencies.append(finished - enqueued)
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+
+    def stop(self):
+        """Останавливает поток инференса; запросы, оставшиеся в очереди, завершаются ошибкой."""
+        with self.submit_lock:
+            self.stopped.set()
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass  # Очередь полна — поток не ждёт в get и выйдет, проверив stopped после текущего батча
+        self.thread.join(timeout=5)
+        error = BatcherStopped("Очередь инференса остановлена до обработки запроса")
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(error)
+
+    def info(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1) if latencies else None
+
+        return {
+            **self.stats,
+            "model": self.model_path,
+            "backend": self.backend,
+            "queue": self.queue.qsize(),
+            "avg_batch": round(self.stats["requests"] / self.stats["batches"], 1) if self.stats["batches"] else None,
+            "latency_ms_p50": percentile(0.5),
+            "latency_ms_p99": percentile(0.99),
+        }
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """Общий батчер процесса; модель загружается при первом обращении."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher()
+    return _batcher
+
+
+def batcher_info():
+    if _batcher is None:
+        return {"status": "not loaded"}
+    return _batcher.info()
@@ -0,0 +1,254 @@
+from ls_wb_pipeline.inference import load_checkpoint, decode_image
+from ls_wb_pipeline.dataset_manifest import read_manifest
+from ls_wb_pipeline.dataset_export import IMAGE_SIZE
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import settings
+import statistics
+import argparse
+import random
+import torch
+import time
+import os
+
+# Файлы экспортированных вариантов лежат рядом с чекпойнтом: best.pt -> best.onnx, best.int8-static.onnx, ...
+BACKEND_SUFFIXES = {
+    "torchscript": ".torchscript.pt",
+    "torchscript-int8": ".int8-dynamic.torchscript.pt",
+    "onnx": ".onnx",
+    "onnx-int8-dynamic": ".int8-dynamic.onnx",
+    "onnx-int8-static": ".int8-static.onnx",
+}
+BACKENDS = ("eager",) + tuple(BACKEND_SUFFIXES)
+
+
+def backend_path(model_path, backend):
+    if backend == "eager":
+        return model_path
+    return os.path.splitext(model_path)[0] + BACKEND_SUFFIXES[backend]
+
+
+def example_input(batch=1):
+    return torch.zeros(batch, 3, IMAGE_SIZE, IMAGE_SIZE)
+
+
+class LogitsModule(torch.nn.Module):
+    """Оставляет только логиты: yolov5 и некоторые модели возвращают кортеж."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        out = self.model(x)
+        return out[0] if isinstance(out, (list, tuple)) else out
+
+
+class OnnxModel:
+    """Сессия ONNX Runtime с интерфейсом модели torch: батч-тензор -> тензор логитов."""
+
+    def __init__(self, path, threads=settings.INFERENCE_THREADS):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or 0
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.path = path
+
+    def __call__(self, batch):
+        logits = self.session.run(None, {self.input_name: batch.numpy()})[0]
+        return torch.from_numpy(logits)
+
+
+def load_backend(model_path, backend="eager"):
+    """Модель нужного бэкенда, готовая к вызову model(batch)."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд инференса: {backend}")
+    if backend == "eager":
+        return load_checkpoint(model_path)
+    path = backend_path(model_path, backend)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Нет {path} — сначала выполните экспорт модели в {backend}")
+    if backend.startswith("torchscript"):
+        return torch.jit.load(path, map_location="cpu").eval()
+    return OnnxModel(path)
+
+
+def save_atomic(out_path, write):
+    temp_path = out_path + ".part"
+    write(temp_path)
+    os.replace(temp_path, out_path)
+    logger.info(f"[EXPORT] Сохранено {out_path}")
+    return out_path
+
+
+def export_torchscript(model, out_path, quantize=False):
+    """Трассировка + freeze. С quantize — динамическая int8-квантизация Linear-слоёв перед трассировкой."""
+    module = LogitsModule(model).eval()
+    if quantize:
+        module = torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(module, example_input()))
+    return save_atomic(out_path, lambda path: traced.save(path))
+
+
+def export_onnx(model, out_path):
+    def write(path):
+        torch.onnx.export(LogitsModule(model).eval(), example_input(), path,
+                          input_names=["images"], output_names=["logits"],
+                          dynamic_axes={"images": {0: "batch"}, "logits": {0: "batch"}},
+                          opset_version=settings.ONNX_OPSET)
+    return save_atomic(out_path, write)
+
+
+def quantize_onnx_dynamic(onnx_path, out_path):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    return save_atomic(out_path, lambda path: quantize_dynamic(onnx_path, path, weight_type=QuantType.QInt8))
+
+
+def split_items(dataset_path, split, limit=None, seed=settings.EXPORT_SHUFFLE_SEED):
+    """(путь, class_id) изображений сплита из манифеста; с limit — детерминированная выборка."""
+    rows = read_manifest(dataset_path, lambda manifest: manifest.rows("cls"), [])
+    items = sorted((os.path.join(dataset_path, row["path"]), row["class_id"]) for row in rows if row["split"] == split)
+    items = [item for item in items if os.path.exists(item[0])]
+    if limit and len(items) > limit:
+        items = random.Random(seed).sample(items, limit)
+    return items
+
+
+def load_tensors(items):
+    tensors, labels = [], []
+    for path, class_id in items:
+        _, tensor = decode_image(path)
+        if tensor is not None:
+            tensors.append(tensor)
+            labels.append(class_id)
+    return tensors, labels
+
+
+def quantize_onnx_static(onnx_path, out_path, dataset_path=settings.DATASET_PATH,
+                         calibration_images=settings.QUANT_CALIBRATION_IMAGES, batch_size=settings.INFERENCE_BATCH_SIZE):
+    """
+    Статическая int8-квантизация (QDQ) в ONNX Runtime с калибровкой активаций на кадрах train-сплита.
+    Для eager-модели torch статическая квантизация потребовала бы переделки архитектуры под QuantStub.
+    """
+    from onnxruntime.quantization import quantize_static, CalibrationDataReader, QuantFormat, QuantType
+
+    tensors, _ = load_tensors(split_items(dataset_path, "train", limit=calibration_images))
+    if not tensors:
+        raise ValueError("Нет изображений train-сплита для калибровки — сначала соберите датасет")
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.batches = iter([{"images": torch.stack(tensors[i:i + batch_size]).numpy()}
+                                 for i in range(0, len(tensors), batch_size)])
+
+        def get_next(self):
+            return next(self.batches, None)
+
+    return save_atomic(out_path, lambda path: quantize_static(
+        onnx_path, path, FrameReader(), quant_format=QuantFormat.QDQ, per_channel=True,
+        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8))
+
+
+def export_model(model_path=settings.MODEL_PATH, backends=tuple(BACKEND_SUFFIXES), dataset_path=settings.DATASET_PATH):
+    """Экспортирует чекпойнт в указанные бэкенды. :return: {backend: путь}"""
+    model = load_checkpoint(model_path)
+    onnx_path = backend_path(model_path, "onnx")
+    exported = {}
+    for backend in backends:
+        out_path = backend_path(model_path, backend)
+        if backend == "torchscript":
+            exported[backend] = export_torchscript(model, out_path)
+        elif backend == "torchscript-int8":
+            exported[backend] = export_torchscript(model, out_path, quantize=True)
+        elif backend == "onnx":
+            exported[backend] = export_onnx(model, out_path)
+        elif backend.startswith("onnx-int8"):
+            if not os.path.exists(onnx_path):
+                export_onnx(model, onnx_path)
+            if backend == "onnx-int8-dynamic":
+                exported[backend] = quantize_onnx_dynamic(onnx_path, out_path)
+            else:
+                exported[backend] = quantize_onnx_static(onnx_path, out_path, dataset_path)
+        else:
+            raise ValueError(f"Неизвестный бэкенд инференса: {backend}")
+    return exported
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def benchmark_backends(model_path=settings.MODEL_PATH, backends=BACKENDS, dataset_path=settings.DATASET_PATH,
+                       split="test", batch_size=settings.INFERENCE_BATCH_SIZE, limit=None):
+    """
+    Сравнивает бэкенды на отложенном сплите: задержка на батч (p50/p95), пропускная способность,
+    совпадение top-1 с eager-моделью и точность относительно разметки датасета.
+    """
+    tensors, labels = load_tensors(split_items(dataset_path, split, limit=limit))
+    if not tensors:
+        return {"error": f"В сплите {split} нет изображений"}
+    batches = [torch.stack(tensors[i:i + batch_size]) for i in range(0, len(tensors), batch_size)]
+
+    if settings.INFERENCE_THREADS:
+        torch.set_num_threads(settings.INFERENCE_THREADS)
+    reference = None
+    results = []
+    for backend in ["eager"] + [b for b in backends if b != "eager"]:  # eager — эталон, считаем первым
+        try:
+            model = load_backend(model_path, backend)
+        except (FileNotFoundError, ImportError) as e:
+            if backend == "eager":
+                # Без эталона top1_agreement сравнивал бы бэкенд с самим собой
+                return {"error": f"Не удалось загрузить эталонную eager-модель: {e}"}
+            results.append({"backend": backend, "error": str(e)})
+            continue
+
+        latencies, predictions = [], []
+        with torch.inference_mode():
+            model(batches[0])  # Прогрев
+            for batch in batches:
+                start = time.perf_counter()
+                logits = model(batch)
+                latencies.append(time.perf_counter() - start)
+                if isinstance(logits, (list, tuple)):
+                    logits = logits[0]
+                predictions.extend(logits.argmax(1).tolist())
+        if backend == "eager":
+            reference = predictions
+
+        result = {
+            "backend": backend,
+            "images": len(predictions),
+            "batch_size": batch_size,
+            "latency_ms_p50": round(statistics.median(latencies) * 1000, 2),
+            "latency_ms_p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "images_per_sec": round(len(predictions) / sum(latencies), 1),
+            "top1_agreement": round(sum(p == r for p, r in zip(predictions, reference)) / len(predictions), 4),
+            # Осмысленна, если модель обучена на том же labels.txt, что и датасет
+            "accuracy": round(sum(p == label for p, label in zip(predictions, labels)) / len(predictions), 4),
+        }
+        logger.info(f"[EXPORT] {result}")
+        results.append(result)
+    return {"split": split, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Экспорт и квантизация классификатора, сравнение бэкендов")
+    parser.add_argument("--model", default=settings.MODEL_PATH)
+    parser.add_argument("--export", nargs="*", default=[], choices=list(BACKEND_SUFFIXES))
+    parser.add_argument("--benchmark", nargs="*", choices=list(BACKENDS), help="Бэкенды для сравнения")
+    parser.add_argument("--split", default="test")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.export:
+        print(export_model(args.model, args.export))
+    if args.benchmark is not None:
+        report = benchmark_backends(args.model, args.benchmark or BACKENDS, split=args.split, limit=args.limit)
+        for row in report.get("results", []):
+            print(row)
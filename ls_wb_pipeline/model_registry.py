@@ -0,0 +1,118 @@
+from ls_wb_pipeline.dataset_manifest import read_class_list
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import settings
+from collections import OrderedDict
+import threading
+import time
+import sys
+import os
+
+
+class LoadedModel:
+    def __init__(self, path, model, class_names, size_bytes, backend="eager"):
+        self.path = path
+        self.backend = backend
+        self.model = model
+        self.class_names = class_names
+        self.size_bytes = size_bytes
+        self.loaded_at = time.time()
+
+
+def model_size_bytes(model):
+    """Память под веса и буферы модели."""
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+    except AttributeError:
+        return 0
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def resolve_class_names(model_path, model=None):
+    """
+    Классы модели: labels.txt рядом с чекпойнтом (у каждой версии свой),
+    иначе labels.txt датасета, иначе model.names из самого чекпойнта.
+    """
+    for labels_path in (os.path.join(os.path.dirname(model_path), "labels.txt"),
+                        os.path.join(settings.DATASET_PATH, "labels.txt")):
+        names = read_class_list(labels_path)
+        if names:
+            return names
+    names = getattr(model, "names", None)
+    if isinstance(names, dict):
+        return [names[k] for k in sorted(names)]
+    return list(names or [])
+
+
+class ModelRegistry:
+    """
+    Ленивый реестр моделей: чекпойнт загружается при первом обращении и остаётся
+    «тёплым» в LRU, пока суммарный размер моделей не превысит max_bytes.
+    Несколько версий и бэкендов модели могут работать одновременно — ключ реестра это (путь, бэкенд).
+    """
+
+    def __init__(self, max_bytes=settings.MODEL_CACHE_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.models = OrderedDict()  # (путь, бэкенд) -> LoadedModel, от давно использованных к недавним
+        self.lock = threading.Lock()
+        self.load_locks = {}  # ключ -> Lock, чтобы одну модель не грузили два потока сразу
+
+    def get(self, model_path=None, backend=None):
+        key = (os.path.abspath(model_path or settings.MODEL_PATH), backend or settings.INFERENCE_BACKEND)
+        with self.lock:
+            loaded = self.models.get(key)
+            if loaded:
+                self.models.move_to_end(key)
+                return loaded
+            load_lock = self.load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self.lock:
+                if key in self.models:
+                    self.models.move_to_end(key)
+                    return self.models[key]
+            loaded = self.load(*key)
+            with self.lock:
+                self.models[key] = loaded
+                self.evict()
+        return loaded
+
+    def load(self, model_path, backend="eager"):
+        if settings.YOLOV5_PATH and settings.YOLOV5_PATH not in sys.path:
+            sys.path.append(settings.YOLOV5_PATH)
+        from ls_wb_pipeline.model_export import load_backend, backend_path  # torch импортируется только здесь
+
+        if not os.path.exists(backend_path(model_path, backend)):
+            raise FileNotFoundError(f"Модель не найдена: {backend_path(model_path, backend)}")
+
+        start = time.perf_counter()
+        model = load_backend(model_path, backend)
+        size_bytes = model_size_bytes(model) or os.path.getsize(backend_path(model_path, backend))
+        loaded = LoadedModel(path=model_path, model=model, class_names=resolve_class_names(model_path, model),
+                             size_bytes=size_bytes, backend=backend)
+        logger.info(f"[MODELS] Загружена {model_path} ({backend}) за {time.perf_counter() - start:.1f} с "
+                    f"({loaded.size_bytes / 1024 / 1024:.1f} МБ, классов: {len(loaded.class_names)})")
+        return loaded
+
+    def evict(self):
+        """Выгружает давно не использованные модели сверх лимита памяти; последнюю не трогает."""
+        while len(self.models) > 1 and sum(m.size_bytes for m in self.models.values()) > self.max_bytes:
+            (path, backend), _ = self.models.popitem(last=False)
+            logger.info(f"[MODELS] Выгружена из памяти {path} ({backend})")
+
+    def unload(self, model_path=None, backend=None):
+        key = (os.path.abspath(model_path or settings.MODEL_PATH), backend or settings.INFERENCE_BACKEND)
+        with self.lock:
+            return self.models.pop(key, None) is not None
+
+    def info(self):
+        with self.lock:
+            return [{"path": m.path, "backend": m.backend, "classes": m.class_names, "size_mb": round(m.size_bytes / 1024 / 1024, 1),
+                     "loaded_at": m.loaded_at} for m in self.models.values()]
+
+
+registry = ModelRegistry()
+
+
+def get_model(model_path=None, backend=None):
+    """Модель из общего реестра процесса (загружается при первом обращении)."""
+    return registry.get(model_path, backend)
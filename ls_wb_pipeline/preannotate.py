@@ -0,0 +1,89 @@
+from ls_wb_pipeline import functions, labelstudio_api
+from ls_wb_pipeline.inference import BatchClassifier
+from ls_wb_pipeline.model_registry import get_model
+from ls_wb_pipeline.dataset_copy import copy_images
+from ls_wb_pipeline.reconcile import task_frame_name
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import settings
+import tempfile
+import json
+import os
+
+
+def load_state(state_file=settings.PREANNOTATE_STATE_FILE):
+    """{версия модели: [task_id, ...]} — задачи, которым предсказания уже загружены."""
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state, state_file=settings.PREANNOTATE_STATE_FILE):
+    temp_path = state_file + ".part"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(temp_path, state_file)
+
+
+def needs_prediction(task, done_ids):
+    """Задача без разметки, без предсказаний в Label Studio и не обработанная прошлыми запусками."""
+    if task["id"] in done_ids:
+        return False
+    if task.get("annotations") or task.get("total_annotations"):
+        return False
+    return not (task.get("predictions") or task.get("total_predictions"))
+
+
+def preannotate_tasks(tasks=None, model_path=None, backend=None, batch_size=settings.PREANNOTATE_BATCH,
+                      limit=None, dry_run=False, source=settings.DATASET_COPY_SOURCE):
+    """
+    Предразметка: классифицирует кадры новых задач пачками и загружает результат
+    в Label Studio как предсказания choices — аннотатору остаётся подтвердить класс.
+    Прогресс сохраняется после каждой пачки, прерванный запуск продолжается с того же места.
+    """
+    if tasks is None:
+        tasks = functions.get_all_tasks() or []
+    loaded = get_model(model_path, backend)
+    model_version = f"{os.path.splitext(os.path.basename(loaded.path))[0]}-{loaded.backend}"
+    state = load_state()
+    done_ids = set(state.get(model_version, []))
+
+    pending = [task for task in tasks if needs_prediction(task, done_ids)]
+    if limit:
+        pending = pending[:limit]
+    report = {"model_version": model_version, "candidates": len(pending), "predicted": 0, "uploaded": 0,
+              "missing": [], "failed": [], "dry_run": dry_run, "classes": {}}
+    if not pending:
+        logger.info("[PREANNOTATE] Нет задач для предразметки")
+        return report
+
+    from_name, to_name = labelstudio_api.choices_control()
+    classifier = BatchClassifier(loaded.model, loaded.class_names, batch_size=settings.INFERENCE_BATCH_SIZE)
+    for number, batch in enumerate(labelstudio_api.chunked(pending, batch_size), start=1):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            by_path = {}
+            for task in batch:
+                frame_name = task_frame_name(task)
+                by_path[os.path.join(temp_dir, f"{task['id']}_{frame_name}")] = (task["id"], frame_name)
+            copy_report = copy_images([(frame_name, path) for path, (_, frame_name) in by_path.items()],
+                                      source=source)
+            report["missing"].extend(copy_report["missing"])
+
+            predictions = []
+            downloaded = [path for path in by_path if os.path.exists(path)]
+            for path, _, _, label, confidence in classifier.classify_files(downloaded):
+                predictions.append(labelstudio_api.choice_prediction(
+                    by_path[path][0], label, round(confidence, 4), from_name, to_name, model_version))
+                report["classes"][label] = report["classes"].get(label, 0) + 1
+        report["predicted"] += len(predictions)
+
+        if dry_run or not predictions:
+            continue
+        upload = labelstudio_api.import_predictions(predictions)
+        report["uploaded"] += len(upload["uploaded"])
+        report["failed"].extend(upload["failed"])
+        done_ids.update(upload["uploaded"])
+        state[model_version] = sorted(done_ids)
+        save_state(state)
+        logger.info(f"[PREANNOTATE] Пачка {number}: загружено {len(upload['uploaded'])}/{len(batch)} предсказаний")
+    return report
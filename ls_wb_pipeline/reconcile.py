@@ -0,0 +1,207 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from ls_wb_pipeline import functions, labelstudio_api, webdav_api
+from ls_wb_pipeline.dataset_manifest import DatasetManifest, read_manifest
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import settings
+from email.utils import parsedate_to_datetime
+import time
+import os
+
+
+# Потерянную разметку (задача размечена, но нет ни кадра, ни изображения в датасете) восстановить
+# не из чего, а удалять задачу с разметкой автоматически нельзя — решает человек. Задачи без
+# ссылки на кадр (нет d=) сопоставить не с чем
+REPORT_ONLY = ("lost_annotations", "unresolvable_tasks")
+
+
+def task_frame_name(task):
+    """Имя кадра, на который ссылается задача (по параметру d= в URL)."""
+    return os.path.basename(webdav_api.resolve_frame_path(task["data"]["image"])[1])
+
+
+def list_dataset_images(dataset_path):
+    """Имя изображения -> пути в датасете классификации (split/class_N/...)."""
+    return read_manifest(dataset_path, lambda manifest: manifest.image_paths("cls"), {})
+
+
+def list_remote_frames(grace=settings.RECONCILE_FRAME_GRACE):
+    """
+    Кадры в REMOTE_FRAME_DIR: (имена, недавние). Недавние — загруженные меньше grace секунд
+    назад: их задача может ещё импортироваться, и сравнивать их рано.
+    """
+    items = functions.with_retries(lambda: functions.client.list(settings.REMOTE_FRAME_DIR, get_info=True),
+                                   log_prefix="[WebDAV:list REMOTE_FRAME_DIR] ", endpoint="webdav:propfind")
+    frames, recent = [], []
+    now = time.time()
+    for item in items:
+        name = os.path.basename(item["path"].rstrip("/"))
+        if item.get("isdir") or not name.lower().endswith(".jpg"):
+            continue
+        try:
+            modified = parsedate_to_datetime(item["modified"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            modified = 0  # Сервер не отдал дату — считаем кадр старым
+        (recent if now - modified < grace else frames).append(name)
+    return frames, recent
+
+
+def compute_drift(tasks, remote_frames, dataset_images, pending_frames=(), recent_frames=()):
+    """
+    Сравнивает три стороны одним проходом множествами.
+
+    :param tasks: Задачи Label Studio.
+    :param remote_frames: Имена кадров в REMOTE_FRAME_DIR.
+    :param dataset_images: Имя -> пути в датасете.
+    :param pending_frames: Кадры из манифеста загрузки, ещё не импортированные в LS.
+    :param recent_frames: Только что загруженные кадры — не считаются кадрами без задач.
+    """
+    tasks_by_frame = defaultdict(list)
+    unresolvable_tasks = []
+    for task in tasks:
+        try:
+            tasks_by_frame[task_frame_name(task)].append(task)
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f"[RECONCILE] У задачи {task.get('id')} нет ссылки на кадр")
+            unresolvable_tasks.append(task.get("id"))
+
+    task_frames = set(tasks_by_frame)
+    remote_frames = set(remote_frames)
+    dataset_names = set(dataset_images)
+
+    frames_without_tasks = remote_frames - task_frames - set(pending_frames)
+    missing_frames = task_frames - remote_frames - set(recent_frames)
+    tasks_without_frames = []
+    lost_annotations = []
+    for name in missing_frames:
+        for task in tasks_by_frame[name]:
+            if not functions.check_if_ann(task):
+                tasks_without_frames.append(task["id"])
+            elif name not in dataset_names:
+                # Разметка есть, но ни кадра, ни изображения в датасете уже нет
+                lost_annotations.append(task["id"])
+
+    # Дубли задач на один кадр: оставляем размеченную (или самую раннюю), лишние неразмеченные удаляем
+    duplicate_tasks = []
+    for name, frame_tasks in tasks_by_frame.items():
+        if len(frame_tasks) < 2 or name in missing_frames:
+            continue
+        keep = max(frame_tasks, key=lambda t: (functions.check_if_ann(t), -t["id"]))
+        duplicate_tasks.extend(t["id"] for t in frame_tasks
+                               if t is not keep and not functions.check_if_ann(t))
+
+    dataset_without_tasks = dataset_names - task_frames
+    return {
+        "frames_without_tasks": sorted(frames_without_tasks),
+        "tasks_without_frames": sorted(tasks_without_frames),
+        "duplicate_tasks": sorted(duplicate_tasks),
+        "lost_annotations": sorted(lost_annotations),
+        "dataset_without_tasks": sorted(dataset_without_tasks),
+        "unresolvable_tasks": sorted(unresolvable_tasks, key=str),
+    }
+
+
+def remove_dataset_images(names, dataset_images):
+    removed = []
+    for name in names:
+        for path in dataset_images.get(name, []):
+            try:
+                os.remove(path)
+                removed.append(path)
+            except FileNotFoundError:
+                removed.append(path)
+            except OSError as e:
+                logger.error(f"[RECONCILE] Не удалось удалить {path}: {e}")
+    with DatasetManifest(settings.DATASET_PATH) as manifest:
+        manifest.remove([os.path.relpath(path, settings.DATASET_PATH) for path in removed])
+    return {"removed": len(removed)}
+
+
+def load_sides():
+    """
+    Задачи LS, кадры в REMOTE_FRAME_DIR, датасет и ещё не импортированные кадры.
+    Неполный листинг любой стороны выглядел бы как расхождение и «чинился» бы удалением,
+    поэтому при первой же ошибке возвращается {"error", "side"} и сверка прерывается.
+
+    Порядок важен: манифест загрузки -> кадры -> задачи. Кадр, импортированный между
+    снимком манифеста и листингом задач, окажется в задачах, а загруженный после снимка
+    манифеста — среди недавних кадров, так что «кадром без задачи» он не станет.
+    """
+    loaders = {
+        "pending_frames": functions.pending_upload_frames,
+        "remote_frames": list_remote_frames,
+        "dataset_images": lambda: list_dataset_images(settings.DATASET_PATH),
+        "tasks": lambda: functions.get_all_tasks(strict=True),
+    }
+    sides = {}
+    for side, load in loaders.items():
+        try:
+            sides[side] = load()
+        except Exception as e:
+            logger.error(f"[RECONCILE] Не удалось получить {side}: {e}. Сверка прервана")
+            return {"error": f"Не удалось получить {side}: {e}", "side": side}
+        if sides[side] is None:
+            logger.error(f"[RECONCILE] Листинг {side} неполный. Сверка прервана")
+            return {"error": f"Не удалось получить полный список {side}", "side": side}
+    sides["remote_frames"], sides["recent_frames"] = sides["remote_frames"]
+    return sides
+
+
+def reconcile(dry_run=True, orphan_frames="import", prune_dataset=False):
+    """
+    Сверяет задачи Label Studio, кадры в WebDAV и локальный датасет и чинит расхождения.
+    Разделы из REPORT_ONLY только попадают в отчёт: автоматической починки у них нет.
+
+    :param dry_run: Только отчёт, без изменений.
+    :param orphan_frames: Что делать с кадрами без задач: "import", "delete" или "skip".
+    :param prune_dataset: Удалять из датасета изображения, чьи задачи удалены.
+    """
+    logger.info("[RECONCILE] Получаем задачи, кадры и датасет...")
+    sides = load_sides()
+    if "error" in sides:
+        return sides
+
+    drift = compute_drift(sides["tasks"], sides["remote_frames"], sides["dataset_images"], sides["pending_frames"],
+                          sides["recent_frames"])
+    report = {"dry_run": dry_run,
+              "recent_frames_skipped": len(sides["recent_frames"]),
+              "summary": {key: len(value) for key, value in drift.items()},
+              "drift": drift,
+              "report_only": list(REPORT_ONLY),
+              "repairs": {}}
+    logger.info(f"[RECONCILE] Расхождения: {report['summary']}")
+    if dry_run:
+        return report
+
+    repairs = {}
+    if drift["tasks_without_frames"] or drift["duplicate_tasks"]:
+        repairs["tasks"] = lambda: labelstudio_api.bulk_delete_tasks(
+            drift["tasks_without_frames"] + drift["duplicate_tasks"])
+    if drift["frames_without_tasks"] and orphan_frames == "import":
+        repairs["frames"] = lambda: labelstudio_api.import_tasks(
+            [labelstudio_api.frame_task(name) for name in drift["frames_without_tasks"]])
+    elif drift["frames_without_tasks"] and orphan_frames == "delete":
+        repairs["frames"] = lambda: webdav_api.delete_remote_files(drift["frames_without_tasks"])
+    if drift["dataset_without_tasks"] and prune_dataset:
+        repairs["dataset"] = lambda: remove_dataset_images(drift["dataset_without_tasks"], sides["dataset_images"])
+
+    # Починки независимы друг от друга — запускаем одновременно
+    with ThreadPoolExecutor(max_workers=max(len(repairs), 1)) as pool:
+        futures = {name: pool.submit(repair) for name, repair in repairs.items()}
+    for name, future in futures.items():
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"[RECONCILE] Ошибка починки {name}: {e}")
+            report["repairs"][name] = {"error": str(e)}
+            continue
+        if name == "tasks":
+            report["repairs"][name] = {"deleted": len(result["deleted"]), "failed": result["failed"]}
+        elif name == "frames" and orphan_frames == "import":
+            report["repairs"][name] = {"imported": result["imported"], "failed": len(result["failed"])}
+        elif name == "frames":
+            report["repairs"][name] = {key: result[key] for key in ("deleted_amount", "missing", "failed")}
+        else:
+            report["repairs"][name] = result
+    logger.info(f"[RECONCILE] Починки: {report['repairs']}")
+    return report
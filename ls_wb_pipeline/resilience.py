@@ -0,0 +1,241 @@
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import settings
+import threading
+import asyncio
+import random
+import time
+
+
+class CircuitOpen(Exception):
+    """Эндпоинт временно отключён: слишком много ошибок подряд."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"[RESILIENCE] {name}: цепь разомкнута, повтор через {retry_after:.1f} сек.")
+        self.retry_after = retry_after
+
+
+def backoff(attempt, delay=1.0, jitter=0.5):
+    """Экспоненциальная пауза перед попыткой attempt + 1: delay, 2·delay, 4·delay, ... не больше RESILIENCE_MAX_BACKOFF."""
+    return min(delay * 2 ** (attempt - 1), settings.RESILIENCE_MAX_BACKOFF) + random.uniform(0, jitter)
+
+
+class Endpoint:
+    """
+    Состояние одного удалённого эндпоинта: EWMA задержки и доли ошибок, AIMD-лимит
+    одновременных запросов и автомат размыкателя цепи (closed -> open -> half-open -> closed).
+
+    Успешный быстрый запрос поднимает лимит на 1/limit (≈ +1 за «окно» запросов),
+    ошибка или задержка выше базовой в RESILIENCE_LATENCY_TOLERANCE раз — делит его пополам
+    не чаще раза в RESILIENCE_DECREASE_COOLDOWN секунд.
+
+    В half-open пропускается ровно один пробный запрос, и только его результат замыкает
+    или снова размыкает цепь. Результаты запросов, начатых до размыкания, на состояние не влияют.
+    """
+
+    def __init__(self, name, latency_aware=True):
+        self.name = name
+        self.latency_aware = latency_aware  # Для скачивания больших файлов задержка зависит от размера, а не от сервера
+        self.condition = threading.Condition()
+        self.limit = float(settings.RESILIENCE_INITIAL_LIMIT)
+        self.in_flight = 0
+        self.latency = None  # EWMA, сек
+        self.baseline = None  # Задержка здорового сервера: минимум, медленно подтягивающийся вверх
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.requests_since_close = 0  # Для порога доли ошибок: EWMA сбрасывается при замыкании
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probe = None  # Билет пробного запроса в half-open
+        self.last_decrease = 0.0
+        self.stats = {"requests": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def retry_after(self):
+        return max(0.0, self.opened_at + settings.RESILIENCE_OPEN_SECONDS - time.time())
+
+    def acquire(self):
+        """
+        Ждёт свободного слота в пределах лимита. Разомкнутая цепь — сразу CircuitOpen.
+
+        :return: Билет (время начала, пробный ли запрос) — передаётся в release.
+        """
+        with self.condition:
+            while True:
+                if self.state == "open":
+                    if self.retry_after() > 0:
+                        self.stats["rejected"] += 1
+                        raise CircuitOpen(self.name, self.retry_after())
+                    self.state = "half-open"
+                    logger.info(f"[RESILIENCE] {self.name}: пробный запрос после паузы")
+                if self.state == "half-open":
+                    # Запросы, начатые до размыкания, ещё могут висеть — пробу пропускаем независимо от них
+                    if self.probe is None:
+                        self.probe = (time.time(), True)
+                        self.in_flight += 1
+                        return self.probe
+                elif self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return time.time(), False
+                self.condition.wait(timeout=1.0)
+
+    def release(self, ticket, elapsed, ok):
+        alpha = settings.RESILIENCE_EWMA_ALPHA
+        started, is_probe = ticket
+        with self.condition:
+            self.in_flight -= 1
+            self.stats["requests"] += 1
+            if is_probe and ticket is self.probe:
+                self.probe = None
+                if ok:
+                    self.consecutive_failures = 0
+                    self.close()
+                else:
+                    self.stats["failures"] += 1
+                    self.consecutive_failures += 1
+                    self.open()
+                self.condition.notify_all()
+                return
+            if self.state != "closed" or started < self.opened_at:
+                # Ответ на запрос из времени до размыкания: о нынешнем здоровье сервера не говорит
+                if not ok:
+                    self.stats["failures"] += 1
+                self.condition.notify_all()
+                return
+            self.requests_since_close += 1
+            self.error_rate += alpha * ((0.0 if ok else 1.0) - self.error_rate)
+            if ok:
+                self.consecutive_failures = 0
+                self.latency = elapsed if self.latency is None else self.latency + alpha * (elapsed - self.latency)
+                if self.baseline is None or elapsed < self.baseline:
+                    self.baseline = elapsed
+                else:
+                    self.baseline += 0.01 * (elapsed - self.baseline)
+                slow = self.latency_aware and elapsed > self.baseline * settings.RESILIENCE_LATENCY_TOLERANCE
+                if slow:
+                    self.decrease()
+                else:
+                    self.limit = min(float(settings.RESILIENCE_MAX_LIMIT), self.limit + 1 / self.limit)
+            else:
+                self.stats["failures"] += 1
+                self.consecutive_failures += 1
+                self.decrease()
+                if self.should_open():
+                    self.open()
+            self.condition.notify_all()
+
+    def abandon(self, ticket):
+        """Возвращает слот запроса, который так и не был отправлен (отмена до начала). Исход не учитывается."""
+        with self.condition:
+            self.in_flight -= 1
+            if ticket is self.probe:
+                self.probe = None  # Пробу возьмёт следующий запрос
+            self.condition.notify_all()
+
+    def decrease(self):
+        now = time.time()
+        if now - self.last_decrease >= settings.RESILIENCE_DECREASE_COOLDOWN:
+            self.limit = max(1.0, self.limit * settings.RESILIENCE_DECREASE_FACTOR)
+            self.last_decrease = now
+
+    def should_open(self):
+        return (self.consecutive_failures >= settings.RESILIENCE_FAILURE_THRESHOLD
+                or (self.requests_since_close >= settings.RESILIENCE_MIN_REQUESTS
+                    and self.error_rate >= settings.RESILIENCE_ERROR_RATE_OPEN))
+
+    def open(self):
+        self.state = "open"
+        self.opened_at = time.time()
+        self.limit = 1.0
+        self.stats["opened"] += 1
+        logger.warning(f"[RESILIENCE] {self.name}: цепь разомкнута на {settings.RESILIENCE_OPEN_SECONDS} сек. "
+                       f"(ошибок подряд: {self.consecutive_failures}, доля ошибок: {self.error_rate:.2f})")
+
+    def close(self):
+        self.state = "closed"
+        self.error_rate = 0.0
+        self.requests_since_close = 0
+        logger.info(f"[RESILIENCE] {self.name}: эндпоинт снова доступен")
+
+    def info(self):
+        with self.condition:
+            return {
+                **self.stats,
+                "state": self.state,
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+                "baseline_ms": round(self.baseline * 1000, 1) if self.baseline is not None else None,
+                "error_rate": round(self.error_rate, 3),
+                "retry_after": round(self.retry_after(), 1) if self.state == "open" else None,
+            }
+
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+
+def get_endpoint(name):
+    with _endpoints_lock:
+        if name not in _endpoints:
+            _endpoints[name] = Endpoint(name, latency_aware=name not in settings.RESILIENCE_LATENCY_BLIND)
+        return _endpoints[name]
+
+
+def counts_as_failure(exc):
+    """Ошибки клиента (404, 403, ...) говорят о запросе, а не о здоровье сервера."""
+    code = getattr(exc, "code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(code, int):
+        return code >= 500 or code == 429
+    return type(exc).__name__ not in ("RemoteResourceNotFound", "RemoteParentNotFound")
+
+
+def call(name, func, is_failure=None):
+    """
+    Выполняет func() через лимитер и размыкатель эндпоинта name. Исключение — ошибка сервера,
+    если это не ошибка клиента; is_failure(результат) позволяет считать ошибкой и ответ (HTTP 5xx).
+    """
+    endpoint = get_endpoint(name)
+    ticket = endpoint.acquire()
+    started = time.perf_counter()
+    ok = True
+    try:
+        result = func()
+        ok = not (is_failure and is_failure(result))
+        return result
+    except Exception as e:
+        ok = not counts_as_failure(e)
+        raise
+    finally:
+        endpoint.release(ticket, time.perf_counter() - started, ok)
+
+
+async def call_async(name, func, is_failure=None):
+    """То же, что call, для корутин: слот лимитера ждём в потоке, чтобы не блокировать цикл событий."""
+    endpoint = get_endpoint(name)
+    acquiring = asyncio.ensure_future(asyncio.to_thread(endpoint.acquire))
+    try:
+        ticket = await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        # Поток всё равно может получить слот (или пробу half-open) — вернём его, когда получит
+        def abandon(future):
+            if not future.cancelled() and future.exception() is None:
+                endpoint.abandon(future.result())
+
+        acquiring.add_done_callback(abandon)
+        raise
+    started = time.perf_counter()
+    ok = True
+    try:
+        result = await func()
+        ok = not (is_failure and is_failure(result))
+        return result
+    except Exception as e:
+        ok = not counts_as_failure(e)
+        raise
+    finally:
+        endpoint.release(ticket, time.perf_counter() - started, ok)
+
+
+def status():
+    with _endpoints_lock:
+        endpoints = list(_endpoints.values())
+    return {endpoint.name: endpoint.info() for endpoint in endpoints}
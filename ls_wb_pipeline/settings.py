@@ -26,4 +26,81 @@ MOUNTED_PATH = "/mnt/webdav_frames"  # Локальный путь для мон
 FRAMES_PER_SECOND_EURO = 1
 FRAMES_PER_SECOND_BUNKER = 0.2
 WEBDAV_REMOTE = "webdav:/Tracker/annotation_frames"
-DOWNLOAD_HISTORY_FILE = "downloaded_videos.json"
\ No newline at end of file
+DOWNLOAD_HISTORY_FILE = "downloaded_videos.json"
+LABELSTUDIO_TIMEOUT = 30  # Таймаут HTTP-запросов к Label Studio (сек)
+LABELSTUDIO_POOL_SIZE = 16  # Размер пула соединений к Label Studio
+LABELSTUDIO_DELETE_CHUNK = 500  # Сколько задач удалять одним bulk-запросом
+LABELSTUDIO_DELETE_WORKERS = 8  # Параллельность поштучного удаления (fallback)
+LABELSTUDIO_DIRECT_IMPORT = True  # Импортировать загруженные кадры напрямую вместо синхронизации хранилища
+LABELSTUDIO_IMPORT_BATCH = 500  # Сколько задач импортировать одним запросом
+LABELSTUDIO_LOCAL_FILES_ROOT = "/mnt"  # LOCAL_FILES_DOCUMENT_ROOT в Label Studio
+UPLOAD_MANIFEST_FILE = "uploaded_frames.jsonl"  # Кадры, загруженные, но ещё не импортированные в LS
+RECONCILE_FRAME_GRACE = 900  # Кадры моложе N секунд сверка не трогает: их задача может ещё импортироваться
+WEBDAV_TIMEOUT = 30  # Таймаут прямых HTTP-запросов к WebDAV (сек)
+WEBDAV_POOL_SIZE = 16  # Размер пула соединений к WebDAV
+WEBDAV_RETRIES = 3  # Попыток на одну операцию с WebDAV
+WEBDAV_DELETE_WORKERS = 16  # Параллельность удаления кадров с WebDAV
+DATASET_COPY_WORKERS = 16  # Параллельность копирования изображений в датасет
+DATASET_COPY_SOURCE = "webdav"  # Откуда брать изображения: "webdav" (напрямую) или "mount" (через rclone)
+DATASET_KEEP_SNAPSHOTS = 10  # Сколько последних версий датасета хранить (0 — все)
+DUPLICATE_HASH_WORKERS = os.cpu_count() or 2  # Процессов для подсчёта хешей изображений
+NEAR_DUPLICATE_DISTANCE = 4  # Макс. расстояние Хэмминга между dHash, чтобы считать кадры почти одинаковыми
+EXPORT_SHARD_SIZE = 1000  # Изображений в одном tar-шарде WebDataset
+EXPORT_SHUFFLE_SEED = 42  # Сид перемешивания при экспорте
+EXPORT_WORKERS = os.cpu_count() or 2  # Процессов для ресайза при экспорте в memmap
+DATASET_SPLIT_SALT = ""  # Соль хеша распределения по сплитам (смена перетасует новые видео)
+DATASET_SPLIT_TOLERANCE = 0.1  # Допустимое отклонение доли сплита у класса от заданной, иначе предупреждение
+DATASET_SPLIT_MIN_IMAGES = 50  # Классы меньше этого не проверяются: видео целиком попадает в один сплит
+INFERENCE_BATCH_SIZE = 32  # Изображений в одном батче классификатора
+INFERENCE_DECODE_WORKERS = 4  # Потоков декодирования и препроцессинга изображений
+INFERENCE_THREADS = os.cpu_count() or 2  # torch.set_num_threads для инференса на CPU
+VIDEO_QUEUE_SIZE = 64  # Кадров в очередях между стадиями потоковой разметки видео
+VIDEO_MAX_BUFFERED_FRAMES = 128  # Макс. кадров в ожидающем батче разметки видео (с неклассифицируемыми)
+MODEL_PATH = os.environ.get("MODEL_PATH", os.path.join(BASE_DIR, "best.pt"))  # Чекпойнт классификатора по умолчанию
+MODEL_CACHE_MAX_MB = 2048  # Сколько памяти могут занимать загруженные модели (LRU)
+YOLOV5_PATH = os.environ.get("YOLOV5_PATH")  # Репозиторий yolov5 — нужен, чтобы распаковать его чекпойнты
+INFERENCE_BACKEND = "eager"  # eager | torchscript | torchscript-int8 | onnx | onnx-int8-dynamic | onnx-int8-static
+ONNX_OPSET = 17  # Версия opset при экспорте в ONNX
+QUANT_CALIBRATION_IMAGES = 200  # Кадров train-сплита для калибровки статической int8-квантизации
+FRAME_SELECTION_ENABLED = False  # Загружать только кадры, в которых модель не уверена
+FRAME_SELECTION_METRIC = "margin"  # "margin" (top-1 минус top-2) или "entropy" (нормированная)
+FRAME_SELECTION_BAND = (0.0, 0.3)  # Диапазон метрики, в котором кадр считается полезным для разметки
+FRAME_SELECTION_QUOTA = 30  # Максимум загружаемых кадров с одного видео при отборе
+LABELSTUDIO_CHOICES_FROM = "choice"  # name тега Choices, если конфигурацию проекта не удалось прочитать
+LABELSTUDIO_CHOICES_TO = "image"  # toName тега Choices
+LABELSTUDIO_PREDICTION_WORKERS = 8  # Параллельность поштучной загрузки предсказаний (fallback)
+PREANNOTATE_BATCH = 256  # Задач в одной пачке предразметки (скачивание + классификация + загрузка)
+PREANNOTATE_STATE_FILE = "preannotated_tasks.json"  # Задачи, уже получившие предсказания, по версиям модели
+SCORING_OUTPUT_DIR = os.path.join(BASE_DIR, "archive_scores")  # Результаты оценки архива видео (parquet + чекпойнт)
+SCORING_WORKERS = max(1, (os.cpu_count() or 2) // 2)  # Процессов оценки архива (в каждом своя модель)
+SCORING_SAMPLE_SECONDS = 5  # Классифицировать один кадр раз в N секунд видео
+SCORING_PART_SIZE = 200  # Видео в одном parquet-файле (и шаг чекпойнта)
+SERVE_MAX_LATENCY_MS = 10  # Сколько /classify ждёт добора микробатча после первого запроса
+SERVE_QUEUE_SIZE = 1024  # Максимум ожидающих запросов классификации (дальше — 503)
+SERVE_PRELOAD_MODEL = False  # Загружать модель при старте API, а не при первом /classify
+JOBS_DIR = os.path.join(BASE_DIR, "jobs")  # Состояние фоновых задач API (<id>.json)
+JOBS_WORKERS = 2  # Сколько фоновых задач выполняется одновременно, остальные ждут в очереди
+JOBS_KEEP = 200  # Сколько последних задач держать в памяти и показывать в /jobs
+JOBS_SAVE_INTERVAL = 1.0  # Как часто сохранять прогресс задачи на диск (сек)
+JOBS_EVENTS_INTERVAL = 1.0  # Период отправки прогресса в потоке /jobs/{id}/events (сек)
+RUNS_DIR = str(Path(__file__).parent / "misc/runs")  # Рабочие папки запусков загрузки кадров: <run_id>/videos, <run_id>/frames
+VIDEO_LEASE_DIR = str(Path(__file__).parent / "misc/leases")  # Аренды видео, которые сейчас обрабатываются
+VIDEO_LEASE_TTL = 6 * 3600  # Через сколько секунд аренда упавшего запуска считается истёкшей
+LOCKS_DIR = str(Path(__file__).parent / "misc/locks")  # flock-файлы общих состояний: история загрузок, аренды, манифест
+HTTP_CONNECT_TIMEOUT = 5  # Таймаут установки соединения асинхронных клиентов (сек)
+LABELSTUDIO_ASYNC_CONCURRENCY = 32  # Одновременных запросов асинхронного клиента Label Studio
+WEBDAV_ASYNC_CONCURRENCY = 32  # Одновременных запросов асинхронного клиента WebDAV
+WEBDAV_TRANSFER_TIMEOUT = 120  # Таймаут чтения при скачивании и загрузке файлов через WebDAV (сек)
+WEBDAV_COMPRESSION = True  # Просить gzip у WebDAV: сжимает XML ответов PROPFIND на больших папках
+RESILIENCE_INITIAL_LIMIT = 8  # Стартовый лимит одновременных запросов к эндпоинту (AIMD)
+RESILIENCE_MAX_LIMIT = 64  # Потолок AIMD-лимита
+RESILIENCE_DECREASE_FACTOR = 0.5  # Во сколько раз уменьшать лимит при ошибке или замедлении
+RESILIENCE_DECREASE_COOLDOWN = 1.0  # Не уменьшать лимит чаще, чем раз в N секунд
+RESILIENCE_LATENCY_TOLERANCE = 3.0  # Запрос «медленный», если дольше базовой задержки в N раз
+RESILIENCE_LATENCY_BLIND = ("webdav:download",)  # Эндпоинты, где задержка зависит от размера файла
+RESILIENCE_EWMA_ALPHA = 0.2  # Вес нового наблюдения в EWMA задержки и доли ошибок
+RESILIENCE_FAILURE_THRESHOLD = 5  # Ошибок подряд до размыкания цепи
+RESILIENCE_ERROR_RATE_OPEN = 0.5  # Доля ошибок (EWMA), при которой цепь размыкается
+RESILIENCE_MIN_REQUESTS = 20  # Запросов до того, как доля ошибок начинает учитываться
+RESILIENCE_OPEN_SECONDS = 30  # Сколько цепь остаётся разомкнутой до пробного запроса
+RESILIENCE_MAX_BACKOFF = 30  # Максимальная пауза между повторами (сек)
@@ -0,0 +1,19 @@
+import re
+
+VIDEO_NAME = re.compile(
+    r"(?P<reg_id>[A-Z0-9]+)_(?P<year>\d{4})\.(?P<month>\d{1,2})\.(?P<day>\d{1,2}) "
+    r"(?P<start_time>\d{1,2}\.\d{1,2}\.\d{1,2})-(?P<end_time>\d{1,2}\.\d{1,2}\.\d{1,2})"
+    r"\.(?P<video_format>\w+)"
+)
+
+
+def parse_video_name(video_name: str):
+    """Парсит имя файла и возвращает (reg_id, day, base_name)."""
+    match = VIDEO_NAME.match(video_name)
+    if not match:
+        raise ValueError(f"Неверный формат имени: {video_name}")
+
+    reg_id = match.group("reg_id")
+    day = f"{match.group('year')}.{match.group('month')}.{match.group('day')}"
+    base_name = video_name.rsplit('.', 1)[0]
+    return reg_id, day, base_name
@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor
+from ls_wb_pipeline.inference import preprocess
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import settings
+import threading
+import queue
+import time
+import cv2
+
+_END = object()  # Маркер конца потока кадров
+
+
+def read_frames(video_path, frames_queue, stop):
+    """Стадия декодирования: кладёт (номер, BGR-кадр) в ограниченную очередь."""
+    cap = cv2.VideoCapture(video_path)
+    index = 0
+    try:
+        while not stop.is_set():
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames_queue.put((index, frame))
+            index += 1
+    finally:
+        cap.release()
+        frames_queue.put(_END)
+
+
+def write_frames(writer, out_queue):
+    """Стадия записи: забирает готовые кадры и пишет в VideoWriter."""
+    while True:
+        frame = out_queue.get()
+        if frame is _END:
+            break
+        writer.write(frame)
+
+
+def annotate_video(video_path, output_path, classifier, draw, sample_every=1, drop_unsampled=False,
+                   queue_size=settings.VIDEO_QUEUE_SIZE, workers=settings.INFERENCE_DECODE_WORKERS, fourcc="mp4v",
+                   max_buffered=settings.VIDEO_MAX_BUFFERED_FRAMES):
+    """
+    Однопроходный конвейер: декодирование -> батчевая классификация -> надпись -> VideoWriter,
+    без промежуточных папок с JPEG. Стадии связаны очередями ограниченного размера,
+    поэтому память не растёт с длиной записи.
+
+    :param classifier: inference.BatchClassifier.
+    :param draw: draw(frame, label, confidence) -> BGR-кадр для записи.
+    :param sample_every: Классифицировать каждый N-й кадр; остальные получают последнюю метку.
+    :param drop_unsampled: Писать в выходное видео только классифицированные кадры (fps делится на N).
+    :param max_buffered: Сколько полных кадров может ждать классификации батча. Неклассифицируемые кадры
+                         нельзя записать раньше предыдущего классифицируемого, поэтому при sample_every > 1
+                         батч сбрасывается досрочно, не дожидаясь batch_size классифицируемых кадров.
+    """
+    sample_every = max(1, sample_every)
+    max_buffered = max(max_buffered, classifier.batch_size)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Не удалось открыть видео {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+
+    out_fps = fps / sample_every if drop_unsampled else fps
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), out_fps, size)
+    frames_queue = queue.Queue(maxsize=queue_size)
+    out_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    reader = threading.Thread(target=read_frames, args=(video_path, frames_queue, stop), daemon=True)
+    writer_thread = threading.Thread(target=write_frames, args=(writer, out_queue), daemon=True)
+
+    stats = {"frames": 0, "classified": 0, "written": 0}
+    current = (None, 0.0)  # Последняя (метка, уверенность)
+
+    def flush(batch, pool):
+        nonlocal current
+        sampled = [frame for index, frame in batch if index % sample_every == 0]
+        predictions = iter(classifier.predict(list(pool.map(preprocess, sampled)))) if sampled else iter(())
+        stats["classified"] += len(sampled)
+        for index, frame in batch:
+            if index % sample_every == 0:
+                _, label, confidence = next(predictions)
+                current = (label, confidence)
+            out_queue.put(draw(frame, *current))
+            stats["written"] += 1
+
+    start = time.perf_counter()
+    reader.start()
+    writer_thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            batch = []
+            sampled_in_batch = 0
+            while True:
+                item = frames_queue.get()
+                if item is _END:
+                    break
+                index, frame = item
+                stats["frames"] += 1
+                is_sampled = index % sample_every == 0
+                if drop_unsampled and not is_sampled:
+                    continue
+                batch.append((index, frame))
+                sampled_in_batch += is_sampled
+                if sampled_in_batch >= classifier.batch_size or len(batch) >= max_buffered:
+                    flush(batch, pool)
+                    batch, sampled_in_batch = [], 0
+            if batch:
+                flush(batch, pool)
+    finally:
+        stop.set()
+        # Разблокируем чтение, если оно ждёт места в очереди
+        while reader.is_alive():
+            try:
+                frames_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        out_queue.put(_END)
+        writer_thread.join()
+        writer.release()
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 2)
+    stats["fps"] = round(stats["frames"] / elapsed, 1) if elapsed else None
+    logger.info(f"[VIDEO] {video_path} -> {output_path}: {stats}")
+    return stats
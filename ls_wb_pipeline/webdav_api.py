@@ -0,0 +1,247 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs, quote
+from requests.adapters import HTTPAdapter
+from ls_wb_pipeline.logger import logger
+from ls_wb_pipeline import jobs, resilience
+from ls_wb_pipeline.settings import *
+from webdav3.client import Client
+import threading
+import requests
+import base64
+import random
+import time
+import os
+
+
+# Конфигурация WebDAV
+WEBDAV_OPTIONS = {
+    'webdav_hostname': os.environ.get("webdav_host"),
+    'webdav_login': os.environ.get("webdav_login"),
+    'webdav_password': os.environ.get("webdav_password"),
+    'disable_check': True  # Отключает кеширование
+}
+
+# Таймауты (подключение, чтение): метаданные отвечают быстро, передача файлов — дольше
+META_TIMEOUT = (HTTP_CONNECT_TIMEOUT, WEBDAV_TIMEOUT)
+TRANSFER_TIMEOUT = (HTTP_CONNECT_TIMEOUT, WEBDAV_TRANSFER_TIMEOUT)
+
+_session = None
+_client = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Общая сессия WebDAV: keep-alive пул на WEBDAV_POOL_SIZE соединений. Через неё идут
+    и прямые HTTP-запросы (в обход rclone), и все операции общего клиента webdav3.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=WEBDAV_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.auth = (WEBDAV_OPTIONS["webdav_login"], WEBDAV_OPTIONS["webdav_password"])
+            # Ответы PROPFIND на больших папках хорошо сжимаются
+            session.headers["Accept-Encoding"] = "gzip, deflate" if WEBDAV_COMPRESSION else "identity"
+            _session = session
+    return _session
+
+
+class PooledClient(Client):
+    """
+    Клиент webdav3 поверх общей сессии. Таймаут выбирается по операции: webdav3 читает
+    self.timeout внутри execute_request, а действие текущего запроса хранится по потокам.
+    """
+
+    TRANSFER_ACTIONS = ("download", "upload")
+
+    def __init__(self, options):
+        self._action = threading.local()
+        super().__init__(options)
+        self.session = get_session()
+
+    @property
+    def timeout(self):
+        return TRANSFER_TIMEOUT if getattr(self._action, "name", None) in self.TRANSFER_ACTIONS else META_TIMEOUT
+
+    @timeout.setter
+    def timeout(self, value):
+        pass  # Client.__init__ выставляет webdav_timeout — таймауты задаются настройками выше
+
+    def execute_request(self, action, path, data=None, headers_ext=None):
+        self._action.name = action
+        try:
+            return super().execute_request(action, path, data, headers_ext)
+        finally:
+            self._action.name = None
+
+
+def get_client():
+    """Общий клиент webdav3 для всех модулей — вместо Client(WEBDAV_OPTIONS) на каждый вызов."""
+    global _client
+    if _client is None:
+        client = PooledClient(WEBDAV_OPTIONS)
+        with _session_lock:
+            if _client is None:
+                _client = client
+    return _client
+
+
+def remote_url(remote_path):
+    return WEBDAV_OPTIONS["webdav_hostname"].rstrip("/") + quote(remote_path)
+
+
+def auth_header():
+    """
+    Заголовок Basic-авторизации WebDAV для клиентов вне общей сессии (FFmpeg). Учётные данные
+    передаются только заголовком: URL с ними FFmpeg печатает в сообщениях об ошибках.
+    """
+    credentials = f"{WEBDAV_OPTIONS['webdav_login'] or ''}:{WEBDAV_OPTIONS['webdav_password'] or ''}"
+    return "Authorization: Basic " + base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+
+
+def resolve_frame_path(file):
+    """
+    Приводит ссылку на кадр к паре (локальный путь в MOUNTED_PATH, путь в REMOTE_FRAME_DIR).
+
+    Понимает URL задачи Label Studio (/data/local-files/?d=...), значение параметра d=
+    (относительно LABELSTUDIO_LOCAL_FILES_ROOT), абсолютный путь в точке монтирования
+    и просто имя файла.
+
+    :raises ValueError: Ссылка не указывает на файл внутри REMOTE_FRAME_DIR (пустая, без d=,
+                        папка или выход выше через ".."). Иначе удаление по ней снесло бы всю папку кадров.
+    """
+    link = file
+    if "?" in file:
+        file = parse_qs(urlparse(file).query).get("d", [""])[0]
+    if not os.path.basename(file):
+        raise ValueError(f"Ссылка не указывает на файл кадра: {link!r}")
+    local_path = file if os.path.isabs(file) else os.path.join(LABELSTUDIO_LOCAL_FILES_ROOT, file)
+    relative_path = os.path.relpath(local_path, MOUNTED_PATH)
+    if relative_path.startswith(".."):
+        # Не лежит под точкой монтирования — считаем путь относительным к папке кадров
+        relative_path = file.lstrip("/")
+    remote_path = os.path.normpath(f"{REMOTE_FRAME_DIR}/{relative_path}")
+    if not remote_path.startswith(REMOTE_FRAME_DIR.rstrip("/") + "/"):
+        raise ValueError(f"Ссылка указывает за пределы {REMOTE_FRAME_DIR}: {link!r}")
+    return os.path.join(MOUNTED_PATH, relative_path), remote_path
+
+
+def resolve_remote_paths(files, report):
+    """
+    Пары (ссылка, путь в REMOTE_FRAME_DIR) для удаления. Ссылки, которые resolve_frame_path
+    не принимает, сразу попадают в report["failed"] — запрос по ним не отправляется.
+    """
+    resolved = []
+    for file in files:
+        try:
+            resolved.append((file, resolve_frame_path(file)[1]))
+        except ValueError as e:
+            logger.error(f"[WebDAV] Пропущено удаление: {e}")
+            report["failed"].append(file)
+    return resolved
+
+
+def server_error(response):
+    return response.status_code >= 500 or response.status_code == 429
+
+
+def retry_wait(error, attempt, delay, jitter):
+    """Пауза перед повтором: до пробного окна размыкателя или экспоненциальная."""
+    if isinstance(error, resilience.CircuitOpen):
+        return min(error.retry_after, RESILIENCE_MAX_BACKOFF) + random.uniform(0, jitter)
+    return resilience.backoff(attempt, delay, jitter)
+
+
+def delete_remote_file(remote_path, attempts=WEBDAV_RETRIES, delay=1.0, jitter=0.5):
+    """
+    Удаляет файл WebDAV DELETE-запросом.
+
+    :return: "deleted", "missing" (404) или "failed"
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            r = resilience.call("webdav:delete", lambda: get_session().delete(remote_url(remote_path), timeout=META_TIMEOUT),
+                                is_failure=server_error)
+            if r.status_code in (200, 204):
+                return "deleted"
+            if r.status_code == 404:
+                return "missing"
+            if r.status_code < 500 and r.status_code != 429:
+                logger.error(f"[WebDAV:delete {remote_path}] {r.status_code}: {r.text[:200]}")
+                return "failed"
+            error = f"{r.status_code}"
+        except (requests.RequestException, resilience.CircuitOpen) as e:
+            error = e
+        if attempt < attempts:
+            wait = retry_wait(error, attempt, delay, jitter)
+            logger.warning(f"[WebDAV:delete {remote_path}] Ошибка (попытка {attempt}/{attempts}): {error}. "
+                           f"Повтор через {wait:.1f} сек.")
+            time.sleep(wait)
+    logger.error(f"[WebDAV:delete {remote_path}] Не удалось удалить после {attempts} попыток")
+    return "failed"
+
+
+def download_remote_file(remote_path, local_path, attempts=WEBDAV_RETRIES, delay=1.0, jitter=0.5):
+    """
+    Скачивает файл GET-запросом во временный файл и атомарно переименовывает в local_path.
+
+    :return: "downloaded", "missing" (404) или "failed"
+    """
+    temp_path = local_path + ".part"
+    for attempt in range(1, attempts + 1):
+        try:
+            response = resilience.call(
+                "webdav:get", lambda: get_session().get(remote_url(remote_path), stream=True, timeout=TRANSFER_TIMEOUT),
+                is_failure=server_error)
+            with response as r:
+                if r.status_code == 404:
+                    return "missing"
+                if r.status_code == 200:
+                    with open(temp_path, "wb") as f:
+                        for chunk in r.iter_content(chunk_size=64 * 1024):
+                            f.write(chunk)
+                    os.replace(temp_path, local_path)
+                    return "downloaded"
+                if r.status_code < 500 and r.status_code != 429:
+                    logger.error(f"[WebDAV:get {remote_path}] {r.status_code}: {r.text[:200]}")
+                    return "failed"
+                error = f"{r.status_code}"
+        except (requests.RequestException, resilience.CircuitOpen, OSError) as e:
+            error = e
+        if attempt < attempts:
+            wait = retry_wait(error, attempt, delay, jitter)
+            logger.warning(f"[WebDAV:get {remote_path}] Ошибка (попытка {attempt}/{attempts}): {error}. "
+                           f"Повтор через {wait:.1f} сек.")
+            time.sleep(wait)
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    logger.error(f"[WebDAV:get {remote_path}] Не удалось скачать после {attempts} попыток")
+    return "failed"
+
+
+def delete_remote_files(files, dry_run=False, workers=WEBDAV_DELETE_WORKERS):
+    """
+    Параллельно удаляет кадры напрямую через WebDAV.
+
+    :param files: Ссылки на кадры в любом виде, который понимает resolve_frame_path.
+    :return: Отчёт {"deleted": [...], "deleted_amount": n, "missing": [...], "failed": [...]}
+    """
+    report = {"deleted": [], "deleted_amount": 0, "missing": [], "failed": []}
+    resolved = resolve_remote_paths(files, report)
+    if dry_run:
+        for file, remote_path in resolved:
+            logger.info(f"[DRY RUN] Будет удалено: {remote_path}")
+        return report
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        statuses = pool.map(lambda item: delete_remote_file(item[1]), resolved)
+        for (file, _), status in zip(resolved, statuses):
+            report[status].append(file)
+            jobs.progress(files=1)
+    report["deleted_amount"] = len(report["deleted"])
+    logger.info(f"[WebDAV] Удалено: {report['deleted_amount']}, не найдено: {len(report['missing'])}, "
+                f"ошибок: {len(report['failed'])}")
+    return report
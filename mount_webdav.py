@@ -1,4 +1,5 @@
-from ls_wb_pipeline.functions import remount_webdav, sync_label_studio_storage
+from ls_wb_pipeline.functions import remount_webdav, sync_label_studio_storage, import_uploaded_frames
+from ls_wb_pipeline.settings import LABELSTUDIO_DIRECT_IMPORT
 import time
 
 
@@ -8,5 +9,9 @@ if __name__ == "__main__":
     parser.add_argument("--from-systemd", action="store_true", help="Не использовать --daemon")
     args = parser.parse_args()
     remount_webdav(from_systemd=args.from_systemd)
-    sync_label_studio_storage()
+    if LABELSTUDIO_DIRECT_IMPORT:
+        # Задачи, созданные импортом, не связаны с хранилищем — синк создал бы дубли
+        import_uploaded_frames()
+    else:
+        sync_label_studio_storage()
     time.sleep(36000)
\ No newline at end of file
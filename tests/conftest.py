@@ -0,0 +1,4 @@
+import os
+
+# functions создаёт общий клиент WebDAV при импорте — нужен адрес сервера (запросов тесты не делают)
+os.environ.setdefault("webdav_host", "http://webdav.invalid")
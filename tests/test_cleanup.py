@@ -0,0 +1,60 @@
+from ls_wb_pipeline import functions, labelstudio_api
+from ls_wb_pipeline.fastapi_app import services
+import asyncio
+import pytest
+
+TASKS = [
+    {"id": 1, "data": {"image": "/data/local-files/?d=webdav_frames/a.jpg"}, "annotations": [{"id": 1}]},
+    {"id": 2, "data": {"image": "/data/local-files/?d=webdav_frames/b.jpg"}, "annotations": []},
+    {"id": 3, "data": {"image": "/data/local-files/?d=webdav_frames/c.jpg"}, "annotations": []},
+    {"id": 4, "data": {"image": "/data/upload/1/"}, "annotations": []},
+]
+
+
+def bulk_report(task_ids):
+    return {"deleted": list(task_ids), "failed": [], "chunks": [{"chunk": 1, "size": len(task_ids),
+                                                                  "deleted": len(task_ids), "failed": 0,
+                                                                  "method": "bulk"}]}
+
+
+def files_report(files):
+    return {"deleted": list(files), "deleted_amount": len(files), "missing": [], "failed": []}
+
+
+class FakeLS:
+    async def get_all_tasks(self):
+        return TASKS
+
+    async def bulk_delete_tasks(self, task_ids):
+        return bulk_report(task_ids)
+
+
+class FakeDAV:
+    async def delete_files(self, files, dry_run=False):
+        return files_report([]) if dry_run else files_report(files)
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    from ls_wb_pipeline import async_api
+    monkeypatch.setattr(labelstudio_api, "bulk_delete_tasks", bulk_report)
+    monkeypatch.setattr(functions, "delete_files", lambda files, dry_run=False:
+                        files_report([]) if dry_run else files_report(files))
+    monkeypatch.setattr(functions, "get_all_tasks", lambda: TASKS)
+    monkeypatch.setattr(async_api, "get_clients", lambda: (FakeLS(), FakeDAV()))
+
+
+@pytest.mark.parametrize("dry_run", [False, True])
+@pytest.mark.parametrize("save_annotated", [True, False])
+def test_sync_and_async_cleanup_reports_match(fakes, dry_run, save_annotated):
+    sync = services.delete_frames_service(dry_run=dry_run, save_annotated=save_annotated)
+    async_ = asyncio.run(services.delete_frames_async(dry_run=dry_run, save_annotated=save_annotated))
+    assert sync == async_
+
+
+def test_cleanup_report_counts(fakes):
+    report = services.delete_frames_service(dry_run=False, save_annotated=True)["result"]
+    assert report["tasks"]["deleted"] == 3  # Задача без d= удаляется, её «кадр» — нет
+    assert report["saved"] == 1
+    assert report["files"]["deleted"] == ["webdav_frames/b.jpg", "webdav_frames/c.jpg"]
+    assert report["files"]["saved_amount"] == 1
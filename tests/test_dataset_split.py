@@ -0,0 +1,42 @@
+from ls_wb_pipeline.dataset_split import SplitAssigner, source_key
+
+
+def frames(video, count, start=0):
+    return [f"A1_2024.1.1 {video}.0.0-{video}.5.0_{i:06d}.jpg" for i in range(start, start + count)]
+
+
+def build(assigner, videos):
+    items = [(name, class_name) for class_name, video, count in videos for name in frames(video, count)]
+    assigner.prepare(items)
+    return {name: assigner.assign(name, class_name) for name, class_name in items}
+
+
+def test_source_key_groups_frames_of_one_video():
+    assert source_key("A1_2024.1.1 10.0.0-10.5.0_000001.jpg") == "A1_2024.1.1 10.0.0-10.5.0"
+
+
+def test_video_frames_share_split():
+    splits = build(SplitAssigner(0.8, 0.1, 0.1), [("cat", 10, 5), ("dog", 11, 7)])
+    for video in (10, 11):
+        assert len({splits[name] for name in frames(video, 5)}) == 1
+
+
+def test_each_class_is_stratified():
+    videos = [("cat", v, 10) for v in range(20)] + [("dog", v, 10) for v in range(20, 30)]
+    assigner = SplitAssigner(0.8, 0.1, 0.1)
+    build(assigner, videos)
+    stats = assigner.stats()
+    assert {split: stats["cat"][split]["count"] for split in stats["cat"]} == {"train": 160, "val": 20, "test": 20}
+    assert {split: stats["dog"][split]["count"] for split in stats["dog"]} == {"train": 80, "val": 10, "test": 10}
+    assert assigner.check_drift(min_images=1) == []
+
+
+def test_assignment_is_deterministic():
+    videos = [("cat", v, 3) for v in range(15)]
+    assert build(SplitAssigner(0.7, 0.2, 0.1), videos) == build(SplitAssigner(0.7, 0.2, 0.1), videos)
+
+
+def test_existing_groups_keep_their_split():
+    existing = [{"image": name, "split": "test", "class_name": "cat", "class_id": 0} for name in frames(10, 3)]
+    assigner = SplitAssigner(0.8, 0.1, 0.1, existing_rows=existing)
+    assert assigner.assign(frames(10, 1, start=3)[0], "cat") == "test"
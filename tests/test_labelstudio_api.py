@@ -0,0 +1,111 @@
+from ls_wb_pipeline import labelstudio_api
+import pytest
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self.payload = payload or {}
+        self.text = str(self.payload)
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise labelstudio_api.requests.HTTPError(self.status_code)
+
+
+class FakeLabelStudio:
+    """
+    Подмена сессии Label Studio: bulk-эндпоинт удаляет не больше bulk_limit задач пачки
+    (или отвечает bulk_status), поштучное удаление знает только задачи из tasks.
+    """
+
+    def __init__(self, tasks, bulk_status=200, bulk_limit=None):
+        self.tasks = set(tasks)
+        self.bulk_status = bulk_status
+        self.bulk_limit = bulk_limit
+        self.bulk_calls = 0
+        self.single_calls = []
+
+    def post(self, url, params=None, json=None, timeout=None):
+        assert url.endswith("/dm/actions") and params["id"] == "delete_tasks"
+        self.bulk_calls += 1
+        if self.bulk_status != 200:
+            return FakeResponse(self.bulk_status)
+        included = json["selectedItems"]["included"][:self.bulk_limit]
+        self.tasks -= set(included)
+        return FakeResponse(200, {"processed_items": len(included)})
+
+    def delete(self, url, timeout=None):
+        task_id = int(url.rstrip("/").rsplit("/", 1)[-1])
+        self.single_calls.append(task_id)
+        if task_id not in self.tasks:
+            return FakeResponse(404)
+        self.tasks.remove(task_id)
+        return FakeResponse(204)
+
+
+@pytest.fixture
+def fake_ls(monkeypatch):
+    def install(**kwargs):
+        server = FakeLabelStudio(**kwargs)
+        monkeypatch.setattr(labelstudio_api, "get_session", lambda: server)
+        return server
+    return install
+
+
+def test_bulk_success(fake_ls):
+    server = fake_ls(tasks=range(10))
+    report = labelstudio_api.bulk_delete_tasks(list(range(10)), chunk_size=4)
+
+    assert report["deleted"] == list(range(10))
+    assert report["failed"] == []
+    assert [c["method"] for c in report["chunks"]] == ["bulk", "bulk", "bulk"]
+    assert [(c["size"], c["deleted"]) for c in report["chunks"]] == [(4, 4), (4, 4), (2, 2)]
+    assert server.single_calls == []
+    assert not server.tasks
+
+
+def test_partial_bulk_falls_back_to_single(fake_ls):
+    server = fake_ls(tasks=range(6), bulk_limit=2)
+    report = labelstudio_api.bulk_delete_tasks(list(range(6)), chunk_size=3)
+
+    assert sorted(report["deleted"]) == list(range(6))
+    assert [c["method"] for c in report["chunks"]] == ["bulk+single", "bulk+single"]
+    assert [c["deleted"] for c in report["chunks"]] == [3, 3]
+    assert server.bulk_calls == 2  # Bulk пробуется для каждой пачки
+    assert not server.tasks
+
+
+@pytest.mark.parametrize("status", [404, 405, 501])
+def test_unavailable_bulk_switches_to_single(fake_ls, status):
+    server = fake_ls(tasks=range(5), bulk_status=status)
+    report = labelstudio_api.bulk_delete_tasks(list(range(5)), chunk_size=2)
+
+    assert sorted(report["deleted"]) == list(range(5))
+    assert [c["method"] for c in report["chunks"]] == ["single", "single", "single"]
+    assert server.bulk_calls == 1  # После первого отказа bulk больше не вызывается
+    assert sorted(server.single_calls) == list(range(5))
+
+
+def test_single_404_counts_as_deleted(fake_ls):
+    server = fake_ls(tasks=[1, 2], bulk_status=405)
+    report = labelstudio_api.bulk_delete_tasks([1, 2, 3], chunk_size=10)
+
+    assert sorted(report["deleted"]) == [1, 2, 3]
+    assert report["failed"] == []
+    assert report["chunks"] == [{"chunk": 1, "size": 3, "deleted": 3, "failed": 0, "method": "single"}]
+
+
+def test_single_error_is_reported_as_failed(fake_ls, monkeypatch):
+    server = fake_ls(tasks=[1, 2], bulk_status=501)
+    delete = server.delete
+    monkeypatch.setattr(server, "delete", lambda url, timeout=None:
+                        FakeResponse(500) if url.endswith("/2") else delete(url, timeout))
+    report = labelstudio_api.bulk_delete_tasks([1, 2], chunk_size=10)
+
+    assert report["deleted"] == [1]
+    assert report["failed"] == [2]
+    assert report["chunks"][0]["failed"] == 1
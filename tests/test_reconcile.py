@@ -0,0 +1,61 @@
+from ls_wb_pipeline import reconcile
+
+
+def task(task_id, frame, annotated=False):
+    image = f"/data/local-files/?d=webdav_frames/{frame}" if frame is not None else "/data/upload/1/"
+    return {"id": task_id, "data": {"image": image}, "annotations": [{"id": 1}] if annotated else []}
+
+
+def test_compute_drift_buckets():
+    tasks = [task(1, "a.jpg"), task(2, "gone.jpg"), task(3, "a.jpg"), task(4, None), task(5, "new.jpg")]
+    drift = reconcile.compute_drift(tasks, remote_frames=["a.jpg", "orphan.jpg", "pending.jpg"],
+                                    dataset_images={}, pending_frames=["pending.jpg"], recent_frames=["new.jpg"])
+
+    assert drift["frames_without_tasks"] == ["orphan.jpg"]
+    assert drift["tasks_without_frames"] == [2]  # Задача 5 ссылается на только что загруженный кадр
+    assert drift["duplicate_tasks"] == [3]
+    assert drift["unresolvable_tasks"] == [4]
+
+
+def test_load_sides_lists_tasks_last(monkeypatch):
+    calls = []
+    monkeypatch.setattr(reconcile.functions, "pending_upload_frames", lambda: calls.append("manifest") or [])
+    monkeypatch.setattr(reconcile, "list_remote_frames", lambda: calls.append("frames") or ([], []))
+    monkeypatch.setattr(reconcile, "list_dataset_images", lambda path: calls.append("dataset") or {})
+    monkeypatch.setattr(reconcile.functions, "get_all_tasks", lambda strict: calls.append("tasks") or [])
+
+    sides = reconcile.load_sides()
+    assert calls == ["manifest", "frames", "dataset", "tasks"]
+    assert sides["remote_frames"] == [] and sides["recent_frames"] == []
+
+
+def test_reconcile_aborts_on_partial_listing(monkeypatch):
+    monkeypatch.setattr(reconcile.functions, "pending_upload_frames", lambda: [])
+    monkeypatch.setattr(reconcile, "list_remote_frames", lambda: (["a.jpg"], []))
+    monkeypatch.setattr(reconcile, "list_dataset_images", lambda path: {})
+    monkeypatch.setattr(reconcile.functions, "get_all_tasks", lambda strict: None)
+
+    report = reconcile.reconcile(dry_run=False, orphan_frames="delete")
+    assert report["side"] == "tasks" and "error" in report
+
+
+def test_list_remote_frames_separates_recent(monkeypatch):
+    from email.utils import formatdate
+    import time
+
+    now = time.time()
+    items = [{"path": "/Tracker/annotation_frames/", "isdir": True, "modified": None},
+             {"path": "/Tracker/annotation_frames/old.jpg", "isdir": False, "modified": formatdate(now - 3600)},
+             {"path": "/Tracker/annotation_frames/new.jpg", "isdir": False, "modified": formatdate(now - 10)},
+             {"path": "/Tracker/annotation_frames/nodate.jpg", "isdir": False, "modified": None},
+             {"path": "/Tracker/annotation_frames/notes.txt", "isdir": False, "modified": formatdate(now - 3600)}]
+    monkeypatch.setattr(reconcile.functions.client, "list", lambda path, get_info=False: items)
+
+    assert reconcile.list_remote_frames(grace=600) == (["old.jpg", "nodate.jpg"], ["new.jpg"])
+
+
+def test_list_dataset_images_does_not_create_dataset(tmp_path):
+    dataset_path = tmp_path / "dataset"
+
+    assert reconcile.list_dataset_images(str(dataset_path)) == {}
+    assert not dataset_path.exists()
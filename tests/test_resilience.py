@@ -0,0 +1,80 @@
+from ls_wb_pipeline import resilience, settings
+import threading
+import asyncio
+import pytest
+import time
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    monkeypatch.setattr(settings, "RESILIENCE_OPEN_SECONDS", 0.1)
+    return resilience.Endpoint("test")
+
+
+def trip(endpoint):
+    for _ in range(settings.RESILIENCE_FAILURE_THRESHOLD):
+        endpoint.release(endpoint.acquire(), 0.01, False)
+    assert endpoint.state == "open"
+    time.sleep(0.15)
+
+
+def test_half_open_admits_single_probe_and_ignores_stale_results(endpoint):
+    stale = endpoint.acquire()
+    trip(endpoint)
+    probe = endpoint.acquire()
+    assert endpoint.state == "half-open" and probe is endpoint.probe
+
+    second = []
+    waiter = threading.Thread(target=lambda: second.append(endpoint.acquire()), daemon=True)
+    waiter.start()
+    waiter.join(0.2)
+    assert not second  # Вторая проба не проходит
+
+    endpoint.release(stale, 0.01, True)  # Ответ на запрос до размыкания не замыкает цепь
+    assert endpoint.state == "half-open"
+    endpoint.release(probe, 0.01, True)
+    assert endpoint.state == "closed"
+    waiter.join(2)
+    assert second
+
+
+def test_failed_probe_reopens(endpoint):
+    trip(endpoint)
+    endpoint.release(endpoint.acquire(), 0.01, False)
+    assert endpoint.state == "open" and endpoint.probe is None
+
+
+def test_error_rate_window_restarts_after_close(endpoint, monkeypatch):
+    monkeypatch.setattr(settings, "RESILIENCE_FAILURE_THRESHOLD", 1000)
+    for _ in range(settings.RESILIENCE_MIN_REQUESTS):
+        endpoint.release(endpoint.acquire(), 0.01, True)
+    endpoint.close()
+    # Первые ошибки после замыкания не размыкают цепь по доле ошибок: окно начинается заново
+    for _ in range(3):
+        endpoint.release(endpoint.acquire(), 0.01, False)
+    assert endpoint.state == "closed"
+
+
+def test_cancelled_call_async_returns_probe(endpoint, monkeypatch):
+    trip(endpoint)
+    monkeypatch.setitem(resilience._endpoints, "test", endpoint)
+    slow_acquire = endpoint.acquire
+
+    def acquire():
+        time.sleep(0.1)
+        return slow_acquire()
+
+    monkeypatch.setattr(endpoint, "acquire", acquire)
+
+    async def run():
+        task = asyncio.ensure_future(resilience.call_async("test", asyncio.sleep))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.2)  # Поток успевает взять пробу — и сразу её возвращает
+
+    asyncio.run(run())
+    assert endpoint.in_flight == 0 and endpoint.probe is None
+    monkeypatch.setattr(endpoint, "acquire", slow_acquire)
+    assert endpoint.acquire() is endpoint.probe  # Следующий запрос снова может стать пробой
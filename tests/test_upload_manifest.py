@@ -0,0 +1,76 @@
+from ls_wb_pipeline import functions, labelstudio_api
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(functions, "UPLOAD_MANIFEST_FILE", str(tmp_path / "uploaded_frames.jsonl"))
+    monkeypatch.setattr(functions, "LOCKS_DIR", str(tmp_path / "locks"))
+
+
+def fake_import(monkeypatch, fail=(), during=None):
+    imported = []
+
+    def import_tasks(tasks):
+        if during:
+            during()
+        ok = [task for task in tasks if not any(name in task["data"]["image"] for name in fail)]
+        imported.extend(ok)
+        return {"imported": len(ok), "failed": [task for task in tasks if task not in ok]}
+
+    monkeypatch.setattr(labelstudio_api, "import_tasks", import_tasks)
+    return imported
+
+
+def test_import_does_not_hold_manifest_lock(monkeypatch):
+    functions.record_uploaded_frame("a.jpg", "v.mp4")
+    seen = []
+
+    def during():
+        # Из того же потока: при удержании блокировки манифеста здесь была бы взаимоблокировка
+        functions.record_uploaded_frame("b.jpg", "v.mp4")
+        seen.extend(functions.pending_upload_frames())
+
+    fake_import(monkeypatch, during=during)
+    report = functions.import_uploaded_frames()
+
+    assert report == {"imported": 1, "already_imported": 0, "pending": 0}
+    assert sorted(seen) == ["a.jpg", "b.jpg"]  # Кадр в процессе импорта тоже считается ожидающим
+    assert [entry["frame"] for entry in functions.read_upload_manifest()] == ["b.jpg"]
+    assert functions.importing_manifests() == []
+
+
+def test_failed_batch_is_checked_against_ls_before_retry(monkeypatch):
+    functions.record_uploaded_frame("a.jpg", "v.mp4")
+    functions.record_uploaded_frame("b.jpg", "v.mp4")
+    fake_import(monkeypatch, fail=("a.jpg", "b.jpg"))
+    assert functions.import_uploaded_frames()["pending"] == 2
+
+    # Пачка «упала» по таймауту, но LS успел сохранить a.jpg
+    monkeypatch.setattr(functions, "get_all_tasks", lambda strict: [labelstudio_api.frame_task("a.jpg")])
+    imported = fake_import(monkeypatch)
+    report = functions.import_uploaded_frames()
+
+    assert report == {"imported": 1, "already_imported": 1, "pending": 0}
+    assert [task["data"]["image"] for task in imported] == [labelstudio_api.frame_task("b.jpg")["data"]["image"]]
+
+
+def test_retry_is_postponed_when_ls_listing_fails(monkeypatch):
+    functions.write_upload_manifest([{"frame": "a.jpg", "retry": True}, {"frame": "c.jpg"}])
+    monkeypatch.setattr(functions, "get_all_tasks", lambda strict: None)
+    imported = fake_import(monkeypatch)
+    report = functions.import_uploaded_frames()
+
+    assert report["imported"] == 1 and report["pending"] == 1
+    assert len(imported) == 1 and "c.jpg" in imported[0]["data"]["image"]
+    assert [entry["frame"] for entry in functions.read_upload_manifest()] == ["a.jpg"]
+
+
+def test_crashed_import_is_adopted(monkeypatch):
+    functions.write_upload_manifest([{"frame": "a.jpg"}], functions.UPLOAD_MANIFEST_FILE + ".dead.importing")
+    monkeypatch.setattr(functions, "get_all_tasks", lambda strict: [])
+    imported = fake_import(monkeypatch)
+
+    assert functions.import_uploaded_frames()["imported"] == 1
+    assert len(imported) == 1
+    assert functions.importing_manifests() == []
@@ -0,0 +1,30 @@
+from ls_wb_pipeline import functions
+import pytest
+import time
+
+
+@pytest.fixture(autouse=True)
+def state_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(functions, "VIDEO_LEASE_DIR", str(tmp_path / "leases"))
+    monkeypatch.setattr(functions, "LOCKS_DIR", str(tmp_path / "locks"))
+    monkeypatch.setattr(functions, "DOWNLOAD_HISTORY_FILE", str(tmp_path / "history.json"))
+
+
+def test_claimed_video_is_not_given_to_another_run():
+    assert functions.claim_video("v.mp4", "run1")
+    assert not functions.claim_video("v.mp4", "run2")
+    functions.release_video("v.mp4", "run1")
+    assert functions.claim_video("v.mp4", "run2")
+
+
+def test_lease_is_refreshed_while_kept():
+    assert functions.claim_video("v.mp4", "run1", ttl=0.3)
+    with functions.keep_video_lease("v.mp4", "run1", ttl=0.3):
+        time.sleep(0.6)  # Дольше ttl: без продления аренда бы истекла
+        assert not functions.claim_video("v.mp4", "run2")
+    assert functions.claim_video("v.mp4", "run2")
+
+
+def test_refresh_does_not_steal_foreign_lease():
+    assert functions.claim_video("v.mp4", "run1")
+    assert not functions.refresh_video("v.mp4", "run2")
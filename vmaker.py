@@ -1,22 +1,16 @@
-import torch
-import torchvision.transforms as T
+from ls_wb_pipeline.inference import BatchClassifier, TRANSFORM, list_images
+from ls_wb_pipeline.video_pipeline import annotate_video
+from ls_wb_pipeline.model_registry import get_model
+from ls_wb_pipeline import settings
+import numpy as np
+import argparse
 from PIL import Image
 import cv2
 import os
 from tqdm import tqdm
-import cv2
-import os
-import sys
-from torch.serialization import safe_globals
 from PIL import ImageDraw, ImageFont
 
 
-sys.path.append("/Users/artur/PycharmProjects/yolov5")
-
-from models.yolo import ClassificationModel  # если у тебя есть yolov5
-
-
-
 def video_to_frames(video_path, output_dir):
     os.makedirs(output_dir, exist_ok=True)
     cap = cv2.VideoCapture(video_path)
@@ -30,61 +24,32 @@ def video_to_frames(video_path, output_dir):
     cap.release()
     print(f"✅ {i} кадров сохранено")
 
-# Модель
-ckpt = torch.load("best.pt", map_location="cpu", weights_only=False)
-model = ckpt["model"].float().eval()
-model.names = [
-    "лодка опрокинута",
-    "евроконтейнер опрокинут",
-    "лодка захвачена",
-    "евроконтейнер захвачен",
-    "свободно",
-]
-
-# Классы
-class_names = [
-    "лодка опрокинута",
-    "евроконтейнер опрокинут",
-    "лодка захвачена",
-    "евроконтейнер захвачен",
-    "свободно",
-]
-
 # Преобразование
-transform = T.Compose([
-    T.Resize((224, 224)),
-    T.ToTensor(),
-    T.Normalize([0.485, 0.456, 0.406],
-                [0.229, 0.224, 0.225])
-])
+transform = TRANSFORM
 
 
-def classify_and_draw(input_dir, output_dir):
+def classify_and_draw(input_dir, output_dir, batch_size=settings.INFERENCE_BATCH_SIZE,
+                      workers=settings.INFERENCE_DECODE_WORKERS, model_path=None, backend=None):
     os.makedirs(output_dir, exist_ok=True)
-    frame_files = sorted(f for f in os.listdir(input_dir) if f.endswith(".jpg"))
+    frame_files = list_images(input_dir)
+    loaded = get_model(model_path, backend)  # Модель и классы (labels.txt) — из реестра, загрузка при первом вызове
+    classifier = BatchClassifier(loaded.model, loaded.class_names, batch_size=batch_size)
 
     font = ImageFont.truetype("/System/Library/Fonts/Supplemental/Arial.ttf", 32)  # под Mac
 
-    for file in tqdm(frame_files):
-        img_path = os.path.join(input_dir, file)
-        img = Image.open(img_path).convert("RGB")
-        tensor = transform(img).unsqueeze(0)
-
-        with torch.no_grad():
-            preds = model(tensor)
-            class_id = preds.argmax(1).item()
-            label = class_names[class_id]
+    # Кадр декодируется один раз: тот же массив идёт и в модель, и под надпись
+    for img_path, frame, class_id, label, _ in tqdm(classifier.classify_files(frame_files, workers=workers),
+                                                    total=len(frame_files)):
+        img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
 
         # Рисуем текст на изображении через PIL
         draw = ImageDraw.Draw(img)
         draw.text((400, 30), label, font=font, fill=(255, 0, 0))
 
-        img.save(os.path.join(output_dir, file))
+        img.save(os.path.join(output_dir, os.path.basename(img_path)))
 
     print("✅ Все кадры обработаны")
 
-# Использование
-
 def frames_to_video(input_dir, output_video_path, fps=25):
     frame_files = sorted(f for f in os.listdir(input_dir) if f.endswith(".jpg"))
     sample = cv2.imread(os.path.join(input_dir, frame_files[0]))
@@ -98,8 +63,45 @@ def frames_to_video(input_dir, output_video_path, fps=25):
     out.release()
     print(f"🎞 Видео сохранено: {output_video_path}")
 
-# Использование
 
-video_to_frames("test.mp4", "frames")
-classify_and_draw("frames", "frames_labeled")
-frames_to_video("frames_labeled", "result_video.mp4", fps=5)
\ No newline at end of file
+def stream_classify_video(video_path, output_video_path, batch_size=settings.INFERENCE_BATCH_SIZE,
+                          sample_every=1, drop_unsampled=False, model_path=None, backend=None):
+    """Видео -> классификатор -> размеченное видео за один проход, без папок с кадрами."""
+    loaded = get_model(model_path, backend)
+    classifier = BatchClassifier(loaded.model, loaded.class_names, batch_size=batch_size)
+    font = ImageFont.truetype("/System/Library/Fonts/Supplemental/Arial.ttf", 32)  # под Mac
+
+    def draw_label(frame, label, confidence):
+        # cv2.putText не умеет кириллицу — рисуем через PIL
+        img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        ImageDraw.Draw(img).text((400, 30), label, font=font, fill=(255, 0, 0))
+        return cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+
+    stats = annotate_video(video_path, output_video_path, classifier, draw_label,
+                           sample_every=sample_every, drop_unsampled=drop_unsampled)
+    print(f"🎞 Видео сохранено: {output_video_path} ({stats['frames']} кадров, {stats['fps']} кадр/сек)")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Разметка видео классификатором")
+    parser.add_argument("--model", default=settings.MODEL_PATH, help="Чекпойнт классификатора")
+    parser.add_argument("--backend", default=settings.INFERENCE_BACKEND, help="Бэкенд инференса (см. model_export)")
+    parser.add_argument("--video", default="test.mp4")
+    parser.add_argument("--output", default="result_video.mp4")
+    parser.add_argument("--fps", type=float, default=5, help="fps результата в режиме через папки")
+    parser.add_argument("--stream", action="store_true", help="Потоковый режим без промежуточных папок")
+    parser.add_argument("--batch-size", type=int, default=settings.INFERENCE_BATCH_SIZE)
+    parser.add_argument("--sample-every", type=int, default=1, help="Классифицировать каждый N-й кадр")
+    parser.add_argument("--drop-unsampled", action="store_true", help="Писать только классифицированные кадры")
+    args = parser.parse_args()
+
+    if args.stream:
+        stream_classify_video(args.video, args.output, batch_size=args.batch_size,
+                              sample_every=args.sample_every, drop_unsampled=args.drop_unsampled,
+                              model_path=args.model, backend=args.backend)
+    else:
+        video_to_frames(args.video, "frames")
+        classify_and_draw("frames", "frames_labeled", batch_size=args.batch_size, model_path=args.model,
+                          backend=args.backend)
+        frames_to_video("frames_labeled", args.output, fps=args.fps)